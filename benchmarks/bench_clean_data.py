@@ -0,0 +1,105 @@
+"""
+Benchmark of the conversion of dates done when reading the data file.
+
+Compares the old row-wise implementation (`DataFrame.apply` with `axis=1`) with
+the vectorized one in `covid19.scrap._clean_data`, using a synthetic sheet with
+the same shape as the one provided by the ministry of health.
+
+Run with
+
+    python benchmarks/bench_clean_data.py --rows 1000000
+"""
+import argparse
+import warnings
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from covid19.scrap import _clean_data
+
+
+def _legacy_clean_data(data: pd.DataFrame):
+    """The row-wise implementation previously in `read_datafile_from_disc`"""
+    def _conv_date(x):
+        try:
+            return x.data.date()
+        except TypeError:
+            return None
+
+    data["data"] = data.apply(_conv_date, axis=1)
+    data = data[~data.data.isna()]
+    weekDays = ("Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado",
+                "Domingo")
+    with warnings.catch_warnings():
+        # The old code assigned a column in a slice of the DataFrame
+        warnings.simplefilter("ignore")
+        data["diaDaSemana"] = data.apply(
+            lambda x: weekDays[x.data.weekday()], axis=1)
+    return data
+
+
+def make_raw_sheet(num_rows, num_empty_rows=100, seed=0):
+    """
+    Create a sheet similar to what `pd.read_excel` returns for the data file.
+
+    Parameters
+    ----------
+    num_rows : int
+        Number of rows with data
+    num_empty_rows : int
+        Number of empty rows (without a date) appended to the sheet
+    seed : int
+        Seed of the random number generator
+
+    Returns
+    -------
+    pd.DataFrame
+        The synthetic sheet.
+    """
+    rng = np.random.default_rng(seed)
+    num_days = 300
+    dates = pd.date_range("2020-02-25", periods=num_days)
+    data = pd.DataFrame({
+        "regiao": "Nordeste",
+        "estado": "CE",
+        "municipio": "Fortaleza",
+        "coduf": 23,
+        "codmun": 230440.0,
+        "data": dates[np.arange(num_rows) % num_days],
+        "casosAcumulado": rng.integers(0, 100000, num_rows),
+        "obitosAcumulado": rng.integers(0, 1000, num_rows),
+    })
+    empty = pd.DataFrame(index=range(num_rows, num_rows + num_empty_rows),
+                         columns=data.columns)
+    empty["data"] = pd.NaT
+    return pd.concat([data, empty])
+
+
+def _time(func, raw):
+    data = raw.copy()
+    start = perf_counter()
+    result = func(data)
+    return perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    raw = make_raw_sheet(args.rows)
+    print(f"Synthetic sheet with {raw.shape[0]} rows")
+
+    vectorized_time, vectorized = _time(_clean_data, raw)
+    print(f"vectorized: {vectorized_time:8.3f} s")
+    legacy_time, legacy = _time(_legacy_clean_data, raw)
+    print(f"row-wise:   {legacy_time:8.3f} s")
+    print(f"speedup:    {legacy_time / vectorized_time:8.1f}x")
+
+    assert (legacy.data == vectorized.data).all()
+    assert (legacy.diaDaSemana == vectorized.diaDaSemana.astype(str)).all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Benchmarks of the covid19 pipeline with synthetic data at several scales.
+
+The data is created with `covid19.synthetic`, so no download is needed. These
+benchmarks use the `benchmark` fixture of pytest-benchmark and are not
+collected with the tests. Run them with
+
+    pip install pytest-benchmark
+    pytest benchmarks/bench_pipeline.py
+
+Save a run with `--benchmark-autosave` and compare it with a later one with
+`--benchmark-compare` to detect regressions. By default the "small" and
+"medium" scales are used. Set the environment variable COVID19_BENCH_SCALES
+to choose others (e.g. COVID19_BENCH_SCALES=small,medium,full).
+"""
+import os
+
+import pytest
+
+from covid19 import scrap
+from covid19.covid import (get_all_municipalities_data, get_all_states_data,
+                           get_brazil_data, get_dia_de_contaminacao_array)
+from covid19.incremental import DerivedDataStore
+from covid19.memo import frame_cache
+from covid19.schema import apply_schema
+from covid19.synthetic import make_ministry_data, write_ministry_file
+
+pytest.importorskip("pytest_benchmark")
+
+# Number of municipalities and days of each scale
+SCALES = {
+    "small": (100, 120),
+    "medium": (1000, 200),
+    "full": (5570, 300),
+}
+_scales = os.environ.get("COVID19_BENCH_SCALES", "small,medium").split(",")
+
+# Parsing a spreadsheet is very slow -> only for the small scale
+_excel_scales = [scale for scale in _scales if scale == "small"]
+
+
+@pytest.fixture(scope="module", params=_scales)
+def scale(request):
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def data(scale):
+    num_municipalities, num_days = SCALES[scale]
+    raw = make_ministry_data(num_municipalities=num_municipalities,
+                             num_days=num_days)
+    return apply_schema(scrap._clean_data(raw))
+
+
+@pytest.fixture(scope="module")
+def data_estados(data):
+    return get_all_states_data(data)
+
+
+@pytest.fixture(scope="module", params=_excel_scales)
+def excel_file(request, tmp_path_factory):
+    num_municipalities, num_days = SCALES[request.param]
+    filename = tmp_path_factory.mktemp("data") / "dados.xlsx"
+    write_ministry_file(filename,
+                        num_municipalities=num_municipalities,
+                        num_days=num_days)
+    return filename
+
+
+@pytest.fixture(scope="module")
+def csv_file(scale, tmp_path_factory):
+    num_municipalities, num_days = SCALES[scale]
+    filename = tmp_path_factory.mktemp("data") / "dados.csv"
+    write_ministry_file(filename,
+                        num_municipalities=num_municipalities,
+                        num_days=num_days)
+    return filename
+
+
+# xxxxxxxxxx Reading the data xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def test_read_datafile_from_disc(benchmark, excel_file):
+    benchmark.pedantic(scrap.read_datafile_from_disc,
+                       args=(excel_file, ),
+                       kwargs={"use_cache": False},
+                       rounds=1)
+
+
+def test_read_datafile_from_parquet_cache(benchmark, excel_file):
+    scrap.read_datafile_from_disc(excel_file)  # Creates the cache
+
+    def read():
+        frame_cache.clear()
+        return scrap.read_datafile_from_disc(excel_file)
+
+    benchmark(read)
+
+
+def test_read_datafile_from_memory_cache(benchmark, excel_file):
+    scrap.read_datafile_from_disc(excel_file)
+    benchmark(scrap.read_datafile_from_disc, excel_file)
+
+
+def test_read_csv_datafile(benchmark, csv_file):
+    benchmark(scrap.read_csv_datafile, csv_file)
+
+
+def test_clean_data(benchmark, scale):
+    num_municipalities, num_days = SCALES[scale]
+    raw = make_ministry_data(num_municipalities=num_municipalities,
+                             num_days=num_days)
+    benchmark(lambda: scrap._clean_data(raw.copy()))
+
+
+# xxxxxxxxxx Deriving the data xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def test_get_brazil_data(benchmark, data):
+    benchmark(get_brazil_data, data)
+
+
+def test_get_all_states_data(benchmark, data):
+    benchmark(get_all_states_data, data)
+
+
+def test_get_all_municipalities_data(benchmark, data):
+    benchmark(get_all_municipalities_data, data)
+
+
+def test_get_dia_de_contaminacao_array(benchmark, data_estados):
+    # As in the notebook: one call for each state
+    states = [
+        data_estados[data_estados.estado == estado]
+        for estado in data_estados.estado.unique()
+    ]
+
+    def run():
+        for state_data in states:
+            get_dia_de_contaminacao_array(state_data, 100)
+
+    benchmark(run)
+
+
+# xxxxxxxxxx Updating the derived data xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+@pytest.fixture(scope="module")
+def daily_files(data):
+    """The cleaned data of yesterday and of today (with one more day)"""
+    today = scrap._clean_levels(data.copy(deep=False))
+    yesterday = scrap._clean_levels(
+        today[(today.data < today.data.max()).to_numpy()])
+    return yesterday, today
+
+
+def _get_store(data):
+    store = DerivedDataStore()
+    store.update(data)
+    return store
+
+
+@pytest.mark.benchmark(group="derived_data_store")
+def test_derived_data_store_full_rebuild(benchmark, daily_files):
+    benchmark(_get_store, daily_files[1])
+
+
+@pytest.mark.benchmark(group="derived_data_store")
+def test_derived_data_store_incremental_update(benchmark, daily_files):
+    # Only the new day is derived (the store is derived again in each round,
+    # out of the measured time)
+    yesterday, today = daily_files
+    benchmark.pedantic(lambda store: store.update(today),
+                       setup=lambda: ((_get_store(yesterday), ), {}),
+                       rounds=5)
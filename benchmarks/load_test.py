@@ -0,0 +1,162 @@
+"""
+Load test of the query service in `covid19.server`.
+
+Opens `--concurrency` keep-alive connections which send requests one after
+the other for `--duration` seconds, and reports the requests per second and
+the latency percentiles. The requested paths are drawn at random among the
+series of Brazil, of the states and of the municipalities and the summary.
+
+By default the service is started in a background thread with synthetic data
+(see `covid19.synthetic`). Pass `--url` to test a running service instead:
+
+    python benchmarks/load_test.py --municipalities 5570 --days 300
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import warnings
+from time import perf_counter
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from covid19.schema import apply_schema
+from covid19.scrap import _clean_data, _clean_levels
+from covid19.server import Dataset, QueryService
+from covid19.synthetic import make_ministry_data
+
+
+def _start_service(num_municipalities, num_days, medias_moveis):
+    """Start a service with synthetic data in a thread and return its port"""
+    data = make_ministry_data(num_municipalities=num_municipalities,
+                              num_days=num_days)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        data = _clean_levels(apply_schema(_clean_data(data)))
+    start = perf_counter()
+    dataset = Dataset.from_data(data, medias_moveis=medias_moveis)
+    print(f"Dataset built in {perf_counter() - start:.2f} s")
+
+    service = QueryService(dataset)
+    started = threading.Event()
+    loop = asyncio.new_event_loop()
+
+    async def serve():
+        await service.start(port=0)
+        started.set()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=loop.run_until_complete,
+                     args=(serve(), ),
+                     daemon=True).start()
+    started.wait()
+    return service.port
+
+
+async def _request(reader, writer, host, path):
+    """Send a GET request and return the status and the body"""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def _get_paths(host, port, fraction_municipalities):
+    """The paths of all regions served, with the given mix of levels"""
+    reader, writer = await asyncio.open_connection(host, port)
+    regions = {}
+    for level in ("estados", "municipios"):
+        status, body = await _request(reader, writer, host, f"/{level}")
+        key = "estado" if level == "estados" else "codmun"
+        regions[level] = ([] if status != 200 else
+                          json.loads(body)["regions"][key])
+    writer.close()
+
+    def get_path():
+        if regions["municipios"] and random.random() < fraction_municipalities:
+            return f"/municipios/{random.choice(regions['municipios'])}"
+        choice = random.random()
+        if choice < 0.1 or not regions["estados"]:
+            return "/brasil"
+        if choice < 0.2:
+            return "/summary"
+        return f"/estados/{random.choice(regions['estados'])}"
+
+    return get_path
+
+
+async def _client(host, port, get_path, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while perf_counter() < deadline:
+            start = perf_counter()
+            status, _ = await _request(reader, writer, host, get_path())
+            latencies.append(perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load_test(host, port, concurrency, duration,
+                        fraction_municipalities):
+    get_path = await _get_paths(host, port, fraction_municipalities)
+    # Warm up the connection and the responses kept in memory
+    await _client(host, port, get_path, perf_counter() + 0.5, [], [])
+
+    latencies, errors = [], []
+    start = perf_counter()
+    await asyncio.gather(*(_client(host, port, get_path, start + duration,
+                                   latencies, errors)
+                           for _ in range(concurrency)))
+    elapsed = perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    print(f"{latencies.shape[0]} requests in {elapsed:.1f} s with "
+          f"{concurrency} connections ({len(errors)} errors)")
+    print(f"Requests/sec: {latencies.shape[0] / elapsed:.0f}")
+    for name, percentile in (("p50", 50), ("p90", 90), ("p99", 99)):
+        print(f"Latency {name}: {np.percentile(latencies, percentile):.2f} ms")
+    print(f"Latency max: {latencies.max():.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url",
+                        help="URL of a running service (default: start one "
+                        "with synthetic data)")
+    parser.add_argument("--municipalities", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=200)
+    parser.add_argument("--medias-moveis", action="store_true")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    parser.add_argument("--fraction-municipalities",
+                        type=float,
+                        default=0.5,
+                        help="fraction of the requests for municipalities")
+    args = parser.parse_args()
+
+    if args.url is None:
+        host = "127.0.0.1"
+        port = _start_service(args.municipalities, args.days,
+                              args.medias_moveis)
+    else:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    asyncio.run(
+        run_load_test(host, port, args.concurrency, args.duration,
+                      args.fraction_municipalities))
+
+
+if __name__ == "__main__":
+    main()
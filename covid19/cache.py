@@ -0,0 +1,369 @@
+"""
+On-disk columnar cache for the cleaned data read from the ministry file.
+
+Parsing the spreadsheet provided by the ministry of health is very slow.
+The cleaned DataFrame is then saved in a Parquet file next to the original file
+(e.g. "dados.xlsx" -> "dados.parquet") together with a small JSON file with the
+signature of the original file (size, modification time and sha256 hash) and
+the quality report of the data (see `covid19.quality.QualityReport`). The cache
+is only used if the original file did not change since it was written.
+
+Parquet support requires `pyarrow` (or `fastparquet`). If it is not installed
+the cache is simply disabled.
+
+A second JSON file (e.g. "dados.meta.json") keeps some metadata of the data
+file (most recent date and number of rows), such that checking if the file is
+current does not require reading it.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from .quality import REPORT_ATTR, QualityReport
+
+# Increase this whenever the cleaning performed when reading the data file
+# changes, such that existing cache files are not used anymore
+_CACHE_VERSION = 4
+
+
+def get_cache_filenames(filename):
+    """
+    Get the name of the cache file and of its signature file.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the original data file
+
+    Returns
+    -------
+    (Path, Path)
+        The name of the Parquet file and the name of the JSON signature file.
+    """
+    filepath = Path(filename)
+    return filepath.with_suffix(".parquet"), filepath.with_suffix(".cache.json")
+
+
+def compute_file_hash(filename, chunk_size=1 << 20):
+    """
+    Compute the sha256 hash of a file.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the file
+    chunk_size : int
+        Number of bytes read at a time
+
+    Returns
+    -------
+    str
+        The hash as an hexadecimal string.
+    """
+    file_hash = hashlib.sha256()
+    with open(filename, mode="rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_file_signature(filename, with_hash=True):
+    """
+    Get the signature of a file, used to check if it changed.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the file
+    with_hash : bool
+        If True, the sha256 hash of the file is also computed
+
+    Returns
+    -------
+    dict
+        A dictionary with the keys "size", "mtime_ns" and (if `with_hash` is
+        True) "sha256".
+    """
+    stat = os.stat(filename)
+    signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if with_hash:
+        signature["sha256"] = compute_file_hash(filename)
+    return signature
+
+
+def complete_file_signature(filename, signature):
+    """
+    Add the hash of `filename` to a signature taken before reading it.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the file
+    signature : dict
+        The signature of the file taken with `with_hash=False` (see
+        `get_file_signature`) before it was read
+
+    Returns
+    -------
+    dict | None
+        The signature with the "sha256" key, or None if the file changed (or
+        was removed) since `signature` was taken.
+    """
+    try:
+        file_hash = compute_file_hash(filename)
+        current = get_file_signature(filename, with_hash=False)
+    except FileNotFoundError:
+        return None
+    # The file did not change while it was hashed either
+    if (current["size"], current["mtime_ns"]) != (signature["size"],
+                                                  signature["mtime_ns"]):
+        return None
+    return {**current, "sha256": file_hash}
+
+
+def write_json(filename, content):
+    """
+    Write `content` to a JSON file atomically.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the file
+    content : Any
+        The content, which must be serializable to JSON
+    """
+    tmp_filename = Path(f"{filename}.tmp")
+    with open(tmp_filename, mode="w") as f:
+        json.dump(content, f)
+    os.replace(tmp_filename, filename)
+
+
+def read_json(filename):
+    """
+    Read a JSON file.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the file
+
+    Returns
+    -------
+    Any
+        The content of the file, or None if it does not exist or is invalid.
+    """
+    try:
+        with open(filename, mode="r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _is_signature_valid(filename, stored, signature_filename):
+    """
+    Check if `filename` did not change since the `stored` signature was saved.
+
+    If only the modification time changed (but not the content) the signature
+    saved in `signature_filename` is updated with the new modification time.
+    """
+    signature = get_file_signature(filename, with_hash=False)
+    if (signature["size"], signature["mtime_ns"]) != (stored["size"],
+                                                      stored["mtime_ns"]):
+        if signature["size"] != stored["size"]:
+            return False
+        # The file was touched (or downloaded again). It only changed if its
+        # content changed.
+        signature["sha256"] = compute_file_hash(filename)
+        if signature["sha256"] != stored["sha256"]:
+            return False
+        write_json(signature_filename, {**stored, **signature})
+    return True
+
+
+def _get_stored_signature(filename, signature):
+    """The signature saved with data read from `filename` (see `store_*`)"""
+    if signature is None:
+        return get_file_signature(filename)
+    complete = complete_file_signature(filename, signature)
+    if complete is None:
+        logging.warning(
+            "The file %s changed while it was read -> it is not cached",
+            filename)
+    return complete
+
+
+def load_cached_frame(filename):
+    """
+    Load the cached DataFrame for the data file `filename`.
+
+    The cache is valid if the size and modification time of `filename` are the
+    ones stored in the signature file. If they are not, but the file content
+    (sha256 hash) is the same, the cache is still valid and the signature file
+    is updated with the new modification time.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the original data file
+
+    Returns
+    -------
+    pd.DataFrame | None
+        The cached DataFrame, with the stored quality report in
+        `attrs["quality_report"]`, or None if there is no valid cache.
+    """
+    cache_filename, signature_filename = get_cache_filenames(filename)
+    stored = read_json(signature_filename)
+    if (stored is None or stored.get("version") != _CACHE_VERSION
+            or not cache_filename.exists()):
+        return None
+    if not _is_signature_valid(filename, stored, signature_filename):
+        return None
+
+    try:
+        data = pd.read_parquet(cache_filename)
+    except ImportError:
+        logging.info("No parquet engine is installed -> cache is disabled")
+        return None
+    except Exception:  # pylint: disable=broad-except
+        logging.warning("Could not read the cache file %s", cache_filename)
+        return None
+
+    if stored.get("quality_report") is not None:
+        data.attrs[REPORT_ATTR] = QualityReport.from_dict(
+            stored["quality_report"])
+    logging.info("Using the cached data in %s", cache_filename)
+    return data
+
+
+def store_cached_frame(filename, data: pd.DataFrame, signature=None):
+    """
+    Save `data` as the cached DataFrame for the data file `filename`.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the original data file
+    data : pd.DataFrame
+        The cleaned data read from `filename`. Its `attrs["quality_report"]`,
+        if any, is saved in the signature file.
+    signature : dict, optional
+        The signature of `filename` taken before it was read (see
+        `get_file_signature`). Nothing is saved if the file changed since
+        then. If not provided, the current signature is used.
+    """
+    cache_filename, signature_filename = get_cache_filenames(filename)
+    # Invalidate the current cache first
+    signature_filename.unlink(missing_ok=True)
+
+    tmp_filename = Path(f"{cache_filename}.tmp")
+    report = data.attrs.get(REPORT_ATTR)
+    try:
+        # Only the quality report is kept, in the signature file
+        data = data.copy(deep=False)
+        data.attrs = {}
+        data.to_parquet(tmp_filename)
+    except ImportError:
+        logging.info("No parquet engine is installed -> cache is disabled")
+        return
+    except Exception:  # pylint: disable=broad-except
+        logging.warning("Could not write the cache file %s", cache_filename)
+        tmp_filename.unlink(missing_ok=True)
+        return
+    os.replace(tmp_filename, cache_filename)
+
+    signature = _get_stored_signature(filename, signature)
+    if signature is None:
+        return
+    signature["version"] = _CACHE_VERSION
+    signature["quality_report"] = (None if report is None else
+                                   report.to_dict())
+    write_json(signature_filename, signature)
+
+
+def get_metadata_filename(filename):
+    """
+    Get the name of the metadata file for the data file `filename`.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the original data file
+
+    Returns
+    -------
+    Path
+        The name of the JSON metadata file.
+    """
+    return Path(filename).with_suffix(".meta.json")
+
+
+def load_file_metadata(filename):
+    """
+    Load the metadata of the data file `filename`.
+
+    This only reads a small JSON file and checks the size and modification
+    time of `filename` (its hash is only computed if the modification time
+    changed).
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the original data file
+
+    Returns
+    -------
+    dict | None
+        A dictionary with the keys "max_date" (the most recent date in the
+        file, as a `datetime.date`), "rows" and "sha256", or None if there is
+        no metadata or `filename` changed since it was saved.
+    """
+    metadata_filename = get_metadata_filename(filename)
+    stored = read_json(metadata_filename)
+    if stored is None or stored.get("version") != _CACHE_VERSION:
+        return None
+    try:
+        if not _is_signature_valid(filename, stored, metadata_filename):
+            return None
+    except FileNotFoundError:
+        return None
+
+    max_date = stored["max_date"]
+    return {
+        "max_date":
+        None if max_date is None else datetime.date.fromisoformat(max_date),
+        "rows": stored["rows"],
+        "sha256": stored["sha256"],
+    }
+
+
+def store_file_metadata(filename, data: pd.DataFrame, signature=None):
+    """
+    Save the metadata of the data file `filename`.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the original data file
+    data : pd.DataFrame
+        The cleaned data read from `filename`
+    signature : dict, optional
+        The signature of `filename` taken before it was read (see
+        `get_file_signature`). Nothing is saved if the file changed since
+        then. If not provided, the current signature is used.
+    """
+    metadata = _get_stored_signature(filename, signature)
+    if metadata is None:
+        return
+    max_date = data.data.max() if data.shape[0] > 0 else None
+    metadata.update({
+        "version": _CACHE_VERSION,
+        "max_date": None if pd.isna(max_date) else max_date.isoformat(),
+        "rows": data.shape[0],
+    })
+    write_json(get_metadata_filename(filename), metadata)
@@ -0,0 +1,332 @@
+"""
+Command line interface to refresh and export the derived data.
+
+The `covid19` command runs the whole pipeline without a notebook, such that it
+can be scheduled (e.g. with cron)::
+
+    covid19 --output-dir exported --levels brasil estados --timing
+
+The stages are:
+
+1. fetch: download the data file (see `covid19.fetch`)
+2. parse: read the data file (see `covid19.scrap.read_datafile_from_disc`)
+3. derive and export: compute the data of each level (e.g. with
+   `get_all_states_data`) and write it to a Parquet or CSV file
+
+Stages whose results are still current are skipped. The fetch only transfers
+the file if it changed (when the HTTP fetcher is used) and a manifest in the
+output directory records the hash of the data file used for each exported
+level, such that levels already exported from the same data are not parsed
+nor derived again. The levels are derived and exported in parallel threads.
+"""
+import argparse
+import concurrent.futures
+import logging
+import os
+import sys
+from pathlib import Path
+
+from .cache import (compute_file_hash, load_file_metadata, read_json,
+                    write_json)
+from .instrument import instrumentation
+from .scrap import (DATA_FILENAME, DERIVED_DATA_GETTERS,
+                    read_datafile_from_disc)
+
+_manifest_filename = "manifest.json"
+_formats = ("parquet", "csv")
+
+
+def _write_level(data, filename, file_format):
+    """Write the data of a level to `filename` atomically"""
+    tmp_filename = Path(f"{filename}.tmp")
+    # Recent pandas versions save `attrs` in Parquet files, but the attrs of
+    # the data (e.g. the quality report) are not serializable
+    data = data.copy(deep=False)
+    data.attrs = {}
+    try:
+        if file_format == "parquet":
+            data.to_parquet(tmp_filename, index=False)
+        else:
+            data.to_csv(tmp_filename, index=False)
+    except BaseException:
+        tmp_filename.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_filename, filename)
+
+
+def fetch_data_file(data_filename=DATA_FILENAME, fetcher=None):
+    """
+    Download the data file, keeping the existing one if the download fails.
+
+    Parameters
+    ----------
+    data_filename : str | Path
+        The data file
+    fetcher : object
+        The fetcher used to download the data (see `covid19.fetch`)
+
+    Returns
+    -------
+    bool
+        True if the data file changed.
+
+    Raises
+    ------
+    Exception
+        The error of the download (e.g. a `TimeoutError` or an error of the
+        browser) if it fails and there is no data file yet.
+    """
+    if fetcher is None:
+        from .fetch import get_default_fetcher
+        fetcher = get_default_fetcher()
+    try:
+        with instrumentation.stage("download"):
+            changed = fetcher.fetch(data_filename)
+        logging.info("The data file %s",
+                     "changed" if changed else "did not change")
+        return changed
+    except Exception as e:  # pylint: disable=broad-except
+        if not Path(data_filename).exists():
+            raise
+        logging.warning("Could not download data (%r) -> using %s", e,
+                        data_filename)
+        return False
+
+
+def _export_level(data, level, filename, file_format, medias_moveis):
+    """Derive the data of `level` from `data` and write it to `filename`"""
+    with instrumentation.stage(f"export_{level}") as record:
+        get_level_data = DERIVED_DATA_GETTERS[level]
+        level_data = get_level_data(data, medias_moveis=medias_moveis)
+        record.rows = level_data.shape[0]
+        _write_level(level_data, filename, file_format)
+
+
+def _is_exported(manifest, filename, sha256, medias_moveis):
+    """Check if `filename` was exported from the same data and options"""
+    return (sha256 is not None and filename.exists() and manifest.get(
+        filename.name) == _get_entry(sha256, medias_moveis))
+
+
+def _get_data_hash(data_filename):
+    """
+    The sha256 hash of the data file, or None if it does not exist.
+
+    The hash saved in the metadata of the file is used if it is current.
+    """
+    metadata = load_file_metadata(data_filename)
+    if metadata is not None:
+        return metadata["sha256"]
+    try:
+        return compute_file_hash(data_filename)
+    except FileNotFoundError:
+        return None
+
+
+def _get_entry(sha256, medias_moveis):
+    """The manifest entry of a file exported from the data `sha256`"""
+    return {"sha256": sha256, "medias_moveis": medias_moveis}
+
+
+def run_pipeline(output_dir,
+                 levels=tuple(DERIVED_DATA_GETTERS),
+                 file_format="parquet",
+                 data_filename=DATA_FILENAME,
+                 medias_moveis=False,
+                 fetch=True,
+                 force=False,
+                 max_workers=None,
+                 fetcher=None):
+    """
+    Fetch the data file and export the derived data of each level.
+
+    Parameters
+    ----------
+    output_dir : str | Path
+        The directory where the files are written (one per level, e.g.
+        "estados.parquet")
+    levels : tuple[str]
+        The levels that are exported ("brasil", "estados" and/or "municipios")
+    file_format : str
+        Either "parquet" or "csv"
+    data_filename : str | Path
+        The name of the data file
+    medias_moveis : bool
+        If True, the moving averages and the weekday adjusted series are
+        exported too
+    fetch : bool
+        If True, download a new data file first. If the download fails, the
+        existing file (if any) is used.
+    force : bool
+        If True, export all levels even if they are current
+    max_workers : int, optional
+        Maximum number of levels exported at the same time. The default is
+        the number of levels.
+    fetcher : object
+        The fetcher used to download the data (see `covid19.fetch`)
+
+    Returns
+    -------
+    dict[str, str]
+        The status of each level: either "exported" or "skipped" (when it was
+        already exported from the same data file and options).
+
+    Raises
+    ------
+    Exception
+        The error of the first level that could not be exported. The levels
+        that were exported are still recorded in the manifest.
+    """
+    if file_format not in _formats:
+        raise ValueError(f"Unknown file format: {file_format}")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # xxxxxxxxxx Fetch xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    if fetch:
+        fetch_data_file(data_filename, fetcher)
+
+    # xxxxxxxxxx Skip the levels that are current xxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    manifest_filename = output_dir / _manifest_filename
+    manifest = read_json(manifest_filename) or {}
+    sha256 = _get_data_hash(data_filename)
+    filenames = {
+        level: output_dir / f"{level}.{file_format}"
+        for level in levels
+    }
+    status = {
+        level: "skipped"
+        for level in levels
+        if not force and _is_exported(manifest, filenames[level], sha256,
+                                      medias_moveis)
+    }
+    pending = [level for level in levels if level not in status]
+    if not pending:
+        logging.info("All levels are current")
+        return status
+
+    # xxxxxxxxxx Parse xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    with instrumentation.stage("parse") as record:
+        data = read_datafile_from_disc(data_filename)
+        record.rows = data.shape[0]
+    if sha256 is None:
+        sha256 = _get_data_hash(data_filename)
+
+    # xxxxxxxxxx Derive and export xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or len(pending),
+            thread_name_prefix="covid19-export") as executor:
+        futures = {
+            level: executor.submit(_export_level, data, level,
+                                   filenames[level], file_format,
+                                   medias_moveis)
+            for level in pending
+        }
+        errors = []
+        for level, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                logging.error("Could not export the %s data: %r", level, e)
+                errors.append(e)
+                continue
+            status[level] = "exported"
+            manifest[filenames[level].name] = _get_entry(
+                sha256, medias_moveis)
+
+    # The levels that were exported are not exported again in the next run,
+    # also if other levels failed
+    write_json(manifest_filename, manifest)
+    if errors:
+        raise errors[0]
+    return {level: status[level] for level in levels}
+
+
+def _get_parser():
+    parser = argparse.ArgumentParser(
+        prog="covid19",
+        description="Download the covid19 data of the ministry of health and "
+        "export the data of Brazil, the states and the municipalities.")
+    parser.add_argument("-o",
+                        "--output-dir",
+                        default=".",
+                        help="directory of the exported files (default: .)")
+    parser.add_argument("-l",
+                        "--levels",
+                        nargs="+",
+                        choices=list(DERIVED_DATA_GETTERS),
+                        default=list(DERIVED_DATA_GETTERS),
+                        help="levels that are exported (default: all)")
+    parser.add_argument("-f",
+                        "--format",
+                        choices=_formats,
+                        default="parquet",
+                        help="format of the exported files "
+                        "(default: parquet)")
+    parser.add_argument("--data-file",
+                        default=DATA_FILENAME,
+                        help=f"the data file (default: {DATA_FILENAME})")
+    parser.add_argument("--medias-moveis",
+                        action="store_true",
+                        help="also export the moving averages")
+    parser.add_argument("--no-fetch",
+                        dest="fetch",
+                        action="store_false",
+                        help="use the existing data file without downloading")
+    parser.add_argument("--force",
+                        action="store_true",
+                        help="export all levels even if they are current")
+    parser.add_argument("-j",
+                        "--jobs",
+                        type=int,
+                        default=None,
+                        help="levels exported in parallel "
+                        "(default: all of them)")
+    parser.add_argument("--timing",
+                        action="store_true",
+                        help="print the time spent in each stage")
+    parser.add_argument("-v",
+                        "--verbose",
+                        action="store_true",
+                        help="log what is being done")
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the `covid19` command.
+
+    Parameters
+    ----------
+    argv : list[str], optional
+        The command line arguments (the default is `sys.argv[1:]`)
+
+    Returns
+    -------
+    int
+        The exit status.
+    """
+    args = _get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    instrumentation.clear()
+    try:
+        status = run_pipeline(args.output_dir,
+                              levels=tuple(dict.fromkeys(args.levels)),
+                              file_format=args.format,
+                              data_filename=args.data_file,
+                              medias_moveis=args.medias_moveis,
+                              fetch=args.fetch,
+                              force=args.force,
+                              max_workers=args.jobs)
+    except Exception as e:  # pylint: disable=broad-except
+        logging.error("Could not export the data: %r", e)
+        return 1
+
+    for level, level_status in status.items():
+        print(f"{level}: {level_status}")
+    if args.timing and instrumentation.records:
+        report = instrumentation.report()
+        print(report.to_string(index=False), file=sys.stderr)
+    return 0
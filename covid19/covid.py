@@ -3,6 +3,14 @@ import logging
 import numpy as np
 import pandas as pd
 
+from .instrument import instrumentation, instrumented
+from .quality import LEVELS, get_levels, is_cleaned
+
+_nanossegundos_por_dia = 86_400 * 10**9
+_colunas_medias_moveis = ("mediaCasosNovos_7", "mediaCasosNovos_14",
+                          "mediaObitosNovos_7", "mediaObitosNovos_14",
+                          "casosNovosAjustados", "obitosNovosAjustados")
+
 
 def get_date_date_cases_greater_than(df: pd.DataFrame, threshold: int = 0):
     """
@@ -30,12 +38,13 @@ def get_date_date_cases_greater_than(df: pd.DataFrame, threshold: int = 0):
 
     if "data" in result:
         # O dataframe tem uma coluna "data"
-        # Vamos fazer um "sort" pois como tem vários estados não necessariamente
-        # a primeira data é a mais antiga
-        return result.sort_values(by="data").iloc[0].data
+        # Vamos pegar a menor data pois como tem vários estados não
+        # necessariamente a primeira data é a mais antiga. Para consultar
+        # várias regiões e thresholds veja `covid19.thresholds.ThresholdIndex`
+        return result.data.min()
 
     assert result.index.name == "data"
-    return result.sort_index().index[0]
+    return result.index.min()
 
 
 def get_dia_de_contaminacao_array(df: pd.DataFrame, min_casos: int = 1):
@@ -73,7 +82,317 @@ def get_dia_de_contaminacao_array(df: pd.DataFrame, min_casos: int = 1):
     ])
 
 
-def get_brazil_data(df: pd.DataFrame):
+def _calcula_novos_por_grupo(acumulado: pd.Series, eh_inicio: np.ndarray):
+    """
+    Calcula os valores novos a partir dos acumulados em cada grupo.
+
+    O primeiro valor de cada grupo corresponde ao próprio valor acumulado, como
+    em `np.diff(acumulado, prepend=0)`.
+
+    Parameters
+    ----------
+    acumulado : pd.Series
+        Valores acumulados, com as linhas de cada grupo contíguas
+    eh_inicio : np.ndarray
+        Array booleano indicando as linhas que iniciam um grupo
+
+    Returns
+    -------
+    pd.api.extensions.ExtensionArray | np.ndarray
+        Os valores novos, na mesma ordem de `acumulado`.
+    """
+    anterior = acumulado.shift(1, fill_value=0).where(~eh_inicio, 0)
+    return (acumulado - anterior).array
+
+
+def _calcula_dias_de_contaminacao_por_grupo(atingiu: np.ndarray,
+                                            datas: np.ndarray,
+                                            inicios: np.ndarray,
+                                            grupo: np.ndarray,
+                                            tamanhos: np.ndarray,
+                                            posicao_no_grupo: np.ndarray):
+    """
+    Versão vetorizada de `get_dia_de_contaminacao_array` para vários grupos.
+
+    Em cada grupo o primeiro dia de contaminação é a menor data em que
+    `atingiu` é verdadeiro. Os dias de contaminação são então uma sequência de
+    zeros seguida de 1, 2, ..., exatamente como em
+    `get_dia_de_contaminacao_array`. Um grupo que nunca atingiu o número mínimo
+    de casos fica apenas com zeros.
+
+    Parameters
+    ----------
+    atingiu : np.ndarray
+        Array booleano indicando as linhas com o número mínimo de casos
+    datas : np.ndarray
+        Datas como inteiros (nanossegundos)
+    inicios : np.ndarray
+        Índice da primeira linha de cada grupo
+    grupo : np.ndarray
+        Índice do grupo de cada linha
+    tamanhos : np.ndarray
+        Número de linhas de cada grupo
+    posicao_no_grupo : np.ndarray
+        Posição (a partir de zero) de cada linha dentro do seu grupo
+
+    Returns
+    -------
+    np.ndarray
+        Um array de inteiros.
+    """
+    sem_contaminacao = np.iinfo(np.int64).max
+    primeiro_dia = np.minimum.reduceat(
+        np.where(atingiu, datas, sem_contaminacao), inicios)
+    no_periodo = datas >= primeiro_dia[grupo]
+    num_dias = np.add.reduceat(no_periodo.astype(int), inicios)
+
+    dias = posicao_no_grupo - (tamanhos - num_dias)[grupo] + 1
+    return np.maximum(dias, 0)
+
+
+def _soma_movel(valores: np.ndarray, inicio: np.ndarray, fim: np.ndarray):
+    """
+    Soma de `valores[inicio[i]:fim[i]]` para cada `i`, com somas acumuladas.
+
+    Valores NaN são tratados como zero.
+    """
+    acumulado = np.concatenate(
+        [[0.0], np.cumsum(np.nan_to_num(valores), dtype=float)])
+    return acumulado[fim] - acumulado[inicio]
+
+
+def _limites_da_janela(dias: np.ndarray, grupo: np.ndarray, antes: int,
+                       depois: int):
+    """
+    Linhas do mesmo grupo com datas entre `dia - antes` e `dia + depois`.
+
+    Parameters
+    ----------
+    dias : np.ndarray
+        Número de dias desde a primeira data do grupo de cada linha, em ordem
+        crescente dentro de cada grupo
+    grupo : np.ndarray
+        Índice do grupo de cada linha, com as linhas de cada grupo contíguas
+    antes : int
+        Número de dias antes da data de cada linha
+    depois : int
+        Número de dias depois da data de cada linha
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray)
+        Os índices `inicio` e `fim` tais que `inicio[i]:fim[i]` são as linhas
+        da janela da linha `i`.
+    """
+    # Uma única chave crescente para todas as linhas, com um intervalo entre
+    # grupos maior que a janela, tal que a busca nunca passa de um grupo a
+    # outro
+    passo = dias.max() + antes + depois + 1
+    chave = grupo * passo + dias
+    inicio = np.searchsorted(chave, chave - antes, side="left")
+    fim = np.searchsorted(chave, chave + depois, side="right")
+    return inicio, fim
+
+
+def _calcula_media_movel_por_grupo(valores: np.ndarray, dias: np.ndarray,
+                                   grupo: np.ndarray, janela: int):
+    """
+    Média móvel de `valores` nos últimos `janela` dias de cada grupo.
+
+    A média de uma linha é a soma dos valores das linhas do mesmo grupo com
+    datas entre `janela - 1` dias antes e a própria data, dividida por
+    `janela`. A janela conta dias e não linhas: se faltam datas no grupo, os
+    dias faltantes não contribuem com nada, mas os valores novos da linha
+    seguinte (calculados a partir dos acumulados) já incluem os casos desses
+    dias. Linhas cuja janela começa antes da primeira data do grupo ficam com
+    NaN.
+
+    Parameters
+    ----------
+    valores : np.ndarray
+        Valores (float), com as linhas de cada grupo contíguas
+    dias : np.ndarray
+        Número de dias desde a primeira data do grupo de cada linha, em ordem
+        crescente dentro de cada grupo
+    grupo : np.ndarray
+        Índice do grupo de cada linha
+    janela : int
+        Número de dias da média
+
+    Returns
+    -------
+    np.ndarray
+        A média móvel de cada linha.
+    """
+    inicio, fim = _limites_da_janela(dias, grupo, janela - 1, 0)
+    media = _soma_movel(valores, inicio, fim) / janela
+    media[dias < janela - 1] = np.nan
+    return media
+
+
+def _calcula_ajuste_semanal_por_grupo(valores: np.ndarray, dia_da_semana,
+                                      dias: np.ndarray, grupo: np.ndarray,
+                                      num_grupos: int):
+    """
+    Remove o efeito do dia da semana de `valores` em cada grupo.
+
+    Para cada grupo e dia da semana é calculado um fator: a soma dos valores
+    nesse dia da semana dividida pela soma da média móvel centrada de 7 dias
+    nesses mesmos dias. Os 7 fatores de cada grupo são normalizados para terem
+    média 1 e cada valor é dividido pelo fator do seu grupo e dia da semana.
+    Grupos sem dados suficientes ficam com fator 1 (valores inalterados).
+
+    Os fatores só usam as linhas cuja janela centrada tem os 7 dias, sem datas
+    faltantes: a linha seguinte a uma data faltante acumula os casos de mais
+    de um dia e distorceria o fator do seu dia da semana. Essas linhas são
+    ajustadas normalmente com os fatores calculados a partir das demais.
+
+    Parameters
+    ----------
+    valores : np.ndarray
+        Valores (float), com as linhas de cada grupo contíguas
+    dia_da_semana : np.ndarray
+        Dia da semana de cada linha (0 é segunda-feira)
+    dias : np.ndarray
+        Número de dias desde a primeira data do grupo de cada linha, em ordem
+        crescente dentro de cada grupo
+    grupo : np.ndarray
+        Índice do grupo de cada linha
+    num_grupos : int
+        Número de grupos
+
+    Returns
+    -------
+    np.ndarray
+        Os valores ajustados.
+    """
+    inicio, fim = _limites_da_janela(dias, grupo, 3, 3)
+    media_centrada = _soma_movel(valores, inicio, fim) / 7
+
+    ultimo_dia = dias[np.searchsorted(grupo, np.arange(num_grupos),
+                                      side="right") - 1]
+    apos_lacuna = np.zeros(valores.shape[0], dtype=bool)
+    apos_lacuna[1:] = (grupo[1:] == grupo[:-1]) & (dias[1:] - dias[:-1] > 1)
+    lacunas = np.concatenate([[0], np.cumsum(apos_lacuna)])
+    completa = ((dias >= 3) & (dias + 3 <= ultimo_dia[grupo]) &
+                (fim - inicio == 7) & (lacunas[fim] == lacunas[inicio]))
+    usar = completa & ~np.isnan(valores)
+
+    indice = grupo * 7 + dia_da_semana
+    soma_valores = np.bincount(indice[usar],
+                               weights=valores[usar],
+                               minlength=num_grupos * 7).reshape(-1, 7)
+    soma_medias = np.bincount(indice[usar],
+                              weights=media_centrada[usar],
+                              minlength=num_grupos * 7).reshape(-1, 7)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fatores = soma_valores / soma_medias
+        fatores /= fatores.mean(axis=1, keepdims=True)
+    fatores[~np.isfinite(fatores) | (fatores <= 0)] = 1.0
+
+    return valores / fatores.ravel()[indice]
+
+
+def _adiciona_colunas_derivadas(df: pd.DataFrame,
+                                chave: str,
+                                medias_moveis: bool = False):
+    """
+    Adiciona as colunas derivadas em `df` para cada grupo de `chave`.
+
+    As colunas adicionadas são "casosNovos", "obitosNovos",
+    "diasDeContaminacao_1" e "diasDeContaminacao_100". Tudo é calculado de uma
+    só vez para todos os grupos (estados, municípios, etc.): as linhas são
+    agrupadas com uma única ordenação estável pelo código do grupo, que mantém
+    a ordem original das linhas dentro de cada grupo, e os resultados são
+    escritos de volta na ordem original de `df`. Se as linhas de cada grupo já
+    estiverem contíguas essa ordenação não é feita.
+
+    Se `medias_moveis` for True também são adicionadas as médias móveis de 7 e
+    14 dias dos casos e óbitos novos ("mediaCasosNovos_7",
+    "mediaCasosNovos_14", "mediaObitosNovos_7" e "mediaObitosNovos_14") e os
+    casos e óbitos novos sem o efeito do dia da semana ("casosNovosAjustados" e
+    "obitosNovosAjustados"). Tudo é calculado com somas acumuladas, em O(n).
+    As janelas das médias contam dias e não linhas, então datas faltantes em um
+    grupo não deslocam as médias (veja `_calcula_media_movel_por_grupo`). As
+    datas de cada grupo devem estar em ordem crescente.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Os dados. As colunas são adicionadas nesse próprio DataFrame.
+    chave : str
+        Nome da coluna que identifica cada grupo (ex.: "estado" ou "codmun")
+    medias_moveis : bool
+        Se True, adiciona as colunas com médias móveis e valores ajustados
+    """
+    num_linhas = df.shape[0]
+    if num_linhas == 0:
+        for coluna in ("casosNovos", "obitosNovos", "diasDeContaminacao_1",
+                       "diasDeContaminacao_100"):
+            df[coluna] = np.zeros(0, dtype=int)
+        if medias_moveis:
+            for coluna in _colunas_medias_moveis:
+                df[coluna] = np.zeros(0, dtype=float)
+        return
+
+    codigos, _ = pd.factorize(df[chave], sort=False)
+    if np.all(codigos[1:] >= codigos[:-1]):
+        # As linhas de cada grupo já estão contíguas (ex.: dados já ordenados
+        # pela chave) e não precisamos reordenar nada
+        ordem = ordem_inversa = np.arange(num_linhas)
+    else:
+        ordem = np.argsort(codigos, kind="stable")
+        ordem_inversa = np.empty_like(ordem)
+        ordem_inversa[ordem] = np.arange(num_linhas)
+        codigos = codigos[ordem]
+
+    eh_inicio = np.empty(num_linhas, dtype=bool)
+    eh_inicio[0] = True
+    eh_inicio[1:] = codigos[1:] != codigos[:-1]
+    inicios = np.flatnonzero(eh_inicio)
+    tamanhos = np.diff(np.append(inicios, num_linhas))
+    grupo = np.cumsum(eh_inicio) - 1
+    posicao_no_grupo = np.arange(num_linhas) - inicios[grupo]
+
+    casos = df["casosAcumulado"].take(ordem)
+    obitos = df["obitosAcumulado"].take(ordem)
+
+    # Calcula novos casos a partir dos casos acumulados. Note que o primeiro
+    # valor na coluna "casosNovos" corresponde ao total de casos acumulados na
+    # primeira entrada de cada grupo
+    df["casosNovos"] = _calcula_novos_por_grupo(casos,
+                                                eh_inicio)[ordem_inversa]
+    df["obitosNovos"] = _calcula_novos_por_grupo(obitos,
+                                                 eh_inicio)[ordem_inversa]
+
+    datas = pd.to_datetime(df["data"]).to_numpy(
+        dtype="datetime64[ns]").view("i8")[ordem]
+    for min_casos in (1, 100):
+        atingiu = (casos > min_casos - 1).to_numpy(dtype=bool, na_value=False)
+        dias = _calcula_dias_de_contaminacao_por_grupo(atingiu, datas, inicios,
+                                                       grupo, tamanhos,
+                                                       posicao_no_grupo)
+        df[f"diasDeContaminacao_{min_casos}"] = dias[ordem_inversa]
+
+    if medias_moveis:
+        dias = datas // _nanossegundos_por_dia
+        # 01/01/1970 foi uma quinta-feira
+        dia_da_semana = (dias + 3) % 7
+        dias = dias - dias[inicios][grupo]
+        for coluna, nome in (("casosNovos", "CasosNovos"), ("obitosNovos",
+                                                            "ObitosNovos")):
+            novos = df[coluna].to_numpy(dtype=float, na_value=np.nan)[ordem]
+            for janela in (7, 14):
+                media = _calcula_media_movel_por_grupo(novos, dias, grupo,
+                                                       janela)
+                df[f"media{nome}_{janela}"] = media[ordem_inversa]
+            ajustados = _calcula_ajuste_semanal_por_grupo(
+                novos, dia_da_semana, dias, grupo, inicios.shape[0])
+            df[f"{coluna}Ajustados"] = ajustados[ordem_inversa]
+
+
+@instrumented("derive_brasil", rows=len)
+def get_brazil_data(df: pd.DataFrame, medias_moveis: bool = False):
     """
     Retorna um DataFrame com os dados do Brasil.
 
@@ -93,32 +412,32 @@ def get_brazil_data(df: pd.DataFrame):
         O DataFrame obtido ao ler o arquivo de dados disponibilizado pelo
         ministério da saúde. Esse DataFrame possui dados do Brasil, de cada
         estado, e de cada município.
+    medias_moveis : bool
+        Se True, adiciona também as médias móveis de 7 e 14 dias e os casos e
+        óbitos novos ajustados pelo dia da semana (veja
+        `_adiciona_colunas_derivadas`)
 
     Returns
     -------
     pd.DataFrame
         Um DataFrame contendo os dados apenas do Brasil.
     """
-    data_brasil = df.query("regiao=='Brasil'").copy()
+    data_brasil = df[get_levels(df) == LEVELS.index("brasil")].copy()
 
     # xxxxxxxxxx Cleaning xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    # In case of multiple rows with the same date, drop all except the first
-    duplicated_bool_mask = data_brasil.duplicated("data")
-    if sum(duplicated_bool_mask) > 0:
-        logging.warning(
-            "There are duplicated dates in Brazil data -> dropping all except the first one"
-        )
-        data_brasil = data_brasil[~duplicated_bool_mask]
+    # In case of multiple rows with the same date, drop all except the first.
+    # Data returned by `clean_levels` has no duplicated rows.
+    if not is_cleaned(df):
+        with instrumentation.stage("dedup_brasil", rows=data_brasil.shape[0]):
+            duplicated_bool_mask = data_brasil.duplicated("data").to_numpy()
+            if duplicated_bool_mask.any():
+                logging.warning(
+                    "There are duplicated dates in Brazil data -> dropping all except the first one"
+                )
+                data_brasil = data_brasil[~duplicated_bool_mask]
     # xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
 
-    data_brasil["casosNovos"] = np.diff(data_brasil.casosAcumulado, prepend=0)
-    data_brasil["obitosNovos"] = np.diff(data_brasil.obitosAcumulado,
-                                         prepend=0)
-
-    data_brasil["diasDeContaminacao_1"] = get_dia_de_contaminacao_array(
-        data_brasil, min_casos=1)
-    data_brasil["diasDeContaminacao_100"] = get_dia_de_contaminacao_array(
-        data_brasil, min_casos=100)
+    _adiciona_colunas_derivadas(data_brasil, "regiao", medias_moveis)
 
     return data_brasil.drop(labels=[
         "regiao", "coduf", "estado", "municipio", "codmun", "codRegiaoSaude",
@@ -127,7 +446,10 @@ def get_brazil_data(df: pd.DataFrame):
                             axis=1)
 
 
-def get_all_states_data(df: pd.DataFrame):
+@instrumented("derive_estados", rows=len)
+def get_all_states_data(df: pd.DataFrame,
+                        por_municipio: bool = False,
+                        medias_moveis: bool = False):
     """
     Retorna um Dataframe com apenas os dados dos estados.
 
@@ -145,60 +467,130 @@ def get_all_states_data(df: pd.DataFrame):
     Colunas que não importam para os dados dos estados foram removidas. Elas
     são: "municipio", "codmun", "codRegiaoSaude" e "nomeRegiaoSaude".
 
+    Se `por_municipio` for True então o resultado é o mesmo de
+    `get_all_municipalities_data`.
+
     Parameters
     ----------
     df : pd.DataFrame
         Dataframe com os dados do Brasil todo
+    por_municipio : bool
+        Se True, retorna os dados por município ao invés dos dados por estado
+    medias_moveis : bool
+        Se True, adiciona também as médias móveis de 7 e 14 dias e os casos e
+        óbitos novos ajustados pelo dia da semana (veja
+        `_adiciona_colunas_derivadas`)
 
     Returns
     -------
     pd.Dataframe
-        Dataframe com dados apenas dos estados
+        Dataframe com dados apenas dos estados (ou dos municípios)
     """
-    data_estados = df[df.codmun.isna()
-                      & np.logical_not(df.estado.isna())].copy()
+    if por_municipio:
+        return get_all_municipalities_data(df, medias_moveis=medias_moveis)
+
+    data_estados = df[get_levels(df) == LEVELS.index("estados")].copy()
 
     # xxxxxxxxxx Cleaning xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    # In case of multiple rows with the same date, drop all except the first
-    duplicated_bool_mask = data_estados.duplicated(["estado", "data"])
-    if sum(duplicated_bool_mask) > 0:
-        logging.warning(
-            "There are duplicated dates in All States data -> dropping all except the first one"
-        )
-        data_estados = data_estados[~duplicated_bool_mask]
+    # In case of multiple rows with the same date, drop all except the first.
+    # Data returned by `clean_levels` has no duplicated rows.
+    if not is_cleaned(df):
+        with instrumentation.stage("dedup_estados",
+                                   rows=data_estados.shape[0]):
+            duplicated_bool_mask = data_estados.duplicated(
+                ["estado", "data"]).to_numpy()
+            if duplicated_bool_mask.any():
+                logging.warning(
+                    "There are duplicated dates in All States data -> dropping all except the first one"
+                )
+                data_estados = data_estados[~duplicated_bool_mask]
     # xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
 
-    estados = data_estados.estado.unique()
-
-    # Calcula novos casos a partir dos casos acumulados. Note que o primeiro
-    # valor na coluna "casosNovos" corresponde ao total de casos acumulados na
-    # primeira entrada
-    data_estados["casosNovos"] = np.zeros(data_estados.shape[0], dtype=int)
-    data_estados["diasDeContaminacao_1"] = np.zeros(data_estados.shape[0],
-                                                    dtype=int)
-    data_estados["diasDeContaminacao_100"] = np.zeros(data_estados.shape[0],
-                                                      dtype=int)
-    for sigla in estados:
-        data_esse_estado = data_estados[data_estados.estado == sigla]
-        data_estados.loc[data_estados.estado == sigla, "casosNovos"] = np.diff(
-            data_esse_estado.casosAcumulado, prepend=0)
-        data_estados.loc[data_estados.estado == sigla,
-                         "obitosNovos"] = np.diff(
-                             data_esse_estado.obitosAcumulado, prepend=0)
-        data_estados.loc[
-            data_estados.estado == sigla,
-            "diasDeContaminacao_1"] = get_dia_de_contaminacao_array(
-                data_estados[data_estados.estado == sigla])
-        data_estados.loc[
-            data_estados.estado == sigla,
-            "diasDeContaminacao_100"] = get_dia_de_contaminacao_array(
-                data_estados[data_estados.estado == sigla], 100)
+    _adiciona_colunas_derivadas(data_estados, "estado", medias_moveis)
 
     return data_estados.drop(
         labels=["municipio", "codmun", "codRegiaoSaude", "nomeRegiaoSaude"],
         axis=1)
 
 
+@instrumented("derive_municipios", rows=len)
+def get_all_municipalities_data(df: pd.DataFrame,
+                                estado=None,
+                                codRegiaoSaude=None,
+                                medias_moveis: bool = False):
+    """
+    Retorna um Dataframe com apenas os dados dos municípios.
+
+    Os dados de um município são as linhas que possuem valor na coluna
+    "codmun". Assim como em `get_all_states_data`, o DataFrame retornado possui
+    quatro colunas extras: "casosNovos", "obitosNovos", "diasDeContaminacao_1" e
+    "diasDeContaminacao_100", calculadas para cada município.
+
+    As linhas são ordenadas uma única vez por município e data. Com isso as
+    datas duplicadas são linhas vizinhas e cada município ocupa um bloco
+    contíguo, de forma que todas as colunas extras são calculadas de uma só vez
+    para todos os municípios.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataframe com os dados do Brasil todo
+    estado : str | list[str], optional
+        Sigla (ou lista de siglas) dos estados cujos municípios devem ser
+        retornados. Se não for fornecido, todos os estados são considerados.
+    codRegiaoSaude : int | list[int], optional
+        Código (ou lista de códigos) das regiões de saúde cujos municípios
+        devem ser retornados. Se não for fornecido, todas as regiões são
+        consideradas.
+    medias_moveis : bool
+        Se True, adiciona também as médias móveis de 7 e 14 dias e os casos e
+        óbitos novos ajustados pelo dia da semana (veja
+        `_adiciona_colunas_derivadas`)
+
+    Returns
+    -------
+    pd.Dataframe
+        Dataframe com dados apenas dos municípios, ordenado por "codmun" e
+        "data".
+    """
+    mask = get_levels(df) == LEVELS.index("municipios")
+    if estado is not None:
+        mask &= df.estado.isin(np.atleast_1d(estado)).to_numpy()
+    if codRegiaoSaude is not None:
+        mask &= df.codRegiaoSaude.isin(
+            np.atleast_1d(codRegiaoSaude)).to_numpy()
+
+    data_municipios = df[mask].sort_values(by=["codmun", "data"],
+                                           kind="mergesort")
+
+    # xxxxxxxxxx Cleaning xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # In case of multiple rows with the same date, drop all except the first.
+    # Since the data is sorted, duplicated rows are next to each other. Data
+    # returned by `clean_levels` has no duplicated rows.
+    if not is_cleaned(df):
+        with instrumentation.stage("dedup_municipios",
+                                   rows=data_municipios.shape[0]):
+            codmun = data_municipios.codmun.to_numpy(dtype=float,
+                                                     na_value=np.nan)
+            datas = data_municipios.data.to_numpy()
+            duplicated_bool_mask = np.zeros(data_municipios.shape[0],
+                                            dtype=bool)
+            duplicated_bool_mask[1:] = ((codmun[1:] == codmun[:-1])
+                                        & (datas[1:] == datas[:-1]))
+            if duplicated_bool_mask.any():
+                logging.warning(
+                    "There are duplicated dates in All Municipalities data -> dropping all except the first one"
+                )
+                data_municipios = data_municipios[~duplicated_bool_mask]
+            else:
+                data_municipios = data_municipios.copy()
+    # xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+
+    _adiciona_colunas_derivadas(data_municipios, "codmun", medias_moveis)
+
+    return data_municipios
+
+
 # def get_state_data(df: pd.DataFrame, state_abrv: str):
 #     """
 #     Retorna um dataframe com apenas os dados de um estado específico.
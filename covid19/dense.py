@@ -0,0 +1,185 @@
+"""
+Dense date x region arrays with the derived data.
+
+The derived data (e.g. `get_all_states_data`) is in long format: one row per
+region and date. Getting the series of a single region requires a scan of all
+rows (e.g. `data_estados[data_estados.estado == "CE"]`). A `DenseStore` keeps
+each metric as a 2-D array with one row per date and one column per region,
+together with the index of the dates and regions, such that the series of any
+region is a simple slice.
+
+The arrays are stored in column-major (Fortran) order, so the series of each
+region is contiguous in memory. They can be saved as ".npy" files and loaded
+as memory maps, which are shared (without copies) by all processes using them.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+_default_metrics = ("casosAcumulado", "casosNovos", "obitosAcumulado",
+                    "obitosNovos", "diasDeContaminacao_1",
+                    "diasDeContaminacao_100")
+_index_filename = "index.json"
+
+
+class DenseStore:
+    """
+    Metrics of all regions as dense (dates x regions) arrays.
+
+    Parameters
+    ----------
+    dates : np.ndarray
+        The dates (datetime64[D]), in increasing order
+    regions : pd.Index
+        The regions
+    arrays : dict[str, np.ndarray]
+        An array with shape (len(dates), len(regions)) for each metric. Missing
+        values are NaN.
+    """
+    def __init__(self, dates, regions, arrays):
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        self.regions = pd.Index(regions)
+        self.arrays = dict(arrays)
+        self._date_positions = pd.Index(self.dates)
+        for metric, array in self.arrays.items():
+            if array.shape != (self.dates.shape[0], self.regions.shape[0]):
+                raise ValueError(f"Wrong shape for metric {metric}")
+
+    @property
+    def metrics(self):
+        """list[str]: The names of the metrics"""
+        return list(self.arrays)
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame, key, metrics=_default_metrics):
+        """
+        Create the store from derived data in long format.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            The derived data (e.g. as returned by `get_all_states_data`)
+        key : str
+            The column identifying the regions (e.g. "estado" or "codmun")
+        metrics : tuple[str]
+            The columns that are stored
+
+        Returns
+        -------
+        DenseStore
+            The store. Dates without data for a region have NaN values.
+        """
+        dates = pd.to_datetime(data["data"]).to_numpy(
+            dtype="datetime64[ns]").astype("datetime64[D]")
+        date_codes, unique_dates = pd.factorize(dates, sort=True)
+        region_codes, regions = pd.factorize(data[key], sort=True)
+        valid = (date_codes >= 0) & (region_codes >= 0)
+        date_codes = date_codes[valid]
+        region_codes = region_codes[valid]
+
+        shape = (len(unique_dates), len(regions))
+        arrays = {}
+        for metric in metrics:
+            array = np.full(shape, np.nan, order="F")
+            array[date_codes, region_codes] = data[metric].to_numpy(
+                dtype=float, na_value=np.nan)[valid]
+            arrays[metric] = array
+        return cls(np.asarray(unique_dates), pd.Index(regions, name=key),
+                   arrays)
+
+    def get_series(self, metric, region):
+        """
+        Get the series of `metric` for `region`.
+
+        Parameters
+        ----------
+        metric : str
+            The name of the metric
+        region : Any
+            The region (e.g. "CE")
+
+        Returns
+        -------
+        pd.Series
+            The series indexed by date. The values are a view of the array.
+        """
+        column = self.regions.get_loc(region)
+        return pd.Series(self.arrays[metric][:, column],
+                         index=pd.DatetimeIndex(self.dates, name="data"),
+                         name=metric,
+                         copy=False)
+
+    def get_date(self, metric, date):
+        """
+        Get the values of `metric` for all regions in `date`.
+
+        Parameters
+        ----------
+        metric : str
+            The name of the metric
+        date : datetime.date | str | np.datetime64
+            The date
+
+        Returns
+        -------
+        pd.Series
+            The values indexed by region.
+        """
+        row = self._date_positions.get_loc(np.datetime64(date, "D"))
+        return pd.Series(self.arrays[metric][row, :],
+                         index=self.regions,
+                         name=metric)
+
+    def save(self, directory):
+        """
+        Save the arrays as ".npy" files in `directory`.
+
+        Parameters
+        ----------
+        directory : str | Path
+            The directory where the files are saved
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for metric, array in self.arrays.items():
+            np.save(directory / f"{metric}.npy", array)
+        index = {
+            "dates": [str(date) for date in self.dates],
+            "regions": self.regions.tolist(),
+            "regions_name": self.regions.name,
+            "metrics": self.metrics,
+        }
+        with open(directory / _index_filename, mode="w") as f:
+            json.dump(index, f, default=int)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """
+        Load the arrays saved with `save`.
+
+        Parameters
+        ----------
+        directory : str | Path
+            The directory where the files were saved
+        mmap_mode : str | None
+            The mode of the memory maps (see `np.load`). With the default
+            ("r") the arrays are read-only memory maps and only the accessed
+            parts are read from disk. If None, the arrays are read to memory.
+
+        Returns
+        -------
+        DenseStore
+            The loaded store.
+        """
+        directory = Path(directory)
+        with open(directory / _index_filename, mode="r") as f:
+            index = json.load(f)
+        arrays = {
+            metric: np.load(directory / f"{metric}.npy", mmap_mode=mmap_mode)
+            for metric in index["metrics"]
+        }
+        regions = pd.Index(index["regions"], name=index["regions_name"])
+        return cls(np.array(index["dates"], dtype="datetime64[D]"), regions,
+                   arrays)
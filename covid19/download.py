@@ -0,0 +1,251 @@
+"""
+Non-blocking download of the data file provided by the ministry of health.
+
+The download is started by a "download source": a callable receiving the
+directory where the file must be saved, which starts the download and returns
+a callable that is called (without arguments) to release its resources when
+the download is finished. The default source is `firefox_download_source`,
+which clicks the download button of the ministry page in a headless Firefox.
+
+Each download goes into a dedicated temporary directory. The download is
+finished when that directory has a non-empty file and no partial file (such as
+the ".part" file created by Firefox while downloading). The file is then moved
+to its final name in a single `os.replace`, such that readers never see a
+partial file.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from time import sleep
+
+_url = "https://covid.saude.gov.br/"
+_partial_suffixes = (".part", ".crdownload", ".tmp", ".download")
+
+
+def firefox_download_source(download_dir):
+    """
+    Start the download of the data file in a headless Firefox.
+
+    Parameters
+    ----------
+    download_dir : Path
+        The folder where the file is downloaded to
+
+    Returns
+    -------
+    Callable[[], None]
+        A function that closes the browser.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.firefox.options import Options
+
+    # Create a profile and set some preferences to prevent download dialog
+    profile = webdriver.FirefoxProfile()
+    profile.set_preference('browser.download.folderList', 2)  # custom location
+    profile.set_preference('browser.download.manager.showWhenStarting', False)
+    profile.set_preference('browser.download.dir', str(download_dir))
+    profile.set_preference(
+        'browser.helperApps.neverAsk.saveToDisk',
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    options = Options()
+    options.headless = True
+
+    # Create a driver and load the webpage -> This blocks until the page
+    # You need to install a driver. I'm using a driver for firefox
+    # See here https://selenium-python.readthedocs.io/installation.html#drivers
+    # In Arch Linux you can install driver for firefox with `sudo pacman -Sy geckodriver`
+    driver = webdriver.Firefox(profile, options=options)
+    try:
+        driver.get(_url)
+
+        # Everything in the app (except the navbar) is in a tag with name
+        # "ion-content". The first "div" in it has a single "button", which is
+        # the download button
+        ion_content = driver.find_element_by_tag_name("ion-content")
+        first_div = ion_content.find_element_by_tag_name("div")
+        download_button = first_div.find_element_by_class_name("button")
+
+        # The page needs some time before the button works
+        sleep(5.0)
+        download_button.click()
+    except Exception:
+        driver.close()
+        raise
+
+    return driver.close
+
+
+def _find_downloaded_file(download_dir):
+    """
+    Get the downloaded file in `download_dir` if the download is finished.
+
+    Parameters
+    ----------
+    download_dir : Path
+        The folder where the file is downloaded to
+
+    Returns
+    -------
+    Path | None
+        The downloaded file or None if the download is not finished.
+    """
+    files = [f for f in download_dir.iterdir() if f.is_file()]
+    if any(f.name.endswith(_partial_suffixes) for f in files):
+        return None
+
+    # Firefox creates the final file (empty) before the partial file
+    files = [f for f in files if f.stat().st_size > 0]
+    if not files:
+        return None
+    return max(files, key=lambda f: f.stat().st_mtime_ns)
+
+
+async def download_covid_data_async(destination,
+                                    source=firefox_download_source,
+                                    timeout=60.0,
+                                    poll_interval=0.1):
+    """
+    Download the data file to `destination` without blocking the event loop.
+
+    The (blocking) download source runs in the default executor and the
+    completion of the download is awaited with `asyncio.sleep`, such that other
+    tasks (e.g. serving the current data) keep running.
+
+    Parameters
+    ----------
+    destination : str | Path
+        The name of the downloaded file
+    source : Callable[[Path], Callable[[], None]]
+        The download source
+    timeout : float
+        Maximum time (in seconds) to wait for the download after it started
+    poll_interval : float
+        Interval (in seconds) between checks of the download directory
+
+    Returns
+    -------
+    Path
+        The name of the downloaded file.
+
+    Raises
+    ------
+    TimeoutError
+        If the download did not finish within `timeout` seconds.
+    """
+    import asyncio
+    destination = Path(destination)
+    loop = asyncio.get_running_loop()
+    # The temporary folder is in the same folder of `destination` such that
+    # the file can be moved with `os.replace`
+    download_dir = Path(
+        tempfile.mkdtemp(prefix=".covid19-download-",
+                         dir=destination.parent.resolve()))
+    cleanup = None
+    try:
+        cleanup = await loop.run_in_executor(None, source, download_dir)
+
+        start = loop.time()
+        downloaded_file = _find_downloaded_file(download_dir)
+        while downloaded_file is None:
+            if loop.time() - start > timeout:
+                raise TimeoutError(
+                    f"Could not download the file in {timeout} seconds")
+            await asyncio.sleep(poll_interval)
+            downloaded_file = _find_downloaded_file(download_dir)
+
+        os.replace(downloaded_file, destination)
+        logging.info("The download was finished!")
+        return destination
+    finally:
+        if cleanup is not None:
+            await loop.run_in_executor(None, cleanup)
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+
+def download_covid_data(destination,
+                        source=firefox_download_source,
+                        timeout=60.0):
+    """
+    Download the data file to `destination`, blocking until it finishes.
+
+    Parameters
+    ----------
+    destination : str | Path
+        The name of the downloaded file
+    source : Callable[[Path], Callable[[], None]]
+        The download source
+    timeout : float
+        Maximum time (in seconds) to wait for the download after it started
+
+    Returns
+    -------
+    Path
+        The name of the downloaded file.
+    """
+    import asyncio
+    return asyncio.run(
+        download_covid_data_async(destination, source=source,
+                                  timeout=timeout))
+
+
+# Created on first use (see `run_in_background`)
+_background_executor = None
+_background_executor_lock = threading.Lock()
+
+
+def run_in_background(func, *args):
+    """
+    Run `func(*args)` in the background download thread.
+
+    Downloads submitted with this function run one at a time.
+
+    Parameters
+    ----------
+    func : Callable
+        The function to run
+    *args : Any
+        The arguments passed to `func`
+
+    Returns
+    -------
+    concurrent.futures.Future
+        A future with the result of `func`.
+    """
+    global _background_executor
+    with _background_executor_lock:
+        if _background_executor is None:
+            import concurrent.futures
+            _background_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="covid19-download")
+    return _background_executor.submit(func, *args)
+
+
+def download_covid_data_in_background(destination,
+                                      source=firefox_download_source,
+                                      timeout=60.0):
+    """
+    Download the data file to `destination` in a background thread.
+
+    The current file (if any) is only replaced when the download finishes, so
+    callers can keep using it in the meantime.
+
+    Parameters
+    ----------
+    destination : str | Path
+        The name of the downloaded file
+    source : Callable[[Path], Callable[[], None]]
+        The download source
+    timeout : float
+        Maximum time (in seconds) to wait for the download after it started
+
+    Returns
+    -------
+    concurrent.futures.Future
+        A future whose result is the name of the downloaded file.
+    """
+    return run_in_background(download_covid_data, destination, source,
+                             timeout)
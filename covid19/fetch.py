@@ -0,0 +1,341 @@
+"""
+Pluggable backends ("fetchers") used to get the data file.
+
+A fetcher has a single method, `fetch(destination)`, which updates the file
+`destination` and returns True if a new file was written or False if the file
+did not change. The available fetchers are:
+
+- `HttpFetcher`: downloads the file directly over HTTP, reusing connections.
+  Requests are conditional (`If-None-Match`/`If-Modified-Since`), such that an
+  unchanged file is not transferred again, and interrupted downloads are
+  resumed with range requests.
+- `BrowserFetcher`: clicks the download button of the ministry page in a
+  headless Firefox (see `covid19.download`).
+- `FallbackFetcher`: tries several fetchers in order.
+
+The default fetcher (see `get_default_fetcher`) uses the HTTP fetcher if the
+URL of the file is in the `COVID19_DATA_URL` environment variable, falling back
+to the browser.
+"""
+import http.client
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+from .download import download_covid_data, firefox_download_source
+
+_redirect_status = (301, 302, 303, 307, 308)
+_max_redirects = 5
+
+
+class _ConnectionPool:
+    """Idle HTTP connections that can be reused, for each host"""
+    def __init__(self, max_idle_per_host=4):
+        self._max_idle_per_host = max_idle_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, scheme, netloc, timeout):
+        """Get an idle connection or create a new one"""
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop()
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=timeout)
+        return http.client.HTTPConnection(netloc, timeout=timeout)
+
+    def put(self, scheme, netloc, connection):
+        """Return a connection whose last response was fully read"""
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), [])
+            if len(idle) < self._max_idle_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def clear(self):
+        """Close all idle connections"""
+        with self._lock:
+            for idle in self._idle.values():
+                for connection in idle:
+                    connection.close()
+            self._idle.clear()
+
+
+_pool = _ConnectionPool()
+
+
+class HttpFetcher:
+    """
+    Download the data file directly over HTTP.
+
+    The validators (ETag and Last-Modified) of the downloaded file are saved in
+    a JSON file next to it (e.g. "dados.xlsx.http.json"). The file is first
+    downloaded to a ".part" file, which is kept if the download is interrupted
+    and resumed in the next `fetch`.
+
+    Parameters
+    ----------
+    url : str
+        The URL of the file
+    timeout : float
+        Timeout (in seconds) of the socket operations
+    chunk_size : int
+        Number of bytes read at a time
+    """
+    def __init__(self, url, timeout=60.0, chunk_size=1 << 20):
+        self.url = url
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _get_state_filename(destination):
+        return destination.with_name(destination.name + ".http.json")
+
+    def _read_state(self, destination):
+        try:
+            with open(self._get_state_filename(destination), mode="r") as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        # Validators of another URL are useless
+        return state if state.get("url") == self.url else {}
+
+    def _write_state(self, destination, state):
+        state_filename = self._get_state_filename(destination)
+        tmp_filename = state_filename.with_name(state_filename.name + ".tmp")
+        with open(tmp_filename, mode="w") as f:
+            json.dump({"url": self.url, **state}, f)
+        os.replace(tmp_filename, state_filename)
+
+    def _request(self, headers):
+        """
+        Send a GET request, following redirects.
+
+        Returns the connection, the response and the final URL.
+        """
+        url = self.url
+        for _ in range(_max_redirects + 1):
+            parts = urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path = f"{path}?{parts.query}"
+
+            connection = _pool.get(parts.scheme, parts.netloc, self.timeout)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+            except (http.client.HTTPException, ConnectionError):
+                # The server may have closed an idle connection -> try again
+                # with a new one
+                connection.close()
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+
+            if response.status not in _redirect_status:
+                return connection, response, parts
+
+            response.read()
+            _pool.put(parts.scheme, parts.netloc, connection)
+            url = urljoin(url, response.getheader("Location"))
+
+        raise ConnectionError(f"Too many redirects when fetching {self.url}")
+
+    def fetch(self, destination):
+        """
+        Download the file to `destination` if it changed.
+
+        Parameters
+        ----------
+        destination : str | Path
+            The name of the downloaded file
+
+        Returns
+        -------
+        bool
+            True if a new file was downloaded and False if the file in
+            `destination` is up to date.
+
+        Raises
+        ------
+        ConnectionError
+            If the server answers with an unexpected status.
+        """
+        destination = Path(destination)
+        partial_filename = destination.with_name(destination.name + ".part")
+        state = self._read_state(destination)
+
+        headers = {"Accept-Encoding": "identity"}
+        if destination.exists():
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
+
+        # Resume an interrupted download, if the file did not change since
+        partial = state.get("partial", {})
+        offset = 0
+        if partial_filename.exists() and (partial.get("etag")
+                                          or partial.get("last_modified")):
+            offset = partial_filename.stat().st_size
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = partial.get("etag") or partial["last_modified"]
+
+        connection, response, parts = self._request(headers)
+        try:
+            changed = self._save_response(response, destination,
+                                          partial_filename, state, offset)
+        except BaseException:
+            connection.close()
+            raise
+
+        # The response was fully read and the connection can be reused
+        if response.will_close:
+            connection.close()
+        else:
+            _pool.put(parts.scheme, parts.netloc, connection)
+
+        if changed:
+            os.replace(partial_filename, destination)
+            self._write_state(destination, state["partial"])
+            logging.info("The download was finished!")
+        return changed
+
+    def _save_response(self, response, destination, partial_filename, state,
+                       offset):
+        """
+        Save the body of `response` in the partial file.
+
+        Returns False if the file did not change (the response is a 304).
+        """
+        if response.status == 304:
+            response.read()
+            logging.info("The data file did not change since last download")
+            return False
+
+        if response.status == 206:
+            content_range = response.getheader("Content-Range", "")
+            if not content_range.startswith(f"bytes {offset}-"):
+                raise ConnectionError(
+                    f"Unexpected Content-Range: {content_range}")
+            logging.info("Resuming download at byte %d", offset)
+            mode = "ab"
+        elif response.status == 200:
+            mode = "wb"
+        else:
+            response.read()
+            raise ConnectionError(
+                f"Could not fetch {self.url}: HTTP {response.status}")
+
+        state["partial"] = {
+            "etag": response.getheader("ETag"),
+            "last_modified": response.getheader("Last-Modified"),
+        }
+        self._write_state(destination, state)
+
+        with open(partial_filename, mode=mode) as f:
+            while True:
+                chunk = response.read(self.chunk_size)
+                if not chunk:
+                    break
+                f.write(chunk)
+
+        # `read(amt)` returns an empty chunk if the connection is closed early
+        if response.length:
+            raise http.client.IncompleteRead(b"", response.length)
+        return True
+
+
+class BrowserFetcher:
+    """
+    Download the data file clicking in the download button of the ministry page.
+
+    Parameters
+    ----------
+    source : Callable[[Path], Callable[[], None]]
+        The download source (see `covid19.download`)
+    timeout : float
+        Maximum time (in seconds) to wait for the download after it started
+    """
+    def __init__(self, source=firefox_download_source, timeout=60.0):
+        self.source = source
+        self.timeout = timeout
+
+    def fetch(self, destination):
+        """
+        Download the file to `destination`.
+
+        Parameters
+        ----------
+        destination : str | Path
+            The name of the downloaded file
+
+        Returns
+        -------
+        bool
+            Always True, since a new file is always downloaded.
+        """
+        download_covid_data(destination, self.source, self.timeout)
+        return True
+
+
+class FallbackFetcher:
+    """
+    Try each fetcher in order until one of them succeeds.
+
+    Parameters
+    ----------
+    *fetchers : object
+        The fetchers, in order of preference
+    """
+    def __init__(self, *fetchers):
+        self.fetchers = fetchers
+
+    def fetch(self, destination):
+        """
+        Download the file to `destination` with the first working fetcher.
+
+        Parameters
+        ----------
+        destination : str | Path
+            The name of the downloaded file
+
+        Returns
+        -------
+        bool
+            True if a new file was downloaded and False if the file in
+            `destination` is up to date.
+
+        Raises
+        ------
+        TimeoutError
+            If all fetchers failed.
+        """
+        for fetcher in self.fetchers:
+            try:
+                return fetcher.fetch(destination)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Could not fetch the data with %s",
+                                  type(fetcher).__name__)
+        raise TimeoutError("Could not download data from the internet")
+
+
+def get_default_fetcher():
+    """
+    Get the fetcher used when none is specified.
+
+    Returns
+    -------
+    object
+        A `FallbackFetcher` trying an `HttpFetcher` and then a `BrowserFetcher`
+        if the `COVID19_DATA_URL` environment variable is set, or a
+        `BrowserFetcher` otherwise.
+    """
+    url = os.environ.get("COVID19_DATA_URL")
+    if url:
+        return FallbackFetcher(HttpFetcher(url), BrowserFetcher())
+    return BrowserFetcher()
@@ -0,0 +1,243 @@
+"""
+Taxas de crescimento, tempos de duplicação e inclinações log-log.
+
+Todas as funções recebem um DataFrame com os dados derivados (obtidos com
+`get_brazil_data`, `get_all_states_data` ou `get_all_municipalities_data`) e
+calculam os resultados para todas as regiões de uma só vez, sem loops em
+Python. As regressões lineares em janelas móveis são calculadas com somas
+acumuladas: a soma de qualquer janela é a diferença entre duas posições da soma
+acumulada, de forma que o custo total é O(n) independente do tamanho da
+janela.
+"""
+import numpy as np
+import pandas as pd
+
+_nanossegundos_por_dia = 86_400 * 10**9
+
+
+def _ordena_por_grupo(df: pd.DataFrame, chave):
+    """
+    Ordena as linhas de `df` por `chave` e data.
+
+    Returns
+    -------
+    (np.ndarray, np.ndarray, np.ndarray)
+        A ordem das linhas, a data (em dias) de cada linha ordenada e o índice
+        da primeira linha do grupo de cada linha ordenada.
+    """
+    dias = pd.to_datetime(df["data"]).to_numpy(
+        dtype="datetime64[ns]").view("i8") // _nanossegundos_por_dia
+    if chave is None:
+        codigos = np.zeros(df.shape[0], dtype=int)
+    else:
+        codigos, _ = pd.factorize(df[chave], sort=True)
+    ordem = np.lexsort((dias, codigos))
+    codigos = codigos[ordem]
+
+    eh_inicio = np.ones(ordem.shape[0], dtype=bool)
+    eh_inicio[1:] = codigos[1:] != codigos[:-1]
+    inicios = np.flatnonzero(eh_inicio)
+    inicio_do_grupo = inicios[np.cumsum(eh_inicio) - 1]
+    return ordem, dias[ordem], inicio_do_grupo
+
+
+def _regressao_movel(x: np.ndarray, y: np.ndarray, valido: np.ndarray,
+                     inicio_do_grupo: np.ndarray, janela: int,
+                     min_pontos: int):
+    """
+    Inclinação da regressão linear de `y` em `x` em janelas móveis.
+
+    A janela de cada linha tem a própria linha e as `janela - 1` linhas
+    anteriores do mesmo grupo. Apenas as linhas em que `valido` é verdadeiro
+    são consideradas e a inclinação é NaN se a janela tiver menos que
+    `min_pontos` linhas válidas.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Variável independente
+    y : np.ndarray
+        Variável dependente
+    valido : np.ndarray
+        Array booleano com as linhas que entram na regressão
+    inicio_do_grupo : np.ndarray
+        Índice da primeira linha do grupo de cada linha (as linhas de cada
+        grupo devem estar contíguas)
+    janela : int
+        Número de linhas de cada janela
+    min_pontos : int
+        Número mínimo de linhas válidas em uma janela
+
+    Returns
+    -------
+    np.ndarray
+        A inclinação para cada linha.
+    """
+    x = np.where(valido, x, 0.0)
+    y = np.where(valido, y, 0.0)
+
+    fim = np.arange(1, x.shape[0] + 1)
+    inicio = np.maximum(fim - janela, inicio_do_grupo)
+
+    def soma_na_janela(valores):
+        acumulado = np.concatenate([[0.0], np.cumsum(valores, dtype=float)])
+        return acumulado[fim] - acumulado[inicio]
+
+    n = soma_na_janela(valido)
+    soma_x = soma_na_janela(x)
+    soma_y = soma_na_janela(y)
+    soma_xx = soma_na_janela(x * x)
+    soma_xy = soma_na_janela(x * y)
+
+    denominador = n * soma_xx - soma_x**2
+    numerador = n * soma_xy - soma_x * soma_y
+    ok = (n >= max(min_pontos, 2)) & (denominador > 0)
+    inclinacao = np.full(x.shape[0], np.nan)
+    inclinacao[ok] = numerador[ok] / denominador[ok]
+    return inclinacao
+
+
+def get_growth_rates(df: pd.DataFrame, chave=None, janela=7, min_pontos=None):
+    """
+    Calcula taxas de crescimento, tempos de duplicação e inclinações log-log.
+
+    Para cada linha, considerando a própria linha e as `janela - 1` anteriores
+    da mesma região:
+
+    - "taxaDeCrescimento": taxa de crescimento diária dos casos acumulados,
+      `exp(b) - 1`, sendo `b` a inclinação da regressão do logaritmo de
+      "casosAcumulado" no tempo (em dias)
+    - "tempoDeDuplicacao": tempo (em dias) para os casos acumulados dobrarem,
+      `log(2) / b` (infinito se os casos não aumentaram)
+    - "inclinacaoLogLog": inclinação da regressão de log("casosNovos") em
+      log("casosAcumulado"), como no gráfico de casos novos por casos
+      acumulados
+
+    Apenas as linhas com valores positivos entram nas regressões.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Os dados derivados (com a coluna "casosNovos")
+    chave : str, optional
+        Nome da coluna que identifica cada região (ex.: "estado" ou "codmun").
+        Se não for fornecido, os dados são de uma única região (ex.: Brasil).
+    janela : int
+        Número de dias de cada janela
+    min_pontos : int, optional
+        Número mínimo de linhas válidas em cada janela. O padrão é `janela`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Um DataFrame com as colunas `chave` (se fornecida), "data",
+        "taxaDeCrescimento", "tempoDeDuplicacao" e "inclinacaoLogLog",
+        ordenado por região e data.
+    """
+    if min_pontos is None:
+        min_pontos = janela
+    ordem, dias, inicio_do_grupo = _ordena_por_grupo(df, chave)
+
+    casos = df["casosAcumulado"].to_numpy(dtype=float, na_value=np.nan)[ordem]
+    novos = df["casosNovos"].to_numpy(dtype=float, na_value=np.nan)[ordem]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_casos = np.log(casos)
+        log_novos = np.log(novos)
+
+    # O tempo é contado a partir do primeiro dia de cada região para evitar
+    # somas muito grandes
+    tempo = (dias - dias[inicio_do_grupo]).astype(float)
+    inclinacao = _regressao_movel(tempo, log_casos, casos > 0,
+                                  inicio_do_grupo, janela, min_pontos)
+    inclinacao_log_log = _regressao_movel(log_casos, log_novos,
+                                          (casos > 0) & (novos > 0),
+                                          inicio_do_grupo, janela, min_pontos)
+
+    with np.errstate(divide="ignore"):
+        tempo_de_duplicacao = np.where(inclinacao > 0,
+                                       np.log(2) / inclinacao, np.inf)
+    tempo_de_duplicacao[np.isnan(inclinacao)] = np.nan
+
+    resultado = {}
+    if chave is not None:
+        resultado[chave] = df[chave].take(ordem).array
+    resultado.update({
+        "data": df["data"].take(ordem).to_numpy(),
+        "taxaDeCrescimento": np.expm1(inclinacao),
+        "tempoDeDuplicacao": tempo_de_duplicacao,
+        "inclinacaoLogLog": inclinacao_log_log,
+    })
+    return pd.DataFrame(resultado)
+
+
+def get_log_log_slopes(df: pd.DataFrame, chave=None, min_casos=100):
+    """
+    Ajusta uma reta a log10("casosNovos") por log10("casosAcumulado").
+
+    É a mesma regressão do gráfico de casos novos por casos acumulados,
+    considerando os dados a partir do primeiro dia com mais que `min_casos`
+    casos acumulados, mas feita para todas as regiões de uma só vez. Linhas sem
+    casos novos são ignoradas.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Os dados derivados (com a coluna "casosNovos")
+    chave : str, optional
+        Nome da coluna que identifica cada região (ex.: "estado" ou "codmun").
+        Se não for fornecido, os dados são de uma única região (ex.: Brasil).
+    min_casos : int
+        Número de casos acumulados a partir do qual a regressão é feita
+
+    Returns
+    -------
+    pd.DataFrame
+        Um DataFrame indexado pelas regiões com as colunas "inclinacao",
+        "intercepto" e "numPontos". Regiões com menos de dois pontos têm
+        inclinação e intercepto NaN.
+    """
+    ordem, _, inicio_do_grupo = _ordena_por_grupo(df, chave)
+    if ordem.shape[0] == 0:
+        return pd.DataFrame(columns=["inclinacao", "intercepto", "numPontos"])
+
+    casos = df["casosAcumulado"].to_numpy(dtype=float, na_value=np.nan)[ordem]
+    novos = df["casosNovos"].to_numpy(dtype=float, na_value=np.nan)[ordem]
+
+    # Posição da primeira linha com mais que `min_casos` casos em cada grupo
+    inicios = np.unique(inicio_do_grupo)
+    posicao = np.arange(ordem.shape[0])
+    sem_casos = ordem.shape[0]
+    primeira = np.minimum.reduceat(
+        np.where(casos > min_casos, posicao, sem_casos), inicios)
+    grupo = np.searchsorted(inicios, inicio_do_grupo)
+    valido = (posicao >= primeira[grupo]) & (casos > 0) & (novos > 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.where(valido, np.log10(casos), 0.0)
+        y = np.where(valido, np.log10(novos), 0.0)
+
+    def soma(valores):
+        return np.add.reduceat(valores.astype(float), inicios)
+
+    n = soma(valido)
+    soma_x = soma(x)
+    soma_y = soma(y)
+    denominador = n * soma(x * x) - soma_x**2
+    ok = (n >= 2) & (denominador > 0)
+
+    inclinacao = np.full(inicios.shape[0], np.nan)
+    inclinacao[ok] = (n * soma(x * y) - soma_x * soma_y)[ok] / denominador[ok]
+    intercepto = np.full(inicios.shape[0], np.nan)
+    intercepto[ok] = (soma_y[ok] - inclinacao[ok] * soma_x[ok]) / n[ok]
+
+    if chave is None:
+        indice = pd.RangeIndex(1)
+    else:
+        indice = pd.Index(df[chave].take(ordem[inicios]).array, name=chave)
+    return pd.DataFrame(
+        {
+            "inclinacao": inclinacao,
+            "intercepto": intercepto,
+            "numPontos": n.astype(int),
+        },
+        index=indice)
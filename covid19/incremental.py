@@ -0,0 +1,273 @@
+"""
+Incremental update of the derived data (Brazil, states and municipalities).
+
+The file provided by the ministry of health always has the whole history, but
+from one day to the next only the rows for the new dates change. The
+`DerivedDataStore` keeps the derived frames returned by `get_brazil_data`,
+`get_all_states_data` and `get_all_municipalities_data` together with the last
+row of each region. When new data arrives only the rows with dates after the
+last processed date are derived, and their "casosNovos", "obitosNovos" and
+"diasDeContaminacao_*" columns are corrected with the last known values of each
+region.
+
+A fingerprint of the history of each region (see
+`covid19.quality.get_history_fingerprint`) is kept as well. If the fingerprint
+of the dates already processed differs in the new data the ministry restated
+the history and the level is derived again from scratch.
+
+For data cleaned by `covid19.quality.clean_levels` the level and the date of
+each row found when cleaning are reused (see `covid19.quality.get_levels`), so
+that an update only hashes the history and derives the new rows.
+"""
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .covid import (get_all_municipalities_data, get_all_states_data,
+                    get_brazil_data)
+from .quality import (LEVELS, add_history_fingerprints, clean_levels,
+                      get_days, get_history_fingerprint, get_levels,
+                      is_cleaned, to_days)
+from .schema import apply_schema, concat_frames
+
+# For each level, the function deriving the data, the column identifying a
+# region (Brazil data has a single region) and whether the derived data is
+# sorted by region (otherwise the regions are in the order of the data file)
+_levels = {
+    "brasil": (get_brazil_data, None, False),
+    "estados": (get_all_states_data, "estado", False),
+    "municipios": (get_all_municipalities_data, "codmun", True),
+}
+
+_last_row_columns = [
+    "data", "casosAcumulado", "obitosAcumulado", "diasDeContaminacao_1",
+    "diasDeContaminacao_100"
+]
+
+
+def _get_keys(frame: pd.DataFrame, key):
+    """Get the region of each row of `frame` as a numpy array"""
+    if key is None:
+        return np.zeros(frame.shape[0], dtype=int)
+    return frame[key].to_numpy()
+
+
+def _get_last_rows(frame: pd.DataFrame, key):
+    """
+    Get the last row of each region in `frame`.
+
+    The rows of each region are assumed to be in date order.
+    """
+    keys = _get_keys(frame, key)
+    is_last = ~pd.Series(keys).duplicated(keep="last").to_numpy()
+    last_rows = frame.loc[is_last, _last_row_columns]
+    last_rows.index = pd.Index(keys[is_last], name="regiao")
+    return last_rows
+
+
+class DerivedDataStore:
+    """
+    Derived data for Brazil, states and municipalities updated incrementally.
+
+    Parameters
+    ----------
+    levels : tuple[str]
+        The levels that are derived. Possible levels are "brasil", "estados"
+        and "municipios".
+
+    Attributes
+    ----------
+    frames : dict[str, pd.DataFrame]
+        The derived data of each level. The rows for new dates are appended at
+        the end of each DataFrame.
+    """
+    def __init__(self, levels=("brasil", "estados", "municipios")):
+        unknown = set(levels) - set(_levels)
+        if unknown:
+            raise ValueError(f"Unknown levels: {sorted(unknown)}")
+        self.levels = tuple(levels)
+        self.frames = {}
+        self._last_rows = {}
+        self._fingerprints = {}
+
+    def update(self, data: pd.DataFrame, levels=None):
+        """
+        Update the derived data with the (full) data from the ministry.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            The data as returned by `covid19.scrap.read_datafile_from_disc`
+        levels : tuple[str], optional
+            The levels that are updated (the default is all levels of the
+            store)
+
+        Returns
+        -------
+        dict[str, pd.DataFrame]
+            The derived data of each level.
+        """
+        levels = self.levels if levels is None else tuple(levels)
+        unknown = set(levels) - set(self.levels)
+        if unknown:
+            raise ValueError(f"Unknown levels: {sorted(unknown)}")
+        if not is_cleaned(data):
+            data, _ = clean_levels(data)
+        row_levels = get_levels(data)
+        days = get_days(data)
+        for level in levels:
+            is_level = row_levels == LEVELS.index(level)
+            if level not in self.frames or not self._update_level(
+                    level, data, is_level, days):
+                self._rebuild_level(level, data, is_level, days)
+        return self.frames
+
+    def _rebuild_level(self, level, data, is_level, days):
+        """Derive the data of `level` from scratch"""
+        get_level_data, key, _ = _levels[level]
+        logging.info("Deriving %s data from scratch", level)
+        self.frames[level] = get_level_data(data)
+        self._last_rows[level] = _get_last_rows(self.frames[level], key)
+        self._fingerprints[level] = get_history_fingerprint(data,
+                                                            key,
+                                                            mask=is_level,
+                                                            days=days)
+
+    def _update_level(self, level, data, is_level, days):
+        """
+        Derive only the rows of `level` with new dates.
+
+        `is_level` tells the rows of `data` in `level` and `days` has the date
+        of each row (in days since 1970-01-01).
+
+        Returns False if the history was restated and the level must be
+        derived from scratch.
+        """
+        get_level_data, key, sort_regions = _levels[level]
+        last_rows = self._last_rows[level]
+        if last_rows.empty or level not in self._fingerprints:
+            return False
+        last_date = last_rows.data.max()
+        last_day = to_days([last_date])[0]
+
+        # xxxxxxxxxx Check if the history was restated xxxxxxxxxxxxxxxxxxxxxxxxx
+        fingerprint = get_history_fingerprint(data,
+                                              key,
+                                              mask=is_level
+                                              & (days <= last_day),
+                                              days=days)
+        if not fingerprint.equals(self._fingerprints[level]):
+            logging.warning(
+                "The %s data up to %s changed -> deriving it again", level,
+                last_date)
+            return False
+        # xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+
+        window = get_level_data(data[days >= last_day])
+        keys = _get_keys(window, key)
+        dates = window.data.to_numpy()
+        is_new = dates > last_date
+        if not is_new.any():
+            return True
+        new = window[is_new].copy()
+        keys = keys[is_new]
+
+        # Last known row of the region of each new row (NaN for new regions)
+        last = last_rows.reindex(keys)
+        is_first = ~pd.Series(keys).duplicated().to_numpy()
+        position = pd.Series(keys).groupby(keys).cumcount().to_numpy() + 1
+
+        # The first new row of each known region was derived as if it was the
+        # first row of the region
+        fix = np.flatnonzero(is_first & last.casosAcumulado.notna().to_numpy())
+        for new_column, cumulative_column in (("casosNovos", "casosAcumulado"),
+                                              ("obitosNovos",
+                                               "obitosAcumulado")):
+            new.iloc[fix, new.columns.get_loc(new_column)] = (
+                new[cumulative_column].to_numpy()[fix] -
+                last[cumulative_column].to_numpy()[fix])
+
+        # Regions that were already contaminated keep counting the days
+        for column in ("diasDeContaminacao_1", "diasDeContaminacao_100"):
+            last_days = last[column].to_numpy(dtype=float)
+            fix = np.flatnonzero(last_days > 0)
+            new.iloc[fix, new.columns.get_loc(column)] = (
+                last_days[fix] + position[fix]).astype(int)
+
+        logging.info("Deriving %d new rows of %s data", new.shape[0], level)
+        frame = concat_frames([self.frames[level], new])
+        if key is not None:
+            # The rows of each region are kept together, in the same order as
+            # when the level is derived from scratch
+            codes, _ = pd.factorize(frame[key], sort=sort_regions)
+            frame = frame.iloc[np.argsort(codes, kind="stable")]
+        self.frames[level] = frame
+        self._fingerprints[level] = add_history_fingerprints(
+            fingerprint,
+            get_history_fingerprint(data,
+                                    key,
+                                    mask=is_level & (days > last_day),
+                                    days=days))
+        new_last_rows = _get_last_rows(new, key)
+        self._last_rows[level] = pd.concat([
+            last_rows.drop(new_last_rows.index, errors="ignore"),
+            new_last_rows
+        ])
+        return True
+
+    def save(self, directory):
+        """
+        Save the derived data as Parquet files in `directory`.
+
+        Parameters
+        ----------
+        directory : str | Path
+            The directory where the files are saved
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for level, frame in self.frames.items():
+            frame.to_parquet(directory / f"{level}.parquet")
+            self._last_rows[level].to_parquet(directory /
+                                              f"{level}_last.parquet")
+            self._fingerprints[level].rename_axis("regiao").reset_index(
+            ).to_parquet(directory / f"{level}_fingerprint.parquet")
+
+    @classmethod
+    def load(cls, directory, levels=("brasil", "estados", "municipios")):
+        """
+        Load the derived data saved with `save`.
+
+        Levels without saved data are derived from scratch in the next
+        `update`.
+
+        Parameters
+        ----------
+        directory : str | Path
+            The directory where the files were saved
+        levels : tuple[str]
+            The levels that are derived
+
+        Returns
+        -------
+        DerivedDataStore
+            The loaded store
+        """
+        store = cls(levels)
+        directory = Path(directory)
+        for level in store.levels:
+            filename = directory / f"{level}.parquet"
+            last_filename = directory / f"{level}_last.parquet"
+            fingerprint_filename = directory / f"{level}_fingerprint.parquet"
+            if (filename.exists() and last_filename.exists()
+                    and fingerprint_filename.exists()):
+                store.frames[level] = apply_schema(pd.read_parquet(filename))
+                store._last_rows[level] = pd.read_parquet(last_filename)
+                fingerprint = pd.read_parquet(fingerprint_filename).set_index(
+                    "regiao")
+                fingerprint.index = fingerprint.index.astype(object)
+                fingerprint.index.name = None
+                store._fingerprints[level] = fingerprint
+        return store
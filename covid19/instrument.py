@@ -0,0 +1,258 @@
+"""
+Timing and memory instrumentation of the stages of the pipeline.
+
+The main stages (download, parsing of the spreadsheet, conversion of dates,
+removal of duplicates and derivation of each level) run inside
+`instrumentation.stage(...)`. Each stage produces a `StageRecord` with its
+wall time, the number of rows it processed and (optionally) its peak memory.
+The records are kept in memory (see `Instrumentation.report`) and passed to
+the registered hooks, which can forward them to a metrics system::
+
+    from covid19.instrument import instrumentation
+
+    instrumentation.track_memory = True
+    instrumentation.add_hook(lambda record: statsd.timing(record.name,
+                                                          record.wall_time))
+
+Tracking memory uses `tracemalloc`, which makes the code slower, and is then
+disabled by default. `tracemalloc` measures the memory of the whole process,
+so the peak of a stage includes what stages running at the same time in other
+threads allocated.
+"""
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+class StageRecord:
+    """
+    Measurements of one run of a stage.
+
+    Attributes
+    ----------
+    name : str
+        The name of the stage
+    parent : str | None
+        The name of the stage in which this stage ran, if any
+    rows : int | None
+        The number of rows processed, if known
+    wall_time : float
+        The wall time in seconds
+    peak_memory : int | None
+        The peak of memory allocated during the stage (in bytes, relative to
+        the memory allocated when it started), or None if memory is not
+        tracked
+    """
+    def __init__(self, name, parent=None, rows=None):
+        self.name = name
+        self.parent = parent
+        self.rows = rows
+        self.wall_time = None
+        self.peak_memory = None
+
+    def as_dict(self):
+        """Get the measurements as a dictionary"""
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "rows": self.rows,
+            "wall_time": self.wall_time,
+            "peak_memory": self.peak_memory,
+        }
+
+    def __repr__(self):
+        return (f"StageRecord(name={self.name!r}, rows={self.rows}, "
+                f"wall_time={self.wall_time}, "
+                f"peak_memory={self.peak_memory})")
+
+
+class Instrumentation:
+    """
+    Collect the measurements of the stages of the pipeline.
+
+    Parameters
+    ----------
+    track_memory : bool
+        If True, the peak memory of each stage is measured with `tracemalloc`
+    max_records : int
+        Maximum number of records kept (the oldest ones are discarded)
+    """
+    def __init__(self, track_memory=False, max_records=1000):
+        self.track_memory = track_memory
+        self.records = deque(maxlen=max_records)
+        self._hooks = []
+        self._local = threading.local()
+
+    def add_hook(self, hook):
+        """
+        Register a function called with each `StageRecord` when it finishes.
+
+        The exceptions raised by the hook are logged and otherwise ignored.
+
+        Parameters
+        ----------
+        hook : Callable[[StageRecord], None]
+            The function
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        Remove a function registered with `add_hook`.
+
+        Parameters
+        ----------
+        hook : Callable[[StageRecord], None]
+            The function
+        """
+        self._hooks.remove(hook)
+
+    def _get_stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Measure the code inside a `with` block as the stage `name`.
+
+        The `StageRecord` is returned by the context manager, such that the
+        number of rows can be set inside the block (`record.rows = ...`).
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage
+        rows : int, optional
+            The number of rows processed
+
+        Yields
+        ------
+        StageRecord
+            The record of the stage, completed when the block finishes.
+        """
+        stack = self._get_stack()
+        record = StageRecord(name, stack[-1].name if stack else None, rows)
+
+        track_memory = self.track_memory
+        memory_at_start = _start_tracking(record) if track_memory else None
+        stack.append(record)
+
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.wall_time = time.perf_counter() - start
+            stack.pop()
+            if track_memory:
+                peak = _stop_tracking(record)
+                record.peak_memory = max(peak - memory_at_start, 0)
+
+            self.records.append(record)
+            for hook in list(self._hooks):
+                # A failing hook must neither abort the stage nor hide the
+                # exception raised inside it
+                try:
+                    hook(record)
+                except Exception:  # pylint: disable=broad-except
+                    logging.exception("The hook %r failed on the stage %s",
+                                      hook, record.name)
+
+    def report(self):
+        """
+        Get the records as a DataFrame.
+
+        Returns
+        -------
+        pd.DataFrame
+            A DataFrame with one row per record and the columns "name",
+            "parent", "rows", "wall_time" and "peak_memory".
+        """
+        return pd.DataFrame(
+            [record.as_dict() for record in self.records],
+            columns=["name", "parent", "rows", "wall_time", "peak_memory"])
+
+    def clear(self):
+        """Discard all records"""
+        self.records.clear()
+
+
+# `tracemalloc` is global to the process. The stages tracking memory (in any
+# thread) share the tracing, which is stopped when the last one finishes, and
+# the peak reached by each of them so far is kept here whenever the global peak
+# is restarted.
+_memory_lock = threading.Lock()
+_memory_peaks = {}
+_started_tracing = False
+
+
+def _start_tracking(record):
+    """Start tracking the memory of a stage, returning the current memory"""
+    global _started_tracing
+    with _memory_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        if hasattr(tracemalloc, "reset_peak"):
+            # Python >= 3.9. Otherwise the peak is the one since tracing
+            # started.
+            peak = tracemalloc.get_traced_memory()[1]
+            for other in _memory_peaks:
+                _memory_peaks[other] = max(_memory_peaks[other], peak)
+            tracemalloc.reset_peak()
+        _memory_peaks[record] = 0
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracking(record):
+    """Stop tracking the memory of a stage, returning its (absolute) peak"""
+    global _started_tracing
+    with _memory_lock:
+        peak = max(_memory_peaks.pop(record),
+                   tracemalloc.get_traced_memory()[1])
+        if not _memory_peaks and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+        return peak
+
+
+# The instrumentation used by the covid19 package
+instrumentation = Instrumentation()
+
+
+def instrumented(name, rows=None):
+    """
+    Decorator measuring each call of a function as the stage `name`.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage
+    rows : Callable[[Any], int], optional
+        Function returning the number of rows from the result of the decorated
+        function (e.g. `len`)
+
+    Returns
+    -------
+    Callable
+        The decorator.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with instrumentation.stage(name) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    record.rows = rows(result)
+            return result
+
+        return wrapper
+
+    return decorator
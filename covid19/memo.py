@@ -0,0 +1,181 @@
+"""
+In-process memoization of the data read from disk and of the derived data.
+
+Long-running processes (e.g. a web service) call `get_covid_data` and the
+functions in `covid19.covid` over and over, although the data only changes
+once a day. The `FrameCache` keeps the results in memory, keyed on the identity
+of the source file (see `get_file_key`), such that they are computed again
+only when the file changes.
+
+The cache is bounded: the least recently used entries are evicted once there
+are more than `maxsize` of them (or once their total size exceeds `maxbytes`),
+and entries older than `ttl` seconds are computed again. Cached DataFrames are
+shared between callers. Each caller gets a shallow copy, which is cheap and
+allows adding or replacing columns, but the values must not be modified in
+place.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+import pandas as pd
+
+CacheStats = namedtuple("CacheStats", ["hits", "misses", "evictions", "size"])
+
+
+def get_file_key(filename):
+    """
+    Get the identity of a file, which changes whenever the file is written.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the file
+
+    Returns
+    -------
+    (str, int, int)
+        The absolute name, the size and the modification time (in nanoseconds)
+        of the file.
+    """
+    filepath = Path(filename).resolve()
+    stat = filepath.stat()
+    return str(filepath), stat.st_size, stat.st_mtime_ns
+
+
+def _get_nbytes(value):
+    """Approximate size in bytes of a cached value"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, dict):
+        return sum(_get_nbytes(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+def _view(value):
+    """Get a shallow copy of the cached DataFrames in `value`"""
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=False)
+    if isinstance(value, dict):
+        return {key: _view(item) for key, item in value.items()}
+    return value
+
+
+class FrameCache:
+    """
+    LRU cache with expiration for DataFrames (or dicts of DataFrames).
+
+    Parameters
+    ----------
+    maxsize : int | None
+        Maximum number of entries. If None, the number of entries is not
+        bounded.
+    ttl : float | None
+        Time (in seconds) after which an entry is computed again. If None,
+        entries only leave the cache when evicted.
+    clock : Callable[[], float]
+        The clock used for the expiration
+    maxbytes : int | None
+        Maximum total size in bytes of the entries (e.g. the length of
+        `bytes` values). Values larger than that are not cached. If None, the
+        size of the entries is not bounded.
+    """
+    def __init__(self,
+                 maxsize=16,
+                 ttl=None,
+                 clock=time.monotonic,
+                 maxbytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def stats(self):
+        """CacheStats: The number of hits, misses and evictions so far"""
+        with self._lock:
+            return CacheStats(self._hits, self._misses, self._evictions,
+                              len(self._entries))
+
+    def get_or_compute(self, key, compute):
+        """
+        Get the value for `key`, calling `compute()` if it is not cached.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key of the value, which must change whenever the value changes
+            (e.g. include the result of `get_file_key`)
+        compute : Callable[[], Any]
+            Function computing the value
+
+        Returns
+        -------
+        Any
+            The value. DataFrames are returned as shallow copies of the cached
+            ones.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return _view(entry[0])
+            self._misses += 1
+
+        # The value is computed without holding the lock, such that other keys
+        # can still be read in the meantime
+        value = compute()
+
+        nbytes = 0 if self.maxbytes is None else _get_nbytes(value)
+        if self.maxbytes is not None and nbytes > self.maxbytes:
+            return _view(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, self._clock(), nbytes)
+            self._nbytes += nbytes
+            while ((self.maxsize is not None
+                    and len(self._entries) > self.maxsize)
+                   or (self.maxbytes is not None
+                       and self._nbytes > self.maxbytes)):
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+        return _view(value)
+
+    @property
+    def nbytes(self):
+        """int: Total size in bytes of the entries (if `maxbytes` is set)"""
+        with self._lock:
+            return self._nbytes
+
+    def _remove(self, key):
+        self._nbytes -= self._entries.pop(key)[2]
+
+    def _is_expired(self, entry):
+        return self.ttl is not None and self._clock() - entry[1] > self.ttl
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self._hits = self._misses = self._evictions = 0
+
+
+# The cache used by `covid19.scrap`
+frame_cache = FrameCache()
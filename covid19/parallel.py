@@ -0,0 +1,274 @@
+"""
+Parallel computations over the regions (states or municipalities) of the data.
+
+The data of each region is independent, so the work can be split among
+processes. `map_regions` sorts the rows by region and copies the columns once
+to a shared memory block (`multiprocessing.shared_memory`). Each task only
+receives the name of the block and the range of rows of its partition, which
+always has whole regions, instead of a pickled DataFrame. Columns that are not
+plain numpy arrays (e.g. names and dates) are shared as integer codes, whose
+(small) list of unique values is sent with the task.
+
+The results are returned in the order of the partitions, that is, in the order
+of the regions, independently of which process finished first.
+"""
+import concurrent.futures
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from .covid import get_all_municipalities_data, get_all_states_data
+from .quality import LEVELS, classify_levels
+from .schema import concat_frames
+
+_alignment = 64
+
+
+def _encode(values):
+    """
+    Convert `values` (Series or Index) to a numpy array that can be shared.
+
+    Returns the array and a tuple with what is needed to decode it.
+    """
+    if isinstance(values.dtype, CategoricalDtype):
+        return np.asarray(values.array.codes), ("categorical", values.dtype)
+    dtype = values.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        return values.to_numpy(), ("numpy", None)
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and hasattr(
+            dtype, "numpy_dtype"):
+        # Nullable integers (e.g. Int32) are shared as floats
+        return values.to_numpy(dtype=float, na_value=np.nan), ("nullable",
+                                                               dtype)
+    codes, uniques = pd.factorize(values)
+    return codes, ("factorized", np.asarray(uniques, dtype=object))
+
+
+def _decode(array, encoding):
+    """Convert an array returned by `_encode` back to the original values"""
+    kind, extra = encoding
+    if kind == "categorical":
+        return pd.Categorical.from_codes(array, dtype=extra)
+    if kind == "nullable":
+        return pd.array(array, dtype=extra)
+    if kind == "factorized":
+        values = extra.take(np.maximum(array, 0)) if len(extra) else np.full(
+            array.shape[0], None, dtype=object)
+        values[array < 0] = None
+        return values
+    return array
+
+
+class _SharedFrame:
+    """
+    The columns (and index) of a DataFrame copied to a shared memory block.
+
+    Only the description of the columns (`specs`) and the name of the block
+    are pickled when sent to another process.
+    """
+    def __init__(self, data: pd.DataFrame, order: np.ndarray):
+        arrays = [_encode(data.index)]
+        arrays.extend(_encode(data[column]) for column in data.columns)
+
+        self.num_rows = order.shape[0]
+        self.columns = list(data.columns)
+        self.index_name = data.index.name
+        self.specs = []
+        offset = 0
+        for array, encoding in arrays:
+            self.specs.append((offset, array.dtype.str, encoding))
+            # Each column starts at an aligned offset
+            size = array.dtype.itemsize * self.num_rows
+            offset += -(-size // _alignment) * _alignment
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        try:
+            for (array, _), (offset, dtype, _) in zip(arrays, self.specs):
+                shared = np.ndarray(self.num_rows,
+                                    dtype=dtype,
+                                    buffer=self.shm.buf,
+                                    offset=offset)
+                np.take(array, order, out=shared)
+        except BaseException:
+            self.close()
+            raise
+
+    def __getstate__(self):
+        return {
+            "num_rows": self.num_rows,
+            "columns": self.columns,
+            "index_name": self.index_name,
+            "specs": self.specs,
+            "name": self.shm.name,
+        }
+
+    def __setstate__(self, state):
+        name = state.pop("name")
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=name)
+
+    def get_rows(self, start, stop):
+        """Get a DataFrame with a copy of the rows from `start` to `stop`"""
+        arrays = []
+        for offset, dtype, encoding in self.specs:
+            shared = np.ndarray(self.num_rows,
+                                dtype=dtype,
+                                buffer=self.shm.buf,
+                                offset=offset)
+            arrays.append(_decode(shared[start:stop].copy(), encoding))
+        index = pd.Index(arrays[0], name=self.index_name)
+        return pd.DataFrame(dict(zip(self.columns, arrays[1:])),
+                            index=index,
+                            columns=self.columns)
+
+    def close(self, unlink=True):
+        """Release the shared memory (and destroy it if `unlink`)"""
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _run_partition(func, shared_frame, start, stop, args):
+    """Run `func` in the rows from `start` to `stop` (in a worker process)"""
+    try:
+        partition = shared_frame.get_rows(start, stop)
+    finally:
+        shared_frame.close(unlink=False)
+    return func(partition, *args)
+
+
+def _get_partitions(group_starts, num_rows, num_partitions):
+    """
+    Split the rows into at most `num_partitions` ranges with whole groups.
+
+    The ranges have approximately the same number of rows.
+    """
+    targets = np.linspace(0, num_rows, num_partitions + 1)[1:-1]
+    bounds = group_starts[np.searchsorted(group_starts, targets)
+                          .clip(max=group_starts.shape[0] - 1)]
+    bounds = np.unique(np.concatenate([[0], bounds, [num_rows]]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def map_regions(func,
+                data: pd.DataFrame,
+                key,
+                args=(),
+                max_workers=None,
+                partitions_per_worker=4,
+                executor=None,
+                mask=None):
+    """
+    Call `func` for groups of regions of `data` in parallel processes.
+
+    The rows of `data` are sorted by `key` (keeping the original order of the
+    rows of each region) and split into partitions with whole regions and
+    approximately the same number of rows. Rows without a value in `key` (or
+    not in `mask`) are not passed to `func`, nor copied to the shared memory.
+
+    Parameters
+    ----------
+    func : Callable[[pd.DataFrame, ...], Any]
+        Function called as `func(partition, *args)`. It must be defined at the
+        top level of a module, such that it can be sent to other processes.
+    data : pd.DataFrame
+        The data
+    key : str
+        The column identifying the regions (e.g. "estado" or "codmun")
+    args : tuple
+        Extra arguments passed to `func`
+    max_workers : int, optional
+        Number of processes. Defaults to the number of CPUs.
+    partitions_per_worker : int
+        Number of partitions for each process. More partitions balance the
+        work better when regions have very different sizes.
+    executor : concurrent.futures.Executor, optional
+        The executor used to run `func`. If not provided, a process pool with
+        `max_workers` processes is created (and shut down at the end).
+    mask : np.ndarray, optional
+        Boolean array with the rows of `data` that are used (e.g. the rows of
+        a single level). If not provided, all rows are used.
+
+    Returns
+    -------
+    list
+        The result of `func` for each partition, in the order of the regions.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    codes, _ = pd.factorize(data[key], sort=True)
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    if mask is not None:
+        order = order[mask[order]]
+    if order.shape[0] == 0:
+        return []
+    codes = codes[order]
+    group_starts = np.flatnonzero(
+        np.concatenate([[True], codes[1:] != codes[:-1]]))
+    partitions = _get_partitions(group_starts, order.shape[0],
+                                 max_workers * partitions_per_worker)
+
+    shared_frame = _SharedFrame(data, order)
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers)
+    try:
+        futures = [
+            executor.submit(_run_partition, func, shared_frame, start, stop,
+                            args) for start, stop in partitions
+        ]
+        return [future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
+        shared_frame.close()
+
+
+_parallel_levels = {
+    "estados": (get_all_states_data, "estado"),
+    "municipios": (get_all_municipalities_data, "codmun"),
+}
+
+
+def get_level_data_in_parallel(data: pd.DataFrame,
+                               level,
+                               max_workers=None,
+                               executor=None):
+    """
+    Get the derived data for all states or municipalities in parallel.
+
+    The result has the same rows and columns as `get_all_states_data` or
+    `get_all_municipalities_data`, with the rows ordered by region.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data as returned by `covid19.scrap.read_datafile_from_disc`
+    level : str
+        Either "estados" or "municipios"
+    max_workers : int, optional
+        Number of processes. Defaults to the number of CPUs.
+    executor : concurrent.futures.Executor, optional
+        See `map_regions`
+
+    Returns
+    -------
+    pd.DataFrame
+        The derived data.
+    """
+    get_level_data, key = _parallel_levels[level]
+    # Only the rows of the level are sent to the workers
+    frames = map_regions(get_level_data,
+                         data,
+                         key,
+                         max_workers=max_workers,
+                         executor=executor,
+                         mask=classify_levels(data) == LEVELS.index(level))
+    if not frames:
+        return get_level_data(data)
+    return concat_frames(frames)
@@ -0,0 +1,500 @@
+"""
+Cleaning of the data of all levels in a single pass, with a data-quality report.
+
+The file provided by the ministry has rows for Brazil, for each state and for
+each municipality, and sometimes more than one row for the same region and
+date. `clean_levels` classifies each row into one of these levels once, sorts
+all rows by level, region and date with a single (stable) sort and drops the
+duplicated rows, keeping the first one as the getters in `covid19.covid` do.
+The same sorted order is used to check that the cumulative counts never
+decrease and that there are no gaps in the dates of each region.
+
+What was found is returned in a `QualityReport`, instead of only being logged.
+"""
+import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+
+LEVELS = ("brasil", "estados", "municipios")
+
+# The column identifying the regions of each level
+_region_columns = {
+    "brasil": "regiao",
+    "estados": "estado",
+    "municipios": "codmun"
+}
+_cumulative_columns = ("casosAcumulado", "obitosAcumulado")
+
+# Key in `DataFrame.attrs` with the report of data cleaned by `clean_levels`
+REPORT_ATTR = "quality_report"
+# Key in `DataFrame.attrs` with the level of each row of data cleaned by
+# `clean_levels` (see `get_levels`)
+LEVELS_ATTR = "levels"
+
+_report_frames = ("duplicates", "negative_deltas", "date_gaps")
+
+
+class _RowLevels:
+    """
+    The levels and dates (in days since 1970-01-01) of the rows with the given
+    index, as kept in `DataFrame.attrs`.
+
+    It is never modified, such that copies of the attrs made by pandas can
+    share it, and it is only equal to itself.
+    """
+    __slots__ = ("index", "levels", "days")
+
+    def __init__(self, index, levels, days):
+        self.index = index
+        self.levels = levels
+        self.days = days
+        self.levels.flags.writeable = False
+        self.days.flags.writeable = False
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def _to_json_value(value):
+    """Convert numpy scalars to the equivalent Python objects"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class QualityReport:
+    """
+    Problems found in the data by `clean_levels`.
+
+    Attributes
+    ----------
+    duplicates : pd.DataFrame
+        One row for each dropped row, with the columns "level", "region" and
+        "date"
+    negative_deltas : pd.DataFrame
+        One row for each day in which a cumulative count decreased, with the
+        columns "level", "region", "date", "column" and "delta"
+    date_gaps : pd.DataFrame
+        One row for each gap in the dates of a region, with the columns
+        "level", "region", "date" (the first date after the gap) and
+        "missing_days"
+    """
+    def __init__(self, duplicates, negative_deltas, date_gaps):
+        self.duplicates = duplicates
+        self.negative_deltas = negative_deltas
+        self.date_gaps = date_gaps
+
+    @property
+    def is_clean(self):
+        """bool: True if no problems were found"""
+        return (self.duplicates.empty and self.negative_deltas.empty
+                and self.date_gaps.empty)
+
+    def summary(self):
+        """
+        Get the number of problems of each kind in each level.
+
+        Returns
+        -------
+        pd.DataFrame
+            A DataFrame indexed by the levels with the columns "duplicates",
+            "negative_deltas" and "date_gaps".
+        """
+        return pd.DataFrame({
+            name: frame.level.value_counts().reindex(LEVELS, fill_value=0)
+            for name, frame in (("duplicates", self.duplicates),
+                                ("negative_deltas", self.negative_deltas),
+                                ("date_gaps", self.date_gaps))
+        })
+
+    def to_dict(self):
+        """
+        Convert the report to a dictionary which can be saved as JSON.
+
+        Returns
+        -------
+        dict[str, dict[str, list]]
+            The columns of each DataFrame of the report, with the dates in ISO
+            format.
+        """
+        content = {}
+        for name in _report_frames:
+            frame = getattr(self, name)
+            columns = {
+                column: [_to_json_value(value) for value in frame[column]]
+                for column in frame
+            }
+            columns["date"] = [date.isoformat() for date in columns["date"]]
+            content[name] = columns
+        return content
+
+    @classmethod
+    def from_dict(cls, content):
+        """
+        Create a report from a dictionary returned by `to_dict`.
+
+        Parameters
+        ----------
+        content : dict[str, dict[str, list]]
+            The columns of each DataFrame of the report
+
+        Returns
+        -------
+        QualityReport
+            The report.
+        """
+        frames = {}
+        for name in _report_frames:
+            columns = dict(content[name])
+            columns["date"] = [
+                datetime.date.fromisoformat(date) for date in columns["date"]
+            ]
+            frames[name] = pd.DataFrame(columns)
+        return cls(**frames)
+
+    def __repr__(self):
+        return (f"QualityReport(duplicates={self.duplicates.shape[0]}, "
+                f"negative_deltas={self.negative_deltas.shape[0]}, "
+                f"date_gaps={self.date_gaps.shape[0]})")
+
+
+def to_days(dates):
+    """
+    Convert dates (e.g. `datetime.date` objects) to days since 1970-01-01.
+
+    Parameters
+    ----------
+    dates : pd.Series | list
+        The dates
+
+    Returns
+    -------
+    np.ndarray
+        The number of days since 1970-01-01 of each date.
+    """
+    return pd.to_datetime(dates).to_numpy(
+        dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+
+
+def classify_levels(data: pd.DataFrame):
+    """
+    Get the level of each row of `data`.
+
+    Rows of Brazil have "Brasil" in the "regiao" column, rows of municipalities
+    have a "codmun" and rows of states have an "estado" but no "codmun".
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data
+
+    Returns
+    -------
+    np.ndarray
+        The position in `LEVELS` of the level of each row, or -1 for rows that
+        are not from any level.
+    """
+    is_brazil = (data.regiao == "Brasil").to_numpy(dtype=bool, na_value=False)
+    is_city = data.codmun.notna().to_numpy()
+    is_state = ~is_brazil & ~is_city & data.estado.notna().to_numpy()
+    levels = np.full(data.shape[0], -1, dtype=np.int8)
+    levels[is_brazil] = LEVELS.index("brasil")
+    levels[is_state] = LEVELS.index("estados")
+    levels[is_city] = LEVELS.index("municipios")
+    return levels
+
+
+def _get_row_levels(data):
+    """The levels kept by `clean_levels`, if `data` still has the same rows"""
+    stored = data.attrs.get(LEVELS_ATTR)
+    # pandas copies the attrs to frames with other rows (e.g. slices or
+    # concatenations), but views and copies of the same rows share the index
+    if isinstance(stored, _RowLevels) and stored.index.is_(data.index):
+        return stored
+    return None
+
+
+def get_levels(data: pd.DataFrame):
+    """
+    Get the level of each row of `data`, classifying the rows only if needed.
+
+    The levels found by `clean_levels` are kept in `data.attrs[LEVELS_ATTR]`
+    and are used as long as `data` has the same rows.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data
+
+    Returns
+    -------
+    np.ndarray
+        The position in `LEVELS` of the level of each row, or -1 for rows that
+        are not from any level (see `classify_levels`).
+    """
+    stored = _get_row_levels(data)
+    return classify_levels(data) if stored is None else stored.levels
+
+
+def get_days(data: pd.DataFrame):
+    """
+    Get the date of each row of `data` in days since 1970-01-01.
+
+    As in `get_levels`, the dates converted by `clean_levels` are used as long
+    as `data` has the same rows.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data
+
+    Returns
+    -------
+    np.ndarray
+        The number of days since 1970-01-01 of the date of each row (see
+        `to_days`).
+    """
+    stored = _get_row_levels(data)
+    return to_days(data["data"]) if stored is None else stored.days
+
+
+def is_cleaned(data: pd.DataFrame):
+    """
+    Check if `data` was returned by `clean_levels` and has the same rows.
+
+    The attrs are not enough, since pandas copies them to the result of e.g.
+    `pd.concat`, which may have duplicated rows again. The rows are the same if
+    `data` still has the index of the data returned by `clean_levels` (or a
+    view of it). Values modified in place are not detected.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data
+
+    Returns
+    -------
+    bool
+        True if `data` has no duplicated rows.
+    """
+    return REPORT_ATTR in data.attrs and _get_row_levels(data) is not None
+
+
+def set_levels(data: pd.DataFrame, levels=None, days=None):
+    """
+    Keep the level and the date of each row in `data.attrs[LEVELS_ATTR]`.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data, which is modified in place
+    levels : np.ndarray, optional
+        The level of each row (see `classify_levels`). If not provided, the
+        rows are classified.
+    days : np.ndarray, optional
+        The date of each row in days since 1970-01-01 (see `to_days`). If not
+        provided, the dates are converted.
+    """
+    if levels is None:
+        levels = classify_levels(data)
+    if days is None:
+        days = to_days(data["data"])
+    data.attrs[LEVELS_ATTR] = _RowLevels(data.index, levels, days)
+
+
+def _get_labels(data, levels, positions):
+    """The level and region of the rows in `positions`"""
+    labels = pd.DataFrame(
+        {
+            "level": np.array(LEVELS, dtype=object)[levels[positions]],
+            "region": np.empty(positions.shape[0], dtype=object),
+            "date": data["data"].to_numpy()[positions],
+        },
+        columns=["level", "region", "date"])
+    for level, column in _region_columns.items():
+        is_level = levels[positions] == LEVELS.index(level)
+        if is_level.any():
+            labels.loc[is_level, "region"] = data[column].to_numpy(
+                dtype=object)[positions[is_level]]
+    return labels
+
+
+def clean_levels(data: pd.DataFrame):
+    """
+    Drop duplicated rows of all levels and check the cumulative counts.
+
+    For each level, region and date only the first row is kept. The order of
+    the remaining rows is not changed. The level of each row is kept in
+    `attrs[LEVELS_ATTR]` of the returned data (see `get_levels`), which is
+    `data` itself if there are no duplicated rows.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data with rows from any levels (e.g. as read by
+        `covid19.scrap.read_datafile_from_disc`)
+
+    Returns
+    -------
+    tuple[pd.DataFrame, QualityReport]
+        The data without the duplicated rows and the report of the problems
+        found in the data.
+    """
+    levels = classify_levels(data)
+    dates = pd.to_datetime(data["data"]).to_numpy(dtype="datetime64[ns]")
+    valid = (levels >= 0) & ~np.isnat(dates)
+    days = dates.astype("datetime64[D]").astype(np.int64)
+
+    # A single key for the level and region of each row
+    keys = np.full(data.shape[0], -1, dtype=np.int64)
+    for level, column in _region_columns.items():
+        is_level = levels == LEVELS.index(level)
+        if is_level.any():
+            codes, _ = pd.factorize(data[column][is_level])
+            keys[is_level] = (LEVELS.index(level) * (data.shape[0] + 1) +
+                              codes)
+
+    # The sort is stable -> the first of the duplicated rows is kept
+    positions = np.flatnonzero(valid)
+    positions = positions[np.lexsort((days[positions], keys[positions]))]
+
+    # xxxxxxxxxx Duplicated rows xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    same_region = keys[positions[1:]] == keys[positions[:-1]]
+    is_duplicated = same_region & (days[positions[1:]]
+                                   == days[positions[:-1]])
+    duplicated_positions = np.sort(positions[1:][is_duplicated])
+    is_first = np.ones(positions.shape[0], dtype=bool)
+    is_first[1:] = ~is_duplicated
+    positions = positions[is_first]
+    same_region = keys[positions[1:]] == keys[positions[:-1]]
+
+    # xxxxxxxxxx Gaps in the dates xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    steps = days[positions[1:]] - days[positions[:-1]]
+    has_gap = same_region & (steps > 1)
+    date_gaps = _get_labels(data, levels, positions[1:][has_gap])
+    date_gaps["missing_days"] = steps[has_gap] - 1
+
+    # xxxxxxxxxx Cumulative counts that decrease xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    negative_steps = [np.empty(0, dtype=int)]
+    negative_columns = [np.empty(0, dtype=object)]
+    negative_values = [np.empty(0)]
+    for column in _cumulative_columns:
+        if column not in data:
+            continue
+        values = data[column].to_numpy(dtype=float, na_value=np.nan)
+        deltas = values[positions[1:]] - values[positions[:-1]]
+        steps_with_decrease = np.flatnonzero(same_region & (deltas < 0))
+        negative_steps.append(steps_with_decrease)
+        negative_columns.append(np.full(steps_with_decrease.shape[0], column))
+        negative_values.append(deltas[steps_with_decrease])
+    # In the order of the regions and dates
+    negative_steps = np.concatenate(negative_steps)
+    order = np.argsort(negative_steps, kind="stable")
+    negative_deltas = _get_labels(data, levels,
+                                  positions[1:][negative_steps[order]])
+    negative_deltas["column"] = np.concatenate(negative_columns)[order]
+    negative_deltas["delta"] = np.concatenate(negative_values)[order]
+
+    report = QualityReport(_get_labels(data, levels, duplicated_positions),
+                           negative_deltas, date_gaps)
+    if not report.is_clean:
+        logging.warning(
+            "Data quality: dropped %d duplicated rows, found %d negative "
+            "daily deltas and %d gaps in the dates",
+            report.duplicates.shape[0], report.negative_deltas.shape[0],
+            report.date_gaps.shape[0])
+
+    if duplicated_positions.shape[0] > 0:
+        keep = np.ones(data.shape[0], dtype=bool)
+        keep[duplicated_positions] = False
+        data = data[keep]
+        levels = levels[keep]
+        days = days[keep]
+    set_levels(data, levels, days)
+    return data, report
+
+
+def get_history_fingerprint(rows: pd.DataFrame, key, mask=None, days=None):
+    """
+    Get a fingerprint of the history of each region.
+
+    The fingerprint has the number of rows of each region and the sum of a
+    hash of each row (of its date and cumulative counts), split in its low and
+    high 32 bits such that the sums are exact. Any change of the rows of a
+    region changes its fingerprint (except with a negligible probability), so
+    comparing the fingerprint of the dates already processed with the one of
+    the same dates in new data is a cheap way of detecting that the ministry
+    restated the history of a region. Since it is a sum over the rows, the
+    fingerprint of more rows can be added with `add_history_fingerprints`.
+
+    Parameters
+    ----------
+    rows : pd.DataFrame
+        The rows of a single level
+    key : str | None
+        The column identifying the regions (None if there is a single region)
+    mask : np.ndarray, optional
+        Boolean array with the rows that are considered (e.g. the rows up to
+        some date). If not provided, all rows are considered.
+    days : np.ndarray, optional
+        The date of each row in days since 1970-01-01, if already known
+
+    Returns
+    -------
+    pd.DataFrame
+        The fingerprint of each region, with the columns "numDias", "hashLow"
+        and "hashHigh", indexed by region (with the "object" dtype) and
+        sorted.
+    """
+    positions = (np.arange(rows.shape[0])
+                 if mask is None else np.flatnonzero(mask))
+    if days is None:
+        days = to_days(rows["data"].take(positions))
+    else:
+        days = days[positions]
+    if key is None:
+        codes = np.zeros(positions.shape[0], dtype=np.int64)
+        regions = np.zeros(1 if positions.shape[0] else 0, dtype=object)
+    else:
+        codes, regions = pd.factorize(rows[key].array.take(positions))
+        regions = np.asarray(regions, dtype=object)
+        # Rows without a region are not in any region
+        days = days[codes >= 0]
+        positions = positions[codes >= 0]
+        codes = codes[codes >= 0]
+
+    values = {"data": days}
+    for column in _cumulative_columns:
+        values[column] = rows[column].array.take(positions).to_numpy(
+            dtype=np.float64, na_value=-1).astype(np.int64)
+    hashes = pd.util.hash_pandas_object(pd.DataFrame(values),
+                                        index=False).to_numpy()
+
+    # The sums of the values below 2**32 of less than 2**21 rows per region
+    # are exact in float64
+    num_regions = regions.shape[0]
+    columns = {"numDias": np.bincount(codes, minlength=num_regions)}
+    for name, part in (("hashLow", hashes & 0xFFFFFFFF), ("hashHigh",
+                                                          hashes >> 32)):
+        columns[name] = np.bincount(codes,
+                                    weights=part.astype(np.float64),
+                                    minlength=num_regions).astype(np.int64)
+    return pd.DataFrame(columns, index=pd.Index(regions,
+                                                dtype=object)).sort_index()
+
+
+def add_history_fingerprints(first: pd.DataFrame, second: pd.DataFrame):
+    """
+    Get the fingerprint of the rows of two fingerprints together.
+
+    Parameters
+    ----------
+    first, second : pd.DataFrame
+        Fingerprints returned by `get_history_fingerprint`
+
+    Returns
+    -------
+    pd.DataFrame
+        The fingerprint of the rows of both fingerprints.
+    """
+    return first.add(second, fill_value=0).astype(np.int64).sort_index()
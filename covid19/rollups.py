@@ -0,0 +1,337 @@
+"""
+Materialized rollups of the data by day, epidemiological week and month.
+
+Aggregate views (e.g. the new cases of each state per week) are usually built
+with a `groupby(...).sum()` over the daily rows every time they are shown. The
+`RollupStore` builds them once per data file instead, for three groupings:
+
+- "brasil": the data of Brazil
+- "estados": the data of each state
+- "regioesSaude": the sum of the municipalities of each health region
+  ("codRegiaoSaude")
+
+and three periods: "dia", "semana" (epidemiological weeks, which start on
+Sunday) and "mes". Each row of a rollup has the new cases and deaths in the
+period, the cumulative values in its last day and the number of days with data.
+The weekly rollups also have the "semanaEpi" of the data, if it has one.
+
+When data with new days arrives (`RollupStore.update`) only the periods with
+new days are computed again, unless the days already processed changed (see
+`covid19.quality.get_history_fingerprint`). Queries (`RollupStore.query`)
+return slices that are kept in memory until the next update, such that
+dashboards never touch the daily rows of the municipalities.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .memo import FrameCache
+from .quality import (LEVELS, add_history_fingerprints, clean_levels,
+                      get_days, get_history_fingerprint, get_levels,
+                      is_cleaned, to_days)
+
+# The level of the rows and the column identifying the regions of each
+# grouping (Brazil has a single region)
+GROUPINGS = {
+    "brasil": ("brasil", None),
+    "estados": ("estados", "estado"),
+    "regioesSaude": ("municipios", "codRegiaoSaude"),
+}
+PERIODS = ("dia", "semana", "mes")
+
+_cumulative_columns = ("casosAcumulado", "obitosAcumulado")
+_new_columns = ("casosNovos", "obitosNovos")
+
+
+def _get_period_starts(days, period):
+    """The first day of the period of each day (days since 1970-01-01)"""
+    if period == "dia":
+        return days
+    if period == "semana":
+        # 1970-01-01 was a Thursday -> Sunday is (days + 4) % 7 == 0
+        return days - (days + 4) % 7
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(
+        "datetime64[D]").astype(np.int64)
+
+
+def _get_group_starts(*keys):
+    """Boolean array with the rows where any of the (sorted) `keys` changes"""
+    is_start = np.zeros(keys[0].shape[0], dtype=bool)
+    is_start[:1] = True
+    for key in keys:
+        is_start[1:] |= key[1:] != key[:-1]
+    return is_start
+
+
+def _get_codes(frame, key):
+    """Integer codes of the regions of each row (all zeros for Brazil)"""
+    if key is None:
+        return np.zeros(frame.shape[0], dtype=np.int64)
+    return pd.factorize(frame[key])[0]
+
+
+def _get_daily(rows: pd.DataFrame, key):
+    """
+    Sum the cumulative values of `rows` for each region (`key`) and day.
+
+    The result is sorted by region and date and has no new counts yet (see
+    `_add_new_counts`). The "semanaEpi" column is kept only if `rows` has it.
+    """
+    by = ["data"] if key is None else [key, "data"]
+    columns = {column: "sum" for column in _cumulative_columns}
+    if "semanaEpi" in rows.columns:
+        columns["semanaEpi"] = "max"
+    daily = rows.groupby(by, observed=True,
+                         sort=True)[list(columns)].agg(columns).reset_index()
+    for column in _cumulative_columns:
+        daily[column] = daily[column].astype(np.int64)
+    return daily
+
+
+def _add_new_counts(daily: pd.DataFrame, key, last_rows=None):
+    """
+    Add the new cases and deaths of each day of `daily`.
+
+    The first day of each region is compared with its row in `last_rows` (the
+    last known day of each region), if there is one, and otherwise is taken as
+    its own new count.
+    """
+    codes = _get_codes(daily, key)
+    is_start = _get_group_starts(codes)
+    for new_column, column in zip(_new_columns, _cumulative_columns):
+        values = daily[column].to_numpy()
+        previous = np.zeros_like(values)
+        previous[1:] = values[:-1]
+        previous[is_start] = 0
+        if last_rows is not None and not last_rows.empty:
+            regions = (np.zeros(is_start.sum(), dtype=np.int64) if key is None
+                       else daily[key].to_numpy()[is_start])
+            last_values = pd.Series(
+                last_rows[column].to_numpy(),
+                index=(np.zeros(last_rows.shape[0], dtype=np.int64)
+                       if key is None else last_rows[key].to_numpy()))
+            previous[is_start] = last_values.reindex(regions).fillna(
+                0).to_numpy(dtype=np.int64)
+        daily[new_column] = values - previous
+    return daily
+
+
+def _get_rollup(daily: pd.DataFrame, key, period):
+    """Aggregate the (sorted) daily rows of each region by `period`"""
+    days = to_days(daily["data"])
+    starts = _get_period_starts(days, period)
+    is_start = _get_group_starts(_get_codes(daily, key), starts)
+    first = np.flatnonzero(is_start)
+    last = np.append(first[1:], daily.shape[0])[:first.shape[0]] - 1
+
+    rollup = {} if key is None else {key: daily[key].to_numpy()[first]}
+    rollup["data"] = starts[first].astype("datetime64[D]").astype(object)
+    if period == "semana" and "semanaEpi" in daily.columns:
+        rollup["semanaEpi"] = daily["semanaEpi"].to_numpy()[last]
+    for column in _cumulative_columns:
+        rollup[column] = daily[column].to_numpy()[last]
+    for column in _new_columns:
+        rollup[column] = np.add.reduceat(daily[column].to_numpy(), first) \
+            if first.shape[0] else np.empty(0, dtype=np.int64)
+    rollup["numDias"] = last - first + 1
+    frame = pd.DataFrame(rollup)
+    if key is not None:
+        frame[key] = frame[key].astype(daily[key].dtype)
+    return frame
+
+
+def _get_last_rows(daily: pd.DataFrame, key):
+    """The last day of each region (`daily` is sorted by region and date)"""
+    codes = _get_codes(daily, key)
+    is_last = np.ones(daily.shape[0], dtype=bool)
+    is_last[:-1] = codes[1:] != codes[:-1]
+    return daily[is_last]
+
+
+class RollupStore:
+    """
+    Rollups of the data by region and period, updated incrementally.
+
+    Parameters
+    ----------
+    groupings : tuple[str]
+        The groupings ("brasil", "estados" and/or "regioesSaude")
+    periods : tuple[str]
+        The periods ("dia", "semana" and/or "mes")
+    cache_size : int
+        Maximum number of query results kept in memory
+
+    Attributes
+    ----------
+    rollups : dict[tuple[str, str], pd.DataFrame]
+        The rollup of each grouping and period, sorted by region and date. The
+        "data" column has the first day of the period.
+    """
+    def __init__(self,
+                 groupings=tuple(GROUPINGS),
+                 periods=PERIODS,
+                 cache_size=64):
+        unknown = (set(groupings) - set(GROUPINGS)) | (set(periods) -
+                                                       set(PERIODS))
+        if unknown:
+            raise ValueError(f"Unknown groupings or periods: {sorted(unknown)}")
+        self.groupings = tuple(groupings)
+        self.periods = tuple(periods)
+        self.rollups = {}
+        self._daily = {}
+        self._fingerprints = {}
+        self._cache = FrameCache(maxsize=cache_size)
+
+    def update(self, data: pd.DataFrame):
+        """
+        Update the rollups with the (full) data from the ministry.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            The data as returned by `covid19.scrap.read_datafile_from_disc`
+        """
+        if not is_cleaned(data):
+            data, _ = clean_levels(data)
+        levels = get_levels(data)
+        days = get_days(data)
+        for grouping in self.groupings:
+            is_level = levels == LEVELS.index(GROUPINGS[grouping][0])
+            if grouping not in self._daily or not self._update_grouping(
+                    grouping, data, is_level, days):
+                self._rebuild_grouping(grouping, data, is_level, days)
+        self._cache.clear()
+
+    def _rebuild_grouping(self, grouping, data, is_level, days):
+        """Compute all rollups of `grouping` from scratch"""
+        logging.info("Computing the %s rollups from scratch", grouping)
+        key = GROUPINGS[grouping][1]
+        daily = _add_new_counts(_get_daily(data[is_level], key), key)
+        self._daily[grouping] = daily
+        self._fingerprints[grouping] = get_history_fingerprint(data,
+                                                               key,
+                                                               mask=is_level,
+                                                               days=days)
+        for period in self.periods:
+            self.rollups[grouping, period] = _get_rollup(daily, key, period)
+
+    def _update_grouping(self, grouping, data, is_level, days):
+        """
+        Compute again only the periods of `grouping` with new days.
+
+        `is_level` tells the rows of `data` in the level of `grouping` and
+        `days` has the date of each row (in days since 1970-01-01).
+
+        Returns False if the history was restated and the rollups must be
+        computed from scratch.
+        """
+        key = GROUPINGS[grouping][1]
+        daily = self._daily[grouping]
+        if daily.empty or grouping not in self._fingerprints:
+            return False
+        last_date = daily.data.max()
+        last_day = to_days([last_date])[0]
+
+        # xxxxxxxxxx Check if the history was restated xxxxxxxxxxxxxxxxxxxxxxxxx
+        fingerprint = get_history_fingerprint(data,
+                                              key,
+                                              mask=is_level
+                                              & (days <= last_day),
+                                              days=days)
+        if not fingerprint.equals(self._fingerprints[grouping]):
+            logging.warning(
+                "The %s data up to %s changed -> computing the rollups again",
+                grouping, last_date)
+            return False
+        # xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+
+        is_new = is_level & (days > last_day)
+        new = _get_daily(data[is_new], key)
+        if new.empty:
+            return True
+        logging.info("Adding %d new days to the %s rollups", new.shape[0],
+                     grouping)
+        new = _add_new_counts(new.reset_index(drop=True), key,
+                              _get_last_rows(daily, key))
+        daily = pd.concat([daily, new], ignore_index=True)
+        if key is not None:
+            daily = daily.sort_values([key, "data"],
+                                      kind="mergesort",
+                                      ignore_index=True)
+        self._daily[grouping] = daily
+        self._fingerprints[grouping] = add_history_fingerprints(
+            fingerprint,
+            get_history_fingerprint(data, key, mask=is_new, days=days))
+
+        first_new_day = to_days(new["data"]).min()
+        for period in self.periods:
+            # Only the periods after the start of the first new period change
+            start = _get_period_starts(np.array([first_new_day]), period)[0]
+            rollup = self.rollups[grouping, period]
+            changed = _get_rollup(daily[to_days(daily["data"]) >= start], key,
+                                  period)
+            rollup = pd.concat(
+                [rollup[to_days(rollup["data"]) < start], changed],
+                ignore_index=True)
+            if key is not None:
+                rollup = rollup.sort_values([key, "data"],
+                                            kind="mergesort",
+                                            ignore_index=True)
+            self.rollups[grouping, period] = rollup
+        return True
+
+    def query(self,
+              grouping,
+              period="semana",
+              regions=None,
+              start=None,
+              end=None):
+        """
+        Get the rows of a rollup for some regions and dates.
+
+        The result is kept in memory until the next `update`, such that the
+        same query is very cheap.
+
+        Parameters
+        ----------
+        grouping : str
+            Either "brasil", "estados" or "regioesSaude"
+        period : str
+            Either "dia", "semana" or "mes"
+        regions : Any | list, optional
+            The regions (e.g. "CE" or ["CE", "SP"] for the states or health
+            region codes). If not provided, all regions are returned.
+        start : datetime.date | str, optional
+            Only periods starting on or after `start` are returned
+        end : datetime.date | str, optional
+            Only periods starting on or before `end` are returned
+
+        Returns
+        -------
+        pd.DataFrame
+            The rows of the rollup, sorted by region and date.
+        """
+        if (grouping, period) not in self.rollups:
+            raise KeyError(f"There is no rollup for {grouping} and {period}")
+        if regions is not None:
+            if GROUPINGS[grouping][1] is None:
+                raise ValueError(f"There are no regions in {grouping}")
+            regions = tuple(np.atleast_1d(regions).tolist())
+        start = None if start is None else pd.Timestamp(start).date()
+        end = None if end is None else pd.Timestamp(end).date()
+        return self._cache.get_or_compute(
+            (grouping, period, regions, start, end),
+            lambda: self._slice(grouping, period, regions, start, end))
+
+    def _slice(self, grouping, period, regions, start, end):
+        rollup = self.rollups[grouping, period]
+        mask = np.ones(rollup.shape[0], dtype=bool)
+        if regions is not None:
+            mask &= rollup[GROUPINGS[grouping][1]].isin(regions).to_numpy(
+            dtype=bool, na_value=False)
+        if start is not None:
+            mask &= (rollup.data >= start).to_numpy()
+        if end is not None:
+            mask &= (rollup.data <= end).to_numpy()
+        return rollup[mask].reset_index(drop=True)
@@ -0,0 +1,191 @@
+"""
+Compact dtypes for the data provided by the ministry of health.
+
+Without a schema, names of regions, states, cities and health regions are read
+as object columns, codes that have missing values (e.g. "codmun" for the rows
+with data for a whole state) as float64 and all counters as int64 or float64.
+The `SCHEMA` below declares the dtypes used instead: categoricals for the
+names and the smallest integer types that fit the codes and counters. Integer
+columns with missing values use the corresponding pandas nullable integer type.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (CategoricalDtype, is_integer_dtype,
+                              union_categoricals)
+
+REGIONS = ("Brasil", "Norte", "Nordeste", "Sudeste", "Sul", "Centro-Oeste")
+STATES = ("AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG",
+          "MS", "MT", "PA", "PB", "PE", "PI", "PR", "RJ", "RN", "RO", "RR",
+          "RS", "SC", "SE", "SP", "TO")
+
+SCHEMA = {
+    "regiao": CategoricalDtype(REGIONS),
+    "estado": CategoricalDtype(STATES),
+    "municipio": "category",
+    "coduf": "int8",
+    "codmun": "int32",
+    "codRegiaoSaude": "int32",
+    "nomeRegiaoSaude": "category",
+    "semanaEpi": "int8",
+    "populacaoTCU2019": "int32",
+    "casosAcumulado": "int32",
+    "casosNovos": "int32",
+    "obitosAcumulado": "int32",
+    "obitosNovos": "int32",
+    "Recuperadosnovos": "int32",
+    "emAcompanhamentoNovos": "int32",
+    "interior/metropolitana": "int8",
+}
+
+# Dtypes used when reading the CSV file. Since it is read in chunks we don't
+# know in advance which columns have missing values and all integer columns use
+# nullable types. The categories of the categorical columns are only fixed
+# later by `apply_schema`.
+CSV_DTYPES = {
+    column: ("category" if dtype == "category"
+             or isinstance(dtype, CategoricalDtype) else dtype.capitalize())
+    for column, dtype in SCHEMA.items()
+}
+
+
+def _to_categorical(column: pd.Series, dtype):
+    """Convert `column` to a categorical, falling back to inferred categories"""
+    if isinstance(dtype, CategoricalDtype):
+        values = column.dropna().unique()
+        unknown = set(values) - set(dtype.categories)
+        if unknown:
+            logging.warning(
+                "Unknown values in column %s: %s -> using inferred categories",
+                column.name, sorted(map(str, unknown)))
+            dtype = "category"
+    return column.astype(dtype)
+
+
+def _to_integer(column: pd.Series, dtype: str):
+    """
+    Convert `column` to the integer type `dtype`.
+
+    The nullable version of `dtype` is used if `column` has missing values.
+    If `column` has values that are not integers it is returned unchanged.
+    """
+    if not is_integer_dtype(column.dtype):
+        try:
+            values = column.dropna().to_numpy(dtype=float)
+        except (TypeError, ValueError):
+            values = np.array([np.nan])
+        if not np.array_equal(values, np.round(values)):
+            logging.warning("Column %s has non integer values", column.name)
+            return column
+
+    if column.isna().any():
+        dtype = dtype.capitalize()
+
+    info = np.iinfo(dtype.lower())
+    if column.min() < info.min or column.max() > info.max:
+        logging.warning("Column %s does not fit in %s", column.name, dtype)
+        return column
+
+    return column.astype(dtype)
+
+
+def apply_schema(data: pd.DataFrame):
+    """
+    Convert the columns of `data` to the dtypes in `SCHEMA`.
+
+    Columns not in `SCHEMA` are kept as they are.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data
+
+    Returns
+    -------
+    pd.DataFrame
+        The data with compact dtypes.
+    """
+    columns = {}
+    for column, dtype in SCHEMA.items():
+        if column not in data or data[column].dtype == dtype:
+            continue
+        if dtype == "category" or isinstance(dtype, CategoricalDtype):
+            columns[column] = _to_categorical(data[column], dtype)
+        elif data[column].isna().all():
+            # Empty column (e.g. "estado" in a file with only Brazil data)
+            columns[column] = data[column].astype(dtype.capitalize())
+        else:
+            columns[column] = _to_integer(data[column], dtype)
+
+    return data.assign(**columns)
+
+
+def concat_frames(frames):
+    """
+    Concatenate DataFrames keeping their categorical columns.
+
+    Categorical columns can have different categories in each DataFrame (e.g.
+    when the data is read in chunks) and `pd.concat` would convert them back to
+    object. The categories of these columns are merged before concatenating.
+
+    Parameters
+    ----------
+    frames : list[pd.DataFrame]
+        The DataFrames with the same columns
+
+    Returns
+    -------
+    pd.DataFrame
+        The concatenated DataFrame
+    """
+    if len(frames) == 1:
+        return frames[0]
+
+    dtypes = {}
+    for column in frames[0].columns:
+        columns = [f[column] for f in frames]
+        if (not any(c.dtype.name == "category" for c in columns)
+                or all(c.dtype == columns[0].dtype for c in columns)):
+            continue
+        columns = [c.astype("category") for c in columns]
+        ordered = any(c.cat.ordered for c in columns)
+        # Columns with only missing values have no categories (and possibly a
+        # different dtype for the empty categories)
+        columns = [c for c in columns if len(c.cat.categories)]
+        if columns:
+            categories = union_categoricals(columns,
+                                            ignore_order=True).categories
+            dtypes[column] = CategoricalDtype(categories, ordered=ordered)
+        else:
+            dtypes[column] = "category"
+
+    return pd.concat([frame.astype(dtypes) for frame in frames])
+
+
+def memory_report(data: pd.DataFrame):
+    """
+    Get the memory used by each column of `data`.
+
+    The memory of object columns includes the memory of the python objects.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data
+
+    Returns
+    -------
+    pd.DataFrame
+        A DataFrame indexed by the column names (plus "Index" and "Total") with
+        the columns "dtype", "bytes" and "fraction".
+    """
+    memory = data.memory_usage(deep=True)
+    report = pd.DataFrame({
+        "dtype": data.dtypes.astype(str).reindex(memory.index,
+                                                 fill_value="index"),
+        "bytes": memory,
+        "fraction": memory / memory.sum(),
+    })
+    report.loc["Total"] = ["", memory.sum(), 1.0]
+    return report
@@ -1,14 +1,21 @@
 import datetime
-import glob
 import logging
-import os
+import threading
 from pathlib import Path
-from time import sleep, time
 
 import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.firefox.options import Options
+
+from .cache import (load_cached_frame, load_file_metadata,
+                    store_cached_frame, store_file_metadata)
+from .covid import (get_all_municipalities_data, get_all_states_data,
+                    get_brazil_data)
+from .incremental import DerivedDataStore
+from .instrument import instrumentation
+from .memo import frame_cache, get_file_key
+from .quality import (LEVELS, REPORT_ATTR, classify_levels, clean_levels,
+                      set_levels)
+from .rollups import RollupStore
+from .schema import CSV_DTYPES, apply_schema, concat_frames
 
 # Note: Install the gecko driver in arch with
 # sudo pacman -S geckodriver
@@ -16,185 +23,315 @@ from selenium.webdriver.firefox.options import Options
 # https://mobileapps.saude.gov.br/esus-vepi/files/unAFkcaNDeXajurGB7LChj8SgQYS2ptm/1d2b944e065c7304b2754cc386635e38_Download_COVID19_20200430.csv
 # https://mobileapps.saude.gov.br/esus-vepi/files/unAFkcaNDeXajurGB7LChj8SgQYS2ptm/b7ac2be9055d75727e05608cb181cc74_Download_COVID19_20200504.csv
 
-_data_filename = "dados.xlsx"
+# The data file used by `get_covid_data`
+DATA_FILENAME = "dados.xlsx"
+_data_filename = DATA_FILENAME
 _data_filename_old = "dados_old.xlsx"
+_download_log_file = "last_download_time.log"
+_download_time_format = "%Y-%m-%d, %H:%M:%S"
 
+# The download running in background (see `get_covid_data`)
+_background_download = None
 
-def _download_covid_data():
-    """Download covid data from the internet"""
-    URL = "https://covid.saude.gov.br/"
-
-    # Create a profile and set some preferences to prevent download dialog
-    profile = webdriver.FirefoxProfile()
-    profile.set_preference('browser.download.folderList', 2)  # custom location
-    profile.set_preference('browser.download.manager.showWhenStarting', False)
-    # The value is the folder where to download to. We are setting the download
-    # folder as the current folder of the python interpreter by using 'os.getcwd'
-    profile.set_preference('browser.download.dir', os.getcwd())
-    profile.set_preference(
-        'browser.helperApps.neverAsk.saveToDisk',
-        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-
-    options = Options()
-    options.headless = True
-
-    # Create a driver and load the webpage -> This blocks until the page
-    # You need to install a driver. I'm using a driver for firefox
-    # See here https://selenium-python.readthedocs.io/installation.html#drivers
-    # In Arch Linux you can install driver for firefox with `sudo pacman -Sy geckodriver`
-    driver = webdriver.Firefox(profile, options=options)
-    driver.get(URL)
-
-    # The webpage uses shadow-dom in several places, but we can get the download
-    # button by get all "button"s from the page
-    # buttons = driver.find_elements_by_class_name("button")
-
-    # Everything in the app (except the navbar) is in a tag with name "ion-content"
-    ion_content = driver.find_element_by_tag_name("ion-content")
-
-    # The first "div" in the ion-content tag has the download button
-    first_div = ion_content.find_element_by_tag_name("div")
-
-    # There is a single "button" in this div, which is the download button
-    download_button = first_div.find_element_by_class_name("button")
-
-    # # The download button is the third one (index 2)
-    # download_button = buttons[2]
-
-    # When we run this script we should wait a bit before clicking the download
-    # button. I'm waiting 2 seconds to be safe
-    sleep(5.0)
-
-    start = time()
-    now = time()
-    ONE_MINUTE = 60.0
-
-    # Click the button
-    download_button.click()
-
-    # Read all ".xlsx" files in the current folder and check if the modification
-    # time of any of them is greater than 'start'. The first ".xlsx" file with
-    # modification time greater than 'start' is assumed to be the downloaded
-    # file. If there is no file with modification date after 'start' then we
-    # assume the file was not downloaded yet.
-    while (now - start < ONE_MINUTE):
-        files = glob.glob("*.xlsx")
-
-        if len(files) == 0:
-            logging.info("No files downloaded so far: sleeping for 1 second")
-            sleep(1)
-            now = time()
-            continue
-
-        # Sort files in descending order by timestamp
-        files = sorted(files, key=lambda x: os.path.getmtime(x), reverse=True)
-        most_current_timestamp = os.path.getmtime(files[0])
-        if most_current_timestamp > start:
-            # This will break the outer while loop
-            os.rename(files[0], _data_filename)
-
-            logging.info("The download was finished!")
-
-            # This will break the while loop
-            break
-        else:
-            logging.info(
-                "The download was not finished yet: sleeping for 1 second")
-            # If the for loop didn't break, sleep for one second
-            now = time()
-            sleep(1)
-    else:
-        # The while loop run until the end -> That means the file was not
-        # downloaded within one minute
-        raise TimeoutError("Could not download the file in under a minute")
 
-    # Sleep before closing the driver to allow time for the download.
-    # sleep(5.0)
+def _download_covid_data(fetcher=None):
+    """
+    Download covid data from the internet.
 
-    # Close the driver -> This closes the firefox window that was opened by selenium
-    driver.close()
+    Returns True if a new file was downloaded and False if the file on disk is
+    up to date.
+    """
+    if fetcher is None:
+        # Imported here because the download backends are only needed when
+        # downloading (see `tests/test_import.py`)
+        from .fetch import get_default_fetcher
+        fetcher = get_default_fetcher()
+    with instrumentation.stage("download"):
+        return fetcher.fetch(_data_filename)
 
 
-# def _conv_date(x):
-#     """Convert a string in the `date` column into a `date` object"""
-#     try:
-#         return datetime.datetime.strptime(x.data, "%Y-%m-%d").date()
-#     except TypeError:
-#         return None
+_week_days = ("Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado",
+              "Domingo")
 
 
-def _conv_date(x):
-    """Convert a string in the `date` column into a `date` object"""
-    try:
-        return x.data.date()
-    except TypeError:
-        return None
+def _clean_data(data: pd.DataFrame):
+    """
+    Convert the dates, add the "diaDaSemana" column and drop empty lines.
+
+    Everything is done with vectorized datetime64 operations. The "data" column
+    has `datetime.date` objects and the "diaDaSemana" column is a categorical
+    with the days of the week in order.
 
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data as read from the file
 
-def read_datafile_from_disc(filename=_data_filename):
+    Returns
+    -------
+    pd.DataFrame
+        The cleaned data
+    """
+    with instrumentation.stage("convert_dates", rows=data.shape[0]):
+        dates = pd.to_datetime(data["data"], errors="coerce")
+        has_date = dates.notna().to_numpy()
+
+        data["data"] = dates.dt.date
+        week_day_codes = dates.dt.weekday.to_numpy(dtype=float, na_value=-1)
+        data["diaDaSemana"] = pd.Categorical.from_codes(
+            week_day_codes.astype(int), categories=_week_days, ordered=True)
+
+    # xxxxxxxxxx Cleaning xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Drop lines without a date (these are empty lines in the data)
+    if not has_date.all():
+        data = data[has_date]
+    # xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+
+    return data
+
+
+def _clean_levels(data: pd.DataFrame):
+    """Drop duplicated rows, keeping the quality report in `data.attrs`"""
+    with instrumentation.stage("clean_levels", rows=data.shape[0]):
+        data, report = clean_levels(data)
+    data.attrs[REPORT_ATTR] = report
+    return data
+
+
+def _read_datafile(filename, use_cache, signature=None):
+    """
+    Read and clean the file with data (see `read_datafile_from_disc`).
+
+    `signature` is the signature of the file taken before reading it (see
+    `covid19.cache.store_cached_frame`).
+    """
+    if use_cache:
+        data = load_cached_frame(filename)
+        # The cache has the data after `clean_levels`, with its quality report
+        if data is not None and REPORT_ATTR in data.attrs:
+            # Parquet does not keep the dtype of empty categorical columns
+            data = apply_schema(data)
+            set_levels(data)
+            return data
+
+    # data = pd.read_csv(filename, sep=';' , encoding='latin-1')
+    with instrumentation.stage("parse_excel") as record:
+        data = pd.read_excel(filename)
+        record.rows = data.shape[0]
+    with instrumentation.stage("clean_data", rows=data.shape[0]):
+        data = apply_schema(_clean_data(data))
+    data = _clean_levels(data)
+
+    if use_cache:
+        store_cached_frame(filename, data, signature)
+
+    return data
+
+
+def read_datafile_from_disc(filename=_data_filename, use_cache=True):
     """
     Read the file with data from the disk.
 
-    Note that one extra column is added: "diaDaSemana"
+    Note that one extra column is added: "diaDaSemana". The columns are
+    converted to the compact dtypes declared in `covid19.schema.SCHEMA`.
+
+    The cleaned data is cached in a Parquet file next to `filename` (see the
+    `covid19.cache` module), such that the (slow) spreadsheet is only parsed
+    again when it changes. It is also kept in memory (see `covid19.memo`) until
+    the file changes, such that reading the same file again is very cheap. The
+    metadata used by `get_covid_data` to check if the file is current is saved
+    as well (see `covid19.cache.load_file_metadata`).
 
     Parameters
     ----------
     filename : str
         The name of the file with the data
+    use_cache : bool
+        If True, use the cached data if it is valid and update the cache after
+        parsing the file
 
     Returns
     -------
     pd.Dataframe
-        A pandas Dataframe with the data
+        A pandas Dataframe with the data, without duplicated rows. Its
+        `attrs["quality_report"]` has the `covid19.quality.QualityReport` of
+        the data and its `attrs["source"]` has the identity of the file (see
+        `covid19.memo.get_file_key`) if `use_cache` is True.
     """
-    # data = pd.read_csv(filename, sep=';' , encoding='latin-1')
-    data = pd.read_excel(filename)
-    data["data"] = data.apply(_conv_date, axis=1)
+    if not use_cache:
+        return _read_datafile(filename, use_cache)
+
+    # The file is identified before it is read, such that the data is not
+    # cached for a newer file if the file is replaced in the meantime
+    source = get_file_key(filename)
+    signature = {"size": source[1], "mtime_ns": source[2]}
+
+    def _read():
+        data = _read_datafile(filename, use_cache, signature)
+        data.attrs["source"] = source
+        if load_file_metadata(filename) is None:
+            store_file_metadata(filename, data, signature)
+        return data
 
-    # xxxxxxxxxx Cleaning xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    # Drop lines without a date (these are empty lines in the data)
-    data = data[~data.data.isna()]
-    # xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    return frame_cache.get_or_compute(("read_datafile_from_disc", source),
+                                      _read)
 
-    weekDays = ("Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado",
-                "Domingo")
-    data["diaDaSemana"] = data.apply(lambda x: weekDays[x.data.weekday()],
-                                     axis=1)
 
-    return data
+def _split_levels(data: pd.DataFrame):
+    """
+    Split the data into Brazil, states and municipalities data.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        The data with rows from all levels
 
+    Returns
+    -------
+    dict[str, pd.DataFrame]
+        A dictionary with keys "brasil", "estados" and "municipios".
+    """
+    levels = classify_levels(data)
+    return {
+        level: data[levels == code]
+        for code, level in enumerate(LEVELS)
+    }
+
+
+def read_csv_datafile(filename, chunksize=500_000, sep=";",
+                      encoding="latin-1"):
+    """
+    Read the CSV file provided by the ministry in chunks.
+
+    Each chunk is read with the compact dtypes in `covid19.schema.CSV_DTYPES`
+    (categoricals for names, int32 codes and nullable integer counts), cleaned
+    in the same way as in `read_datafile_from_disc` and split into Brazil,
+    states and municipalities rows. Only one chunk is kept with its original
+    size in memory at any time and the full data is never held in memory with
+    object columns. At the end the schema in `covid19.schema.SCHEMA` is applied
+    to each level and the duplicated rows are dropped (see
+    `covid19.quality.clean_levels`).
+
+    Parameters
+    ----------
+    filename : str
+        The name of the CSV file
+    chunksize : int
+        Number of rows read at a time
+    sep : str
+        The separator used in the CSV file
+    encoding : str
+        The encoding of the CSV file
+
+    Returns
+    -------
+    dict[str, pd.DataFrame]
+        A dictionary with keys "brasil", "estados" and "municipios".
+    """
+    columns = pd.read_csv(filename, sep=sep, encoding=encoding,
+                          nrows=0).columns
+    dtypes = {
+        column: dtype
+        for column, dtype in CSV_DTYPES.items() if column in columns
+    }
+
+    levels = {"brasil": [], "estados": [], "municipios": []}
+    reader = pd.read_csv(filename,
+                         sep=sep,
+                         encoding=encoding,
+                         dtype=dtypes,
+                         chunksize=chunksize)
+    try:
+        for chunk in reader:
+            for level, level_data in _split_levels(
+                    _clean_data(chunk)).items():
+                levels[level].append(level_data)
+    finally:
+        reader.close()
+
+    return {
+        level: _clean_levels(apply_schema(concat_frames(chunks)))
+        for level, chunks in levels.items()
+    }
+
+
+def _write_download_time():
+    """Save the current time to the download log file"""
+    with open(_download_log_file, mode="w") as f:
+        now = datetime.datetime.now()
+        f.write(now.strftime(_download_time_format))
+
+
+def _start_background_download(fetcher=None):
+    """Start downloading the data in background, if not started already"""
+    from .download import run_in_background
+    global _background_download
+    if _background_download is not None and not _background_download.done():
+        logging.info("The data is already being downloaded in background")
+        return
+
+    def _log_result(future):
+        try:
+            future.result()
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Could not download data from internet")
+        else:
+            _write_download_time()
+
+    logging.info("Downloading data from the internet in background")
+    _background_download = run_in_background(_download_covid_data, fetcher)
+    _background_download.add_done_callback(_log_result)
 
-def get_covid_data():
+
+def get_covid_data(background=False, fetcher=None):
     """
     Get the data from the disk if it exists or download it if it does not exist.
 
     If the data exists on disk, but the most recent date in the file is not
     today, then download new data.
-    """
-    download_log_file = "last_download_time.log"
-    format_string = "%Y-%m-%d, %H:%M:%S"
 
+    Parameters
+    ----------
+    background : bool
+        If True and the data on disk is not current, the new data is
+        downloaded in background and the data on disk is returned right away.
+        The next call returns the new data once the download finishes.
+    fetcher : object
+        The fetcher used to download the data (see `covid19.fetch`). If not
+        provided the one returned by `covid19.fetch.get_default_fetcher` is
+        used.
+
+    Returns
+    -------
+    pd.DataFrame
+        The data.
+    """
     filepath = Path(_data_filename)
     if filepath.exists():
-        data = read_datafile_from_disc()
+        # The metadata saved when the file was first read tells us the most
+        # recent date in the file without reading it
+        metadata = load_file_metadata(_data_filename)
+        if metadata is None:
+            last_date = read_datafile_from_disc(_data_filename).data.max()
+        else:
+            last_date = metadata["max_date"]
 
         today = datetime.datetime.today().date()
-        file_is_current = data.data.iloc[-1] == today
+        file_is_current = last_date == today
 
         if file_is_current:
             logging.info(
                 "There is an existing file on disk and it is current: using it"
             )
-            return data
+            return read_datafile_from_disc(_data_filename)
         else:
             # If the file is not current check the log file to see if it was
             # downloaded lesss the one hour ago
             try:
-                with open(download_log_file, mode="r") as f:
+                with open(_download_log_file, mode="r") as f:
                     last_download_time = datetime.datetime.strptime(
-                        f.read(), format_string)
+                        f.read(), _download_time_format)
                     now = datetime.datetime.now()
-                    now - last_download_time
                     if (now - last_download_time) < datetime.timedelta(
                             minutes=60):
                         # The file is not current, but it was downloaded less
@@ -202,45 +339,156 @@ def get_covid_data():
                         logging.info(
                             "The existing file on disk is not current, but it was downloaded less than one hour ago and we will use it"
                         )
-                        return data
+                        return read_datafile_from_disc(_data_filename)
             except FileNotFoundError:
                 pass
 
+        if background:
+            # The file is only replaced when the download finishes. Meanwhile
+            # we keep using the current one.
+            _start_background_download(fetcher)
+            return read_datafile_from_disc(_data_filename)
+
         # If we reach this point the file exists in the disk, but it is not
         # current and it was downloaded more then one hour ago -> Let's try
-        # downloading a new file then
-        del data
-
+        # downloading a new file then. The file is only replaced when the
+        # download finishes and it is kept for the conditional requests of the
+        # HTTP fetcher.
         logging.warning(
             "The existing file on disk is not current -> We will try downloading a new one"
         )
 
-        # Backup current file
-        filepath.rename(_data_filename_old)
-
-    # A file does not exist on disk or the one that existed was old and was
-    # renamed
     try:
         logging.info("Downloading data from the internet")
         # Download the file
-        _download_covid_data()
+        _download_covid_data(fetcher)
+
+        # Save the current time to a log file (also if the file did not change,
+        # since it was checked)
+        _write_download_time()
+    except Exception as e:  # pylint: disable=broad-except
+        # Any error of the download (e.g. of the browser), not only network
+        # errors, falls back to the file on disk
+        logging.warning("Could not download data from internet: %r", e)
+
+        for filename in (_data_filename, _data_filename_old):
+            if Path(filename).exists():
+                # Could not download a new file. Let's use the old one in the
+                # disk
+                logging.warning("Using an old data file")
+                return read_datafile_from_disc(filename)
+        raise TimeoutError("Could not download data from the internet") from e
+
+    return read_datafile_from_disc(_data_filename)
+
+
+# The derived data of the data returned by `get_covid_data` (see
+# `get_derived_data`) and the identity of the file each level was derived from
+_derived_data_store = DerivedDataStore()
+_derived_data_store_sources = {}
+_derived_data_store_lock = threading.Lock()
+
+# The function deriving the data of each level
+DERIVED_DATA_GETTERS = {
+    "brasil": get_brazil_data,
+    "estados": get_all_states_data,
+    "municipios": get_all_municipalities_data,
+}
+
+
+def get_derived_data(level, medias_moveis=False, background=False,
+                     fetcher=None):
+    """
+    Get the data for Brazil, the states or the municipalities.
 
-        # Save the current time to a log file
-        with open(download_log_file, mode="w") as f:
-            now = datetime.datetime.now()
-            f.write(now.strftime(format_string))
+    This is the same as calling `get_covid_data` and then `get_brazil_data`,
+    `get_all_states_data` or `get_all_municipalities_data`, but the derived
+    data is kept in memory until the data file changes. When it changes, only
+    the new dates are derived (see `covid19.incremental.DerivedDataStore`),
+    unless `medias_moveis` is True, in which case the level is derived again
+    (see `covid19.memo`).
 
-        # The data in the
-        data = read_datafile_from_disc()
-        return data
+    Parameters
+    ----------
+    level : str
+        Either "brasil", "estados" or "municipios"
+    medias_moveis : bool
+        If True, the moving averages and the weekday adjusted series are also
+        computed (and kept in memory with the other derived columns)
+    background : bool
+        See `get_covid_data`
+    fetcher : object
+        See `get_covid_data`
 
-    except TimeoutError:
-        logging.warning("Could not download data from internet")
+    Returns
+    -------
+    pd.DataFrame
+        The derived data.
+    """
+    get_level_data = DERIVED_DATA_GETTERS[level]
+    data = get_covid_data(background=background, fetcher=fetcher)
+    source = data.attrs.get("source")
+    if source is None:
+        return get_level_data(data, medias_moveis=medias_moveis)
+    if medias_moveis:
+        return frame_cache.get_or_compute(
+            ("get_derived_data", level, medias_moveis, source),
+            lambda: get_level_data(data, medias_moveis=medias_moveis))
+    with _derived_data_store_lock:
+        if _derived_data_store_sources.get(level) != source:
+            _derived_data_store.update(data, levels=(level, ))
+            _derived_data_store_sources[level] = source
+        return _derived_data_store.frames[level].copy(deep=False)
+
+
+# The rollups of the data returned by `get_covid_data` (see `get_rollups`) and
+# the identity of the file they were computed from
+_rollup_store = RollupStore()
+_rollup_store_source = None
+_rollup_store_lock = threading.Lock()
+
+
+def get_rollups(grouping,
+                period="semana",
+                regions=None,
+                start=None,
+                end=None,
+                background=False,
+                fetcher=None):
+    """
+    Get the data of Brazil, the states or the health regions by period.
 
-        filepath = Path(_data_filename_old)
-        if filepath.exists():
-            # Could not download a new file. Let's use the old one in the disk
-            logging.warning("Using an old data file")
-            return read_datafile_from_disc(_data_filename_old)
-        else:
-            raise TimeoutError("Could not download data from the internet")
+    The rollups (see `covid19.rollups.RollupStore`) are computed once for each
+    data file. When the file changes, only the periods with new days are
+    computed again.
+
+    Parameters
+    ----------
+    grouping : str
+        Either "brasil", "estados" or "regioesSaude"
+    period : str
+        Either "dia", "semana" or "mes"
+    regions : Any | list, optional
+        See `covid19.rollups.RollupStore.query`
+    start : datetime.date | str, optional
+        See `covid19.rollups.RollupStore.query`
+    end : datetime.date | str, optional
+        See `covid19.rollups.RollupStore.query`
+    background : bool
+        See `get_covid_data`
+    fetcher : object
+        See `get_covid_data`
+
+    Returns
+    -------
+    pd.DataFrame
+        The rows of the rollup.
+    """
+    global _rollup_store_source
+    data = get_covid_data(background=background, fetcher=fetcher)
+    source = data.attrs.get("source")
+    with _rollup_store_lock:
+        if source is None or source != _rollup_store_source:
+            _rollup_store.update(data)
+            _rollup_store_source = source
+        return _rollup_store.query(grouping, period, regions, start, end)
@@ -0,0 +1,751 @@
+"""
+HTTP service answering queries on the derived data from memory.
+
+Web layers built on top of `covid19` usually call `get_covid_data` and derive
+the data of a level in every request. The `QueryService` derives the data of
+Brazil, of the states and of the municipalities once for each data file into a
+`Dataset` and serves it with a small HTTP/1.1 server built on `asyncio` (no
+other dependency is needed):
+
+- ``GET /`` : the levels and the last date in the data
+- ``GET /summary`` : the totals of each level in the last date
+- ``GET /brasil`` : the series of Brazil
+- ``GET /estados`` and ``GET /municipios`` : the last values of each region
+- ``GET /estados/<estado>`` and ``GET /municipios/<codmun>`` : the series of a
+  state (e.g. "CE") or of a municipality (e.g. 230440)
+
+Tables are returned as JSON with a list of values per column. They are
+returned as an Arrow IPC stream instead with ``?format=arrow`` (or an
+"Accept: application/vnd.apache.arrow.stream" header), which requires
+`pyarrow`. The series accept ``?start=<date>`` and ``?end=<date>``.
+
+The data is refreshed in background every `refresh_interval` seconds. The new
+`Dataset` is built in a worker thread and replaces the current one in a single
+assignment, such that each request is answered entirely from either the old
+or the new data. Encoded responses are kept in memory with the dataset they
+were computed from.
+
+Run the service with::
+
+    python -m covid19.server --port 8000
+"""
+import argparse
+import asyncio
+import datetime
+import functools
+import json
+import logging
+import sys
+from collections import namedtuple
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from .cli import fetch_data_file
+from .instrument import instrumentation
+from .memo import FrameCache
+from .quality import LEVELS
+from .scrap import (DATA_FILENAME, DERIVED_DATA_GETTERS,
+                    read_datafile_from_disc)
+
+# The column identifying the regions of each level
+_keys = {"brasil": None, "estados": "estado", "municipios": "codmun"}
+# Columns describing the regions (they are not part of the series)
+_region_columns = {
+    "brasil": ("regiao", "populacaoTCU2019"),
+    "estados": ("regiao", "estado", "coduf", "populacaoTCU2019"),
+    "municipios": ("regiao", "estado", "municipio", "codmun", "codRegiaoSaude",
+                   "nomeRegiaoSaude", "populacaoTCU2019"),
+}
+_series_columns = ("data", "semanaEpi", "casosAcumulado", "obitosAcumulado",
+                   "casosNovos", "obitosNovos", "diasDeContaminacao_1",
+                   "diasDeContaminacao_100", "mediaCasosNovos_7",
+                   "mediaCasosNovos_14", "casosNovosAjustados",
+                   "mediaObitosNovos_7", "mediaObitosNovos_14",
+                   "obitosNovosAjustados")
+_total_columns = ("casosAcumulado", "obitosAcumulado", "casosNovos",
+                  "obitosNovos")
+
+_json_content_type = "application/json"
+_arrow_content_type = "application/vnd.apache.arrow.stream"
+
+Response = namedtuple("Response", ["status", "content_type", "body"])
+
+
+class HTTPError(Exception):
+    """An error returned to the client with the given HTTP status"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# xxxxxxxxxx Encoding xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def _json_default(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _encode_json(value):
+    return json.dumps(value, default=_json_default,
+                      separators=(",", ":")).encode()
+
+
+def _get_columns(frame: pd.DataFrame):
+    """The values of each column of `frame`, with None for missing values"""
+    return {
+        column: values.astype(object).where(values.notna(), None).tolist()
+        for column, values in frame.items()
+    }
+
+
+def _to_array(column: pd.Series):
+    """Convert a column to a NumPy array (the dates to datetime64[D])"""
+    if column.name == "data":
+        return pd.to_datetime(column).to_numpy(
+            dtype="datetime64[ns]").astype("datetime64[D]")
+    if pd.api.types.is_extension_array_dtype(column.dtype):
+        return column.to_numpy(dtype=np.float64, na_value=np.nan)
+    return column.to_numpy()
+
+
+def _to_list(values: np.ndarray):
+    """Convert an array from `_to_array` to a list that can be dumped to JSON"""
+    if values.dtype.kind == "M":
+        return np.datetime_as_string(values).tolist()
+    values = values.tolist()
+    if isinstance(values[:1] and values[0], float):
+        return [None if value != value else value for value in values]
+    return values
+
+
+def _encode_arrow(frame: pd.DataFrame):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPError(HTTPStatus.NOT_ACCEPTABLE,
+                        "The Arrow format requires pyarrow") from None
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST,
+                        f"Invalid {name} date: {value}") from None
+
+
+# xxxxxxxxxx Dataset xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+class Dataset:
+    """
+    The derived data of each level, indexed by region.
+
+    A dataset is not modified after it is built. The rows of each region are
+    contiguous, such that the series of a region is a slice of the data of its
+    level.
+
+    Parameters
+    ----------
+    frames : dict[str, pd.DataFrame]
+        The derived data of each level (e.g. from `get_all_states_data`)
+    source : Any
+        The identity of the data file (see `covid19.memo.get_file_key`)
+    cache_bytes : int
+        Maximum total size in bytes of the encoded responses kept in memory
+
+    Attributes
+    ----------
+    frames : dict[str, pd.DataFrame]
+        The derived data of each level, sorted by region and date
+    summary : dict
+        The last date and the totals of each level in the last date
+    """
+    def __init__(self, frames, source=None, cache_bytes=64 * 2**20):
+        self.source = source
+        self.frames = {}
+        self.summary = {}
+        self._arrays = {}
+        self._slices = {}
+        self._latest = {}
+        for level, frame in frames.items():
+            key = _keys[level]
+            if key is None:
+                frame = frame.reset_index(drop=True)
+            else:
+                frame = frame.sort_values([key, "data"],
+                                          kind="mergesort",
+                                          ignore_index=True)
+            # The attrs of the data (e.g. the quality report) are not served
+            frame.attrs = {}
+            self.frames[level] = frame
+            # The series are served from plain arrays, which are much faster
+            # to slice than the DataFrame
+            self._arrays[level] = {
+                column: _to_array(frame[column])
+                for column in _series_columns if column in frame
+            }
+
+            codes = (np.zeros(frame.shape[0], dtype=np.int64)
+                     if key is None else pd.factorize(frame[key])[0])
+            starts = np.flatnonzero(
+                np.r_[frame.shape[0] > 0, codes[1:] != codes[:-1]])
+            stops = np.append(starts[1:], frame.shape[0])
+            regions = ([None] * starts.shape[0] if key is None else
+                       frame[key].to_numpy()[starts].tolist())
+            self._slices[level] = {
+                None if region is None else str(region): (start, stop)
+                for region, start, stop in zip(regions, starts, stops)
+            }
+            self._latest[level] = frame.iloc[stops - 1].reset_index(drop=True)
+            self.summary[level] = self._get_summary(frame, len(regions))
+        self._responses = FrameCache(maxsize=None, maxbytes=cache_bytes)
+
+    @classmethod
+    def from_data(cls, data: pd.DataFrame, levels=LEVELS,
+                  medias_moveis=False):
+        """
+        Derive the data of each level from the data of the ministry.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            The data as returned by `covid19.scrap.get_covid_data`
+        levels : tuple[str]
+            The levels ("brasil", "estados" and/or "municipios")
+        medias_moveis : bool
+            If True, the moving averages are also computed and served
+
+        Returns
+        -------
+        Dataset
+            The dataset.
+        """
+        frames = {
+            level: DERIVED_DATA_GETTERS[level](data,
+                                                medias_moveis=medias_moveis)
+            for level in levels
+        }
+        with instrumentation.stage("build_dataset"):
+            return cls(frames, source=data.attrs.get("source"))
+
+    @staticmethod
+    def _get_summary(frame, num_regions):
+        if frame.empty:
+            return {"last_date": None, "regions": 0}
+        last_date = frame.data.max()
+        latest = frame[(frame.data == last_date).to_numpy()]
+        summary = {"last_date": last_date, "regions": num_regions}
+        for column in _total_columns:
+            summary[column] = int(latest[column].sum())
+        return summary
+
+    @property
+    def last_date(self):
+        """datetime.date: The last date in the data"""
+        dates = [
+            summary["last_date"] for summary in self.summary.values()
+            if summary["last_date"] is not None
+        ]
+        return max(dates, default=None)
+
+    def get_rows(self, level, region=None, start=None, end=None):
+        """
+        Get the rows of the series of a region.
+
+        Parameters
+        ----------
+        level : str
+            Either "brasil", "estados" or "municipios"
+        region : str, optional
+            The state (e.g. "CE") or the municipality (e.g. "230440"). Not used
+            for Brazil.
+        start : datetime.date, optional
+            Only the days on or after `start` are returned
+        end : datetime.date, optional
+            Only the days on or before `end` are returned
+
+        Returns
+        -------
+        slice
+            The rows of the series in `frames[level]`.
+
+        Raises
+        ------
+        KeyError
+            If there is no such level or region.
+        """
+        start_row, stop_row = self._slices[level][region]
+        dates = self._arrays[level]["data"][start_row:stop_row]
+        if start is not None:
+            start_row += np.searchsorted(dates, np.datetime64(start, "D"))
+        if end is not None:
+            stop_row -= dates.shape[0] - np.searchsorted(
+                dates, np.datetime64(end, "D"), side="right")
+        return slice(start_row, max(start_row, stop_row))
+
+    def get_series(self, level, region=None, start=None, end=None):
+        """
+        Get the series of a region.
+
+        See `get_rows` for the parameters.
+
+        Returns
+        -------
+        pd.DataFrame
+            The series of the region, sorted by date.
+        """
+        rows = self.get_rows(level, region, start, end)
+        return self.frames[level].iloc[rows][list(
+            self._arrays[level])].reset_index(drop=True)
+
+    def get_series_values(self, rows, level):
+        """
+        Get the values of each column of the series in `rows`.
+
+        Parameters
+        ----------
+        rows : slice
+            The rows, as returned by `get_rows`
+        level : str
+            Either "brasil", "estados" or "municipios"
+
+        Returns
+        -------
+        dict[str, list]
+            The values of each column, with ISO dates and None for missing
+            values.
+        """
+        return {
+            column: _to_list(values[rows])
+            for column, values in self._arrays[level].items()
+        }
+
+    def get_regions(self, level):
+        """
+        Get the regions of a level with their values in their last date.
+
+        Parameters
+        ----------
+        level : str
+            Either "brasil", "estados" or "municipios"
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per region.
+        """
+        latest = self._latest[level]
+        columns = [
+            column for column in _region_columns[level] + ("data", ) +
+            _total_columns if column in latest
+        ]
+        return latest[columns]
+
+    def get_response(self, key, compute):
+        """Get the encoded response for `key`, calling `compute` once"""
+        return self._responses.get_or_compute(key, compute)
+
+
+# xxxxxxxxxx Service xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+class QueryService:
+    """
+    HTTP service answering queries on a `Dataset` kept in memory.
+
+    Parameters
+    ----------
+    dataset : Dataset, optional
+        The initial dataset. If not provided, it is loaded with `loader` when
+        the service starts.
+    loader : Callable[[], pd.DataFrame], optional
+        Function returning the current data of the ministry (e.g.
+        `covid19.scrap.get_covid_data`). It is called in a worker thread.
+    refresh_interval : float | None
+        Time (in seconds) between the calls to `loader`. If None, the data is
+        never refreshed.
+    levels : tuple[str]
+        The levels that are served
+    medias_moveis : bool
+        If True, the moving averages are also served
+    """
+    def __init__(self,
+                 dataset=None,
+                 loader=None,
+                 refresh_interval=3600.0,
+                 levels=LEVELS,
+                 medias_moveis=False):
+        if dataset is None and loader is None:
+            raise ValueError("Either a dataset or a loader must be provided")
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.levels = tuple(levels)
+        self.medias_moveis = medias_moveis
+        self._dataset = dataset
+        self._server = None
+        self._refresh_task = None
+        self._refresh_lock = None
+        self._connections = {}
+
+    @property
+    def dataset(self):
+        """Dataset: The dataset currently served"""
+        return self._dataset
+
+    def swap(self, dataset):
+        """
+        Serve `dataset` from now on.
+
+        Requests already being answered keep using the previous dataset.
+        """
+        self._dataset = dataset
+
+    @property
+    def port(self):
+        """int: The port the service is listening on"""
+        return self._server.sockets[0].getsockname()[1]
+
+    def _load(self, current):
+        """Load a new dataset, or return None if the data did not change"""
+        data = self.loader()
+        source = data.attrs.get("source")
+        if current is not None and source is not None \
+                and source == current.source:
+            return None
+        return Dataset.from_data(data,
+                                 levels=self.levels,
+                                 medias_moveis=self.medias_moveis)
+
+    async def refresh(self):
+        """
+        Load the data with `loader` and swap to it if it changed.
+
+        The data is loaded and derived in a worker thread, such that requests
+        are still answered in the meantime.
+
+        Returns
+        -------
+        bool
+            True if a new dataset is served.
+        """
+        if self.loader is None:
+            return False
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            loop = asyncio.get_running_loop()
+            dataset = await loop.run_in_executor(None, self._load,
+                                                 self._dataset)
+            if dataset is None:
+                logging.info("The data did not change")
+                return False
+            self.swap(dataset)
+            logging.info("Serving the data up to %s", dataset.last_date)
+            return True
+
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:  # pylint: disable=broad-except
+                logging.warning("Could not refresh the data: %s", e)
+
+    async def start(self, host="127.0.0.1", port=8000):
+        """
+        Load the data (if needed) and start listening on `host` and `port`.
+
+        Parameters
+        ----------
+        host : str
+            The address the service listens on
+        port : int
+            The port the service listens on (0 for any free port)
+        """
+        if self._dataset is None:
+            await self.refresh()
+        self._server = await asyncio.start_server(self._handle_connection,
+                                                  host, port)
+        if self.loader is not None and self.refresh_interval:
+            self._refresh_task = asyncio.create_task(
+                self._refresh_periodically())
+
+    async def stop(self):
+        """Stop listening and close all connections"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._server is not None:
+            self._server.close()
+            # Closing the connections ends the requests waiting for data
+            for writer in list(self._connections.values()):
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self, host="127.0.0.1", port=8000):
+        """Start the service and answer requests until cancelled"""
+        await self.start(host, port)
+        logging.info("Serving on http://%s:%d", host, self.port)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    # xxxxxxxxxx Requests xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def handle_request(self, method, target, headers=None):
+        """
+        Answer a request.
+
+        Parameters
+        ----------
+        method : str
+            The HTTP method ("GET" or "HEAD")
+        target : str
+            The path and query of the request (e.g. "/estados/CE?format=arrow")
+        headers : dict[str, str], optional
+            The headers of the request, with lowercase names
+
+        Returns
+        -------
+        Response
+            The status, the content type and the body of the response.
+        """
+        try:
+            if method not in ("GET", "HEAD"):
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED,
+                                f"Method {method} is not allowed")
+            dataset = self._dataset
+            if dataset is None:
+                raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE,
+                                "The data is not loaded yet")
+            url = urlsplit(target)
+            query = {
+                name: values[-1]
+                for name, values in parse_qs(url.query).items()
+            }
+            file_format = self._get_format(query, headers or {})
+            parts = tuple(
+                unquote(part) for part in url.path.strip("/").split("/")
+                if part)
+            key = (parts, file_format, query.get("start"), query.get("end"))
+            content_type, compute = self._route(dataset, parts, file_format,
+                                                query)
+            return Response(HTTPStatus.OK, content_type,
+                            dataset.get_response(key, compute))
+        except HTTPError as e:
+            return Response(e.status, _json_content_type,
+                            _encode_json({"error": e.message}))
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Could not answer %s %s", method, target)
+            return Response(HTTPStatus.INTERNAL_SERVER_ERROR,
+                            _json_content_type,
+                            _encode_json({"error": "Internal server error"}))
+
+    @staticmethod
+    def _get_format(query, headers):
+        file_format = query.get("format")
+        if file_format is None:
+            accept = headers.get("accept", "")
+            return "arrow" if _arrow_content_type in accept else "json"
+        if file_format not in ("json", "arrow"):
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            f"Unknown format: {file_format}")
+        return file_format
+
+    def _route(self, dataset, parts, file_format, query):
+        """The content type and the function computing the response body"""
+        if len(parts) <= 1 and parts[:1] in ((), ("summary", )):
+            if file_format != "json":
+                raise HTTPError(HTTPStatus.NOT_ACCEPTABLE,
+                                "Only JSON is available")
+            if not parts:
+                body = {
+                    "levels": list(dataset.frames),
+                    "last_date": dataset.last_date
+                }
+            else:
+                body = dataset.summary
+            return _json_content_type, functools.partial(_encode_json, body)
+
+        level = parts[0]
+        if level not in dataset.frames or len(parts) > 2 or (
+                _keys[level] is None and len(parts) == 2):
+            raise HTTPError(HTTPStatus.NOT_FOUND, "Not found")
+        if _keys[level] is not None and len(parts) == 1:
+            if file_format == "arrow":
+                return _arrow_content_type, lambda: _encode_arrow(
+                    dataset.get_regions(level))
+            return _json_content_type, lambda: _encode_json({
+                "level": level,
+                "regions": _get_columns(dataset.get_regions(level))
+            })
+
+        region = parts[1] if len(parts) == 2 else None
+        start, end = (None if query.get(name) is None else _parse_date(
+            query[name], name) for name in ("start", "end"))
+        try:
+            rows = dataset.get_rows(level, region, start, end)
+        except KeyError:
+            raise HTTPError(HTTPStatus.NOT_FOUND,
+                            f"Unknown region: {region}") from None
+        if file_format == "arrow":
+            return _arrow_content_type, lambda: _encode_arrow(
+                dataset.get_series(level, region, start, end))
+        return _json_content_type, lambda: _encode_json({
+            "level": level,
+            "region": region,
+            "series": dataset.get_series_values(rows, level)
+        })
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                # Requests to this service have no body, but it must be read
+                # to get to the next request
+                if headers.get("content-length"):
+                    await reader.readexactly(int(headers["content-length"]))
+
+                try:
+                    method, target, version = request_line.decode(
+                        "latin-1").split()
+                except ValueError:
+                    method, target, version = None, None, "HTTP/1.0"
+                    response = Response(
+                        HTTPStatus.BAD_REQUEST, _json_content_type,
+                        _encode_json({"error": "Invalid request"}))
+                else:
+                    response = self.handle_request(method, target, headers)
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = (connection != "close"
+                              if version == "HTTP/1.1" else connection
+                              == "keep-alive")
+                status = HTTPStatus(response.status)
+                head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                        f"Content-Type: {response.content_type}\r\n"
+                        f"Content-Length: {len(response.body)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"
+                        "\r\n\r\n").encode("latin-1")
+                writer.write(head if method == "HEAD" else head +
+                             response.body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+# xxxxxxxxxx Command line xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def _load_data_file(data_filename, fetch):
+    if fetch:
+        fetch_data_file(data_filename)
+    return read_datafile_from_disc(data_filename)
+
+
+def _get_parser():
+    parser = argparse.ArgumentParser(
+        prog="covid19-server",
+        description="Serve the covid19 data of Brazil, the states and the "
+        "municipalities over HTTP.")
+    parser.add_argument("--host",
+                        default="127.0.0.1",
+                        help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("-p",
+                        "--port",
+                        type=int,
+                        default=8000,
+                        help="port to listen on (default: 8000)")
+    parser.add_argument("-l",
+                        "--levels",
+                        nargs="+",
+                        choices=list(LEVELS),
+                        default=list(LEVELS),
+                        help="levels that are served (default: all)")
+    parser.add_argument("--data-file",
+                        default=DATA_FILENAME,
+                        help=f"the data file (default: {DATA_FILENAME})")
+    parser.add_argument("--medias-moveis",
+                        action="store_true",
+                        help="also serve the moving averages")
+    parser.add_argument("--no-fetch",
+                        dest="fetch",
+                        action="store_false",
+                        help="use the existing data file without downloading")
+    parser.add_argument("--refresh-interval",
+                        type=float,
+                        default=3600.0,
+                        help="seconds between the refreshes of the data "
+                        "(default: 3600, 0 to never refresh)")
+    parser.add_argument("-v",
+                        "--verbose",
+                        action="store_true",
+                        help="log what is being done")
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the `covid19-server` command.
+
+    Parameters
+    ----------
+    argv : list[str], optional
+        The command line arguments (the default is `sys.argv[1:]`)
+
+    Returns
+    -------
+    int
+        The exit status.
+    """
+    args = _get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    service = QueryService(loader=functools.partial(_load_data_file,
+                                                    args.data_file,
+                                                    args.fetch),
+                           refresh_interval=args.refresh_interval or None,
+                           levels=tuple(dict.fromkeys(args.levels)),
+                           medias_moveis=args.medias_moveis)
+    try:
+        asyncio.run(service.serve_forever(args.host, args.port))
+    except Exception as e:  # pylint: disable=broad-except
+        logging.error("Could not serve the data: %r", e)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
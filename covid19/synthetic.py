@@ -0,0 +1,216 @@
+"""
+Deterministic synthetic data with the same shape as the ministry data file.
+
+The data has rows for Brazil, for the 27 states and for `num_municipalities`
+municipalities, for `num_days` consecutive days, in the same order and with the
+same columns as the sheet returned by `pd.read_excel` for the real file. Like
+the real file, it also has some duplicated rows and empty rows (without a date)
+at the end.
+
+The cases of each municipality grow exponentially from a random day and then
+stabilize. The data of each state is the sum of its municipalities and the data
+of Brazil is the sum of the states, such that the derived data is consistent
+across levels.
+
+This is used by the benchmarks and can be used to test the package without
+downloading the real file.
+"""
+import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .schema import STATES
+
+# Region and IBGE code of each state (in the order of `STATES`)
+_state_regions = {
+    "AC": ("Norte", 12), "AL": ("Nordeste", 27), "AM": ("Norte", 13),
+    "AP": ("Norte", 16), "BA": ("Nordeste", 29), "CE": ("Nordeste", 23),
+    "DF": ("Centro-Oeste", 53), "ES": ("Sudeste", 32),
+    "GO": ("Centro-Oeste", 52), "MA": ("Nordeste", 21), "MG": ("Sudeste", 31),
+    "MS": ("Centro-Oeste", 50), "MT": ("Centro-Oeste", 51),
+    "PA": ("Norte", 15), "PB": ("Nordeste", 25), "PE": ("Nordeste", 26),
+    "PI": ("Nordeste", 22), "PR": ("Sul", 41), "RJ": ("Sudeste", 33),
+    "RN": ("Nordeste", 24), "RO": ("Norte", 11), "RR": ("Norte", 14),
+    "RS": ("Sul", 43), "SC": ("Sul", 42), "SE": ("Nordeste", 28),
+    "SP": ("Sudeste", 35), "TO": ("Norte", 17)
+}
+
+_columns = [
+    "regiao", "estado", "municipio", "coduf", "codmun", "codRegiaoSaude",
+    "nomeRegiaoSaude", "data", "semanaEpi", "populacaoTCU2019",
+    "casosAcumulado", "obitosAcumulado", "Recuperadosnovos",
+    "emAcompanhamentoNovos", "interior/metropolitana"
+]
+
+
+def _get_epidemiological_weeks(dates: pd.DatetimeIndex):
+    """
+    Get the epidemiological week of each date.
+
+    Epidemiological weeks start on Sunday and the first week of a year is the
+    first one with at least four days in that year.
+    """
+    def first_day(year):
+        jan4 = datetime.date(year, 1, 4)
+        return jan4 - datetime.timedelta(days=(jan4.weekday() + 1) % 7)
+
+    weeks = []
+    for date in dates.date:
+        year = date.year
+        if date >= first_day(year + 1):
+            year += 1
+        elif date < first_day(year):
+            year -= 1
+        weeks.append((date - first_day(year)).days // 7 + 1)
+    return np.array(weeks, dtype=int)
+
+
+def _make_cumulative(rng, num_days, num_series, scale):
+    """Cumulative cases and deaths with shape (num_days, num_series)"""
+    start = rng.integers(0, max(num_days // 2, 1), num_series)
+    growth = rng.uniform(0.05, 0.2, num_series)
+    peak = rng.uniform(0.1, 1.0, num_series) * scale
+    days = np.arange(num_days)[:, np.newaxis] - start
+    rate = peak / (1 + np.exp(-growth * (days - 30)))
+    rate[days < 0] = 0
+    new_cases = rng.poisson(rate)
+    new_deaths = rng.binomial(new_cases, 0.02)
+    return np.cumsum(new_cases, axis=0), np.cumsum(new_deaths, axis=0)
+
+
+def make_ministry_data(num_municipalities=100,
+                       num_days=120,
+                       start_date="2020-02-25",
+                       num_duplicates=10,
+                       num_empty_rows=10,
+                       seed=0):
+    """
+    Create synthetic data similar to what `pd.read_excel` returns.
+
+    Parameters
+    ----------
+    num_municipalities : int
+        Number of municipalities (distributed among the states)
+    num_days : int
+        Number of days
+    start_date : str
+        The first date
+    num_duplicates : int
+        Number of randomly chosen rows that are duplicated
+    num_empty_rows : int
+        Number of empty rows appended at the end
+    seed : int
+        Seed of the random number generator. The same seed always gives the
+        same data.
+
+    Returns
+    -------
+    pd.DataFrame
+        The synthetic data.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start_date, periods=num_days)
+    epi_weeks = _get_epidemiological_weeks(dates)
+
+    # xxxxxxxxxx Municipalities xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    mun_state = np.arange(num_municipalities) % len(STATES)
+    mun_number = np.arange(num_municipalities) // len(STATES)
+    mun_coduf = np.array([_state_regions[s][1] for s in STATES])[mun_state]
+    mun_codmun = mun_coduf * 10000 + mun_number * 10
+    mun_health_region = mun_coduf * 1000 + mun_number % 5 + 1
+    mun_population = rng.integers(1_000, 300_000, num_municipalities)
+    mun_cases, mun_deaths = _make_cumulative(rng, num_days,
+                                             num_municipalities, 200)
+
+    # The data of each state is the sum of its municipalities
+    state_indicator = np.zeros((num_municipalities, len(STATES)), dtype=int)
+    state_indicator[np.arange(num_municipalities), mun_state] = 1
+    state_cases = mun_cases @ state_indicator
+    state_deaths = mun_deaths @ state_indicator
+    state_population = mun_population @ state_indicator
+
+    def block(num_regions, **columns):
+        """Rows for `num_regions` regions, each with all dates"""
+        block_data = {column: np.nan for column in _columns}
+        for column, values in columns.items():
+            values = np.asarray(values)
+            if values.ndim == 2:
+                # Values with shape (num_days, num_regions)
+                block_data[column] = values.T.ravel()
+            elif values.ndim == 1:
+                block_data[column] = np.repeat(values, num_days)
+            else:
+                block_data[column] = values
+        block_data["data"] = np.tile(dates.to_numpy(), num_regions)
+        block_data["semanaEpi"] = np.tile(epi_weeks, num_regions)
+        return pd.DataFrame(block_data, columns=_columns)
+
+    brazil = block(1,
+                   regiao="Brasil",
+                   coduf=76,
+                   populacaoTCU2019=[state_population.sum()],
+                   casosAcumulado=state_cases.sum(axis=1, keepdims=True),
+                   obitosAcumulado=state_deaths.sum(axis=1, keepdims=True),
+                   Recuperadosnovos=rng.integers(0, 1000, (num_days, 1)),
+                   emAcompanhamentoNovos=rng.integers(0, 1000, (num_days, 1)))
+    states = block(len(STATES),
+                   regiao=[_state_regions[s][0] for s in STATES],
+                   estado=list(STATES),
+                   coduf=[_state_regions[s][1] for s in STATES],
+                   populacaoTCU2019=state_population,
+                   casosAcumulado=state_cases,
+                   obitosAcumulado=state_deaths)
+    municipalities = block(
+        num_municipalities,
+        regiao=[_state_regions[STATES[s]][0] for s in mun_state],
+        estado=[STATES[s] for s in mun_state],
+        municipio=[f"Município {c}" for c in mun_codmun],
+        coduf=mun_coduf,
+        codmun=mun_codmun.astype(float),
+        codRegiaoSaude=mun_health_region.astype(float),
+        nomeRegiaoSaude=[f"Região {c}" for c in mun_health_region],
+        populacaoTCU2019=mun_population,
+        casosAcumulado=mun_cases,
+        obitosAcumulado=mun_deaths,
+        **{"interior/metropolitana": rng.integers(0, 2, num_municipalities)})
+    data = pd.concat([brazil, states, municipalities], ignore_index=True)
+
+    # xxxxxxxxxx Cleaning problems of the real file xxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    duplicates = data.iloc[np.sort(
+        rng.choice(data.shape[0], num_duplicates, replace=False))]
+    empty_rows = pd.DataFrame(np.nan,
+                              index=range(num_empty_rows),
+                              columns=_columns)
+    empty_rows["data"] = pd.NaT
+    return pd.concat([data, duplicates, empty_rows], ignore_index=True)
+
+
+def write_ministry_file(filename, **kwargs):
+    """
+    Write synthetic data to a file like the one provided by the ministry.
+
+    Parameters
+    ----------
+    filename : str | Path
+        The name of the file. The format depends on the suffix: ".xlsx" for a
+        spreadsheet and ".csv" for a CSV file (separated by ";" and with
+        latin-1 encoding, as read by `covid19.scrap.read_csv_datafile`).
+    **kwargs : Any
+        Arguments passed to `make_ministry_data`
+
+    Returns
+    -------
+    pd.DataFrame
+        The synthetic data written to the file.
+    """
+    data = make_ministry_data(**kwargs)
+    suffix = Path(filename).suffix
+    if suffix == ".xlsx":
+        data.to_excel(filename, index=False)
+    elif suffix == ".csv":
+        data.to_csv(filename, sep=";", encoding="latin-1", index=False)
+    else:
+        raise ValueError(f"Unknown file format: {suffix}")
+    return data
@@ -0,0 +1,122 @@
+"""
+Índice para encontrar a data em que cada região ultrapassou um número de casos.
+
+`get_date_date_cases_greater_than` percorre todo o DataFrame a cada chamada.
+O `ThresholdIndex` ordena os dados por região e data uma única vez e, como os
+valores acumulados não diminuem ao longo do tempo, responde a "primeira data
+com mais que X casos" com uma busca binária (`np.searchsorted`), para
+qualquer região e para vários limiares de uma só vez.
+"""
+import numpy as np
+import pandas as pd
+
+
+class ThresholdIndex:
+    """
+    Índice das datas em que cada região ultrapassou cada número de casos.
+
+    Se os valores acumulados de uma região diminuírem em algum dia (por
+    exemplo, por uma correção nos dados) é considerado o maior valor até esse
+    dia, de forma que a resposta é sempre a primeira data em que o valor
+    ultrapassou o limiar.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Os dados, com uma coluna "data"
+    chave : str, optional
+        Nome da coluna que identifica cada região (ex.: "estado" ou "codmun").
+        Se não for fornecido, os dados são de uma única região (ex.: Brasil).
+    coluna : str
+        Nome da coluna com os valores acumulados
+    """
+    def __init__(self, df: pd.DataFrame, chave=None, coluna="casosAcumulado"):
+        if chave is None:
+            codigos = np.zeros(df.shape[0], dtype=int)
+            self.regioes = pd.Index([None])
+        else:
+            codigos, regioes = pd.factorize(df[chave], sort=True)
+            self.regioes = pd.Index(regioes, name=chave)
+
+        datas = pd.to_datetime(df["data"]).to_numpy(dtype="datetime64[ns]")
+        ordem = np.lexsort((datas, codigos))
+        ordem = ordem[codigos[ordem] >= 0]
+        codigos = codigos[ordem]
+
+        valores = df[coluna].to_numpy(dtype=float, na_value=0.0)[ordem]
+        valores = np.nan_to_num(valores).astype(np.int64)
+
+        # Os valores de todas as regiões ficam em um único array crescente:
+        # cada região é deslocada de um valor maior que todos os valores
+        self._deslocamento = max(int(valores.max(initial=0)) + 1, 1)
+        valores = np.maximum.accumulate(
+            np.maximum(valores, 0) + codigos * self._deslocamento)
+        self._valores = valores
+
+        self._datas = df["data"].to_numpy()[ordem]
+        self._fim = np.searchsorted(codigos,
+                                    np.arange(len(self.regioes)),
+                                    side="right")
+
+    def first_dates(self, thresholds, regions=None):
+        """
+        Retorna a primeira data com valor maior que cada limiar, por região.
+
+        Parameters
+        ----------
+        thresholds : list[int]
+            Os limiares
+        regions : list, optional
+            As regiões. Se não for fornecido, todas as regiões são retornadas.
+
+        Returns
+        -------
+        pd.DataFrame
+            Um DataFrame indexado pelas regiões, com uma coluna para cada
+            limiar. Regiões que nunca ultrapassaram um limiar ficam com None.
+        """
+        thresholds = np.asarray(thresholds, dtype=np.int64)
+        if regions is None:
+            posicoes_regioes = np.arange(len(self.regioes))
+        else:
+            posicoes_regioes = self.regioes.get_indexer(regions)
+            if (posicoes_regioes < 0).any():
+                raise KeyError(f"Regiões desconhecidas: {regions}")
+
+        # Uma única busca para todas as regiões e limiares
+        consultas = (thresholds[np.newaxis, :] + posicoes_regioes[:, np.newaxis]
+                     * self._deslocamento)
+        consultas = np.maximum(consultas,
+                               posicoes_regioes[:, np.newaxis] *
+                               self._deslocamento - 1)
+        posicoes = np.searchsorted(self._valores, consultas, side="right")
+        encontrou = (posicoes < self._fim[posicoes_regioes, np.newaxis]) & (
+            thresholds[np.newaxis, :] < self._deslocamento)
+
+        datas = np.full(posicoes.shape, None, dtype=object)
+        datas[encontrou] = self._datas[posicoes[encontrou]]
+        return pd.DataFrame(datas,
+                            index=self.regioes[posicoes_regioes],
+                            columns=thresholds.tolist())
+
+    def first_date(self, threshold=0, region=None):
+        """
+        Retorna a primeira data com valor maior que `threshold` em `region`.
+
+        Parameters
+        ----------
+        threshold : int
+            O limiar
+        region : Any, optional
+            A região. Pode ser omitida se o índice tiver uma única região.
+
+        Returns
+        -------
+        datetime.date | None
+            A data, ou None se o limiar nunca foi ultrapassado.
+        """
+        if region is None:
+            if len(self.regioes) != 1:
+                raise ValueError("A região deve ser fornecida")
+            region = self.regioes[0]
+        return self.first_dates([threshold], [region]).iat[0, 0]
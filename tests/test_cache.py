@@ -0,0 +1,163 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+from covid19 import scrap
+from covid19.cache import (get_cache_filenames, get_metadata_filename,
+                           load_cached_frame, load_file_metadata)
+from covid19.memo import frame_cache
+from covid19.quality import REPORT_ATTR
+from covid19.scrap import read_datafile_from_disc
+from covid19.synthetic import make_ministry_data
+
+try:
+    import pyarrow  # noqa: F401
+    has_parquet = True
+except ImportError:
+    has_parquet = False
+
+
+@unittest.skipUnless(has_parquet, "pyarrow is not installed")
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = Path(self.tmp_dir) / "dados.xlsx"
+        shutil.copy("dados_test_CE.xlsx", self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_datafile_from_disc_uses_cache(self):
+        self.assertIsNone(load_cached_frame(self.filename))
+        data = read_datafile_from_disc(self.filename)
+        for cache_filename in get_cache_filenames(self.filename):
+            self.assertTrue(cache_filename.exists())
+
+        # The second read must not parse the spreadsheet (also when the data
+        # is not in memory anymore)
+        frame_cache.clear()
+        with mock.patch("pandas.read_excel", side_effect=AssertionError):
+            cached_data = read_datafile_from_disc(self.filename)
+        pd.testing.assert_frame_equal(cached_data, data)
+
+    def test_cache_has_cleaned_data(self):
+        make_ministry_data(num_municipalities=10,
+                           num_days=20).to_excel(self.filename, index=False)
+        data = read_datafile_from_disc(self.filename)
+        report = data.attrs[REPORT_ATTR]
+        self.assertGreater(report.duplicates.shape[0], 0)
+
+        # The cached data is not cleaned again and keeps its quality report
+        frame_cache.clear()
+        with mock.patch("covid19.scrap.clean_levels",
+                        side_effect=AssertionError):
+            cached_data = read_datafile_from_disc(self.filename)
+        pd.testing.assert_frame_equal(cached_data, data)
+        pd.testing.assert_frame_equal(
+            cached_data.attrs[REPORT_ATTR].duplicates, report.duplicates)
+
+    def test_cache_is_invalidated_when_file_changes(self):
+        read_datafile_from_disc(self.filename)
+
+        # Touching the file does not invalidate the cache, since the content
+        # is the same
+        stat = os.stat(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10))
+        self.assertIsNotNone(load_cached_frame(self.filename))
+
+        # Changing the content invalidates it
+        data = pd.read_excel("dados_test_Brasil.xlsx")
+        data.to_excel(self.filename, index=False)
+        self.assertIsNone(load_cached_frame(self.filename))
+        new_data = read_datafile_from_disc(self.filename)
+        self.assertEqual(new_data.shape[0], data.shape[0])
+        self.assertEqual(load_cached_frame(self.filename).shape[0],
+                         data.shape[0])
+
+    def test_file_replaced_while_parsed(self):
+        read_excel = pd.read_excel
+
+        def replace_file(filename):
+            data = read_excel(filename)
+            # The file is downloaded again while the old one is parsed
+            shutil.copy("dados_test_Brasil.xlsx", self.filename)
+            stat = os.stat(self.filename)
+            os.utime(self.filename,
+                     ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            return data
+
+        with mock.patch("pandas.read_excel", side_effect=replace_file), \
+                self.assertLogs(level="WARNING"):
+            data = read_datafile_from_disc(self.filename)
+        self.assertEqual(set(data.estado.dropna()), {"CE"})
+        # Neither the cache nor the metadata are saved for the new file
+        self.assertIsNone(load_cached_frame(self.filename))
+        self.assertIsNone(load_file_metadata(self.filename))
+
+        frame_cache.clear()
+        new_data = read_datafile_from_disc(self.filename)
+        self.assertTrue(new_data.estado.isna().all())
+        self.assertIsNotNone(load_cached_frame(self.filename))
+
+    def test_read_datafile_from_disc_without_cache(self):
+        read_datafile_from_disc(self.filename, use_cache=False)
+        for cache_filename in get_cache_filenames(self.filename):
+            self.assertFalse(cache_filename.exists())
+
+
+
+class TestFileMetadata(unittest.TestCase):
+    def setUp(self):
+        frame_cache.clear()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = Path(self.tmp_dir) / "dados.xlsx"
+        shutil.copy("dados_test_CE.xlsx", self.filename)
+
+    def tearDown(self):
+        frame_cache.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_metadata(self):
+        self.assertIsNone(load_file_metadata(self.filename))
+        data = read_datafile_from_disc(self.filename)
+        self.assertTrue(get_metadata_filename(self.filename).exists())
+
+        metadata = load_file_metadata(self.filename)
+        self.assertEqual(metadata["max_date"], data.data.max())
+        self.assertEqual(metadata["rows"], data.shape[0])
+
+        # Touching the file keeps the metadata valid
+        stat = os.stat(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10))
+        self.assertEqual(load_file_metadata(self.filename), metadata)
+
+        # Changing the content invalidates it
+        pd.read_excel("dados_test_Brasil.xlsx").to_excel(self.filename,
+                                                         index=False)
+        self.assertIsNone(load_file_metadata(self.filename))
+
+    def test_get_covid_data_does_not_read_stale_file(self):
+        read_datafile_from_disc(self.filename)
+        frame_cache.clear()
+
+        with mock.patch.object(scrap, "_data_filename", str(self.filename)), \
+                mock.patch.object(scrap, "_download_log_file",
+                                  str(Path(self.tmp_dir) / "download.log")), \
+                mock.patch.object(scrap, "_download_covid_data",
+                                  return_value=False) as download, \
+                mock.patch.object(scrap, "read_datafile_from_disc",
+                                  wraps=read_datafile_from_disc) as read:
+            scrap.get_covid_data()
+        download.assert_called_once()
+        # Only the data after the download is read
+        read.assert_called_once_with(str(self.filename))
+
+
+# xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import contextlib
+import io
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+from covid19.cache import get_metadata_filename
+from covid19.cli import main, run_pipeline
+from covid19.covid import get_all_states_data
+from covid19.scrap import DERIVED_DATA_GETTERS, read_datafile_from_disc
+
+try:
+    import pyarrow  # noqa: F401
+    has_parquet = True
+except ImportError:
+    has_parquet = False
+
+
+class FakeFetcher:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def fetch(self, destination):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return False
+
+
+@unittest.skipUnless(has_parquet, "pyarrow is not installed")
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.filename = self.tmp_dir / "dados.xlsx"
+        self.output_dir = self.tmp_dir / "output"
+        shutil.copy("dados_test_CE.xlsx", self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_pipeline(self, fetch=False, **kwargs):
+        return run_pipeline(self.output_dir,
+                            data_filename=self.filename,
+                            fetch=fetch,
+                            **kwargs)
+
+    def test_export(self):
+        status = self.run_pipeline()
+        self.assertEqual(status, {
+            "brasil": "exported",
+            "estados": "exported",
+            "municipios": "exported"
+        })
+        data_estados = get_all_states_data(
+            read_datafile_from_disc(self.filename))
+        exported = pd.read_parquet(self.output_dir / "estados.parquet")
+        pd.testing.assert_frame_equal(exported,
+                                      data_estados.reset_index(drop=True))
+
+    def test_skip_unchanged_levels(self):
+        self.run_pipeline(levels=("estados", ))
+        with mock.patch("covid19.cli.read_datafile_from_disc",
+                        side_effect=AssertionError):
+            status = self.run_pipeline(levels=("estados", ))
+        self.assertEqual(status, {"estados": "skipped"})
+
+        # Other levels, formats or options are not current
+        status = self.run_pipeline(levels=("brasil", "estados"),
+                                   file_format="csv")
+        self.assertEqual(status, {"brasil": "exported", "estados": "exported"})
+        status = self.run_pipeline(levels=("estados", ), medias_moveis=True)
+        self.assertEqual(status, {"estados": "exported"})
+        self.assertTrue((self.output_dir / "estados.csv").exists())
+
+        status = self.run_pipeline(levels=("estados", ),
+                                   medias_moveis=True,
+                                   force=True)
+        self.assertEqual(status, {"estados": "exported"})
+
+    def test_missing_metadata(self):
+        self.run_pipeline(levels=("estados", ))
+        # The data is in memory, so reading the file again does not save its
+        # metadata
+        get_metadata_filename(self.filename).unlink()
+        status = self.run_pipeline(levels=("estados", ), force=True)
+        self.assertEqual(status, {"estados": "exported"})
+        self.assertFalse(get_metadata_filename(self.filename).exists())
+        # The levels are still skipped using the hash of the file
+        status = self.run_pipeline(levels=("estados", ))
+        self.assertEqual(status, {"estados": "skipped"})
+
+    def test_changed_data_file(self):
+        self.run_pipeline(levels=("brasil", ))
+        shutil.copy("dados_test_Brasil.xlsx", self.filename)
+        status = self.run_pipeline(levels=("brasil", ))
+        self.assertEqual(status, {"brasil": "exported"})
+
+    def test_fetch(self):
+        fetcher = FakeFetcher()
+        self.run_pipeline(levels=("brasil", ), fetch=True, fetcher=fetcher)
+        self.assertEqual(fetcher.calls, 1)
+
+        # If the download fails, the existing file is used
+        fetcher = FakeFetcher(TimeoutError())
+        status = self.run_pipeline(levels=("brasil", ),
+                                   fetch=True,
+                                   fetcher=fetcher,
+                                   force=True)
+        self.assertEqual(status, {"brasil": "exported"})
+        # Also for errors of the browser
+        status = self.run_pipeline(levels=("brasil", ),
+                                   fetch=True,
+                                   fetcher=FakeFetcher(RuntimeError()),
+                                   force=True)
+        self.assertEqual(status, {"brasil": "exported"})
+
+        self.filename.unlink()
+        with self.assertRaises(TimeoutError):
+            self.run_pipeline(fetch=True, fetcher=fetcher)
+
+    def test_failed_level(self):
+        getters = dict(DERIVED_DATA_GETTERS,
+                       municipios=mock.Mock(side_effect=ValueError("bad")))
+        with mock.patch.dict("covid19.cli.DERIVED_DATA_GETTERS", getters), \
+                self.assertLogs(level="ERROR"), \
+                self.assertRaises(ValueError):
+            self.run_pipeline()
+        # Only the level that failed is exported again
+        status = self.run_pipeline()
+        self.assertEqual(status, {
+            "brasil": "skipped",
+            "estados": "skipped",
+            "municipios": "exported"
+        })
+
+    def test_main(self):
+        args = [
+            "--no-fetch", "--data-file",
+            str(self.filename), "-o",
+            str(self.output_dir), "-l", "brasil", "--timing"
+        ]
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            self.assertEqual(main(args), 0)
+        self.assertEqual(stdout.getvalue(), "brasil: exported\n")
+        self.assertIn("export_brasil", stderr.getvalue())
+
+        # The existing file is used if the browser fails
+        with mock.patch("covid19.fetch.get_default_fetcher",
+                        return_value=FakeFetcher(RuntimeError())), \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(main(args[1:] + ["--force"]), 0)
+
+        self.filename.unlink()
+        with mock.patch("covid19.fetch.get_default_fetcher",
+                        return_value=FakeFetcher(RuntimeError())):
+            self.assertEqual(main(args[1:]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
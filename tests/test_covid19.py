@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 from datetime import date, datetime
 from pathlib import Path
@@ -6,10 +7,11 @@ import numpy as np
 import pandas as pd
 
 from covid19 import __version__
-from covid19.covid import (get_all_states_data, get_brazil_data,
-                           get_date_date_cases_greater_than,
+from covid19.covid import (get_all_municipalities_data, get_all_states_data,
+                           get_brazil_data, get_date_date_cases_greater_than,
                            get_dia_de_contaminacao_array)
-from covid19.scrap import get_covid_data, read_datafile_from_disc
+from covid19.scrap import (get_covid_data, read_csv_datafile,
+                           read_datafile_from_disc)
 
 
 class TestCovid19(unittest.TestCase):
@@ -20,6 +22,45 @@ class TestCovid19(unittest.TestCase):
     # data = get_covid_data()
     # pass
 
+    def test_read_datafile_from_disc(self):
+        data = read_datafile_from_disc("dados_test_CE.xlsx", use_cache=False)
+        self.assertEqual(data.data.iloc[0], date(2020, 3, 17))
+        self.assertEqual(data.diaDaSemana.iloc[0], "Terça")
+        self.assertEqual(data.diaDaSemana.iloc[5], "Domingo")
+        self.assertEqual(data.diaDaSemana.dtype, "category")
+
+    def test_read_csv_datafile(self):
+        data_brasil = pd.read_excel("dados_test_Brasil.xlsx")
+        data_ce = pd.read_excel("dados_test_CE.xlsx")
+        data_fortaleza = data_ce.copy()
+        data_fortaleza["municipio"] = "Fortaleza"
+        data_fortaleza["codmun"] = 230440
+        data = pd.concat([data_brasil, data_ce, data_fortaleza])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = Path(tmp_dir) / "dados.csv"
+            data.drop(columns="Unnamed: 0").to_csv(filename,
+                                                   sep=";",
+                                                   encoding="latin-1",
+                                                   index=False)
+            levels = read_csv_datafile(filename, chunksize=20)
+
+        self.assertEqual(levels["brasil"].shape[0], data_brasil.shape[0])
+        self.assertEqual(levels["estados"].shape[0], data_ce.shape[0])
+        self.assertEqual(levels["municipios"].shape[0],
+                         data_fortaleza.shape[0])
+        self.assertEqual(levels["municipios"].municipio.dtype, "category")
+        self.assertEqual(levels["municipios"].codmun.dtype, np.int32)
+        self.assertEqual(levels["estados"].codmun.dtype, "Int32")
+        self.assertEqual(levels["estados"].data.iloc[0], date(2020, 3, 17))
+        np.testing.assert_array_equal(levels["estados"].casosAcumulado,
+                                      data_ce.casosAcumulado)
+
+        data_all_states = get_all_states_data(levels["estados"])
+        np.testing.assert_array_equal(
+            data_all_states.diasDeContaminacao_100,
+            get_dia_de_contaminacao_array(data_ce, 100))
+
     def test_get_date_date_cases_greater_than(self):
         # Brasil
         data = pd.read_excel("dados_test_Brasil.xlsx")
@@ -105,6 +146,168 @@ class TestCovid19(unittest.TestCase):
         self.assertEqual(sum(data_all_states.duplicated(["estado", "data"])),
                          0)
 
+    def test_get_all_states_data_derived_columns(self):
+        # Two copies of the Ceará data, one of them as a different state,
+        # interleaved row by row
+        data_ce = pd.read_excel("dados_test_CE.xlsx")
+        data_xx = data_ce.copy()
+        data_xx["estado"] = "XX"
+        data_xx["casosAcumulado"] = data_xx.casosAcumulado // 10
+        data = pd.concat([data_ce, data_xx]).sort_index(kind="stable")
+
+        data_all_states = get_all_states_data(data)
+        for sigla, expected in [("CE", data_ce), ("XX", data_xx)]:
+            state_data = data_all_states[data_all_states.estado == sigla]
+            np.testing.assert_array_equal(
+                state_data.casosNovos,
+                np.diff(expected.casosAcumulado, prepend=0))
+            np.testing.assert_array_equal(
+                state_data.obitosNovos,
+                np.diff(expected.obitosAcumulado, prepend=0))
+            np.testing.assert_array_equal(
+                state_data.diasDeContaminacao_1,
+                get_dia_de_contaminacao_array(expected, 1))
+            np.testing.assert_array_equal(
+                state_data.diasDeContaminacao_100,
+                get_dia_de_contaminacao_array(expected, 100))
+
+    def test_get_all_states_data_por_municipio(self):
+        data = pd.read_excel("dados_test_CE.xlsx")
+        data["municipio"] = "Fortaleza"
+        data["codmun"] = 230440
+        data_municipios = get_all_states_data(data, por_municipio=True)
+
+        self.assertIn("codmun", data_municipios)
+        np.testing.assert_array_equal(data_municipios.casosNovos,
+                                      np.diff(data.casosAcumulado, prepend=0))
+        np.testing.assert_array_equal(data_municipios.diasDeContaminacao_1,
+                                      get_dia_de_contaminacao_array(data, 1))
+
+    def test_get_all_municipalities_data(self):
+        data_ce = pd.read_excel("dados_test_CE.xlsx")
+        data_ce["municipio"] = "Fortaleza"
+        data_ce["codmun"] = 230440
+        data_ce["codRegiaoSaude"] = 23001
+        data_sp = data_ce.copy()
+        data_sp["estado"] = "SP"
+        data_sp["municipio"] = "Campinas"
+        data_sp["codmun"] = 350950
+        data_sp["codRegiaoSaude"] = 35071
+        data_sp["casosAcumulado"] = data_sp.casosAcumulado // 10
+        # Shuffled data with a duplicated row
+        data = pd.concat([data_sp, data_ce, data_ce.iloc[[3]]])
+        data = data.sample(frac=1, random_state=0)
+
+        data_municipios = get_all_municipalities_data(data)
+        self.assertEqual(data_municipios.shape[0], 2 * data_ce.shape[0])
+        self.assertEqual(
+            sum(data_municipios.duplicated(["codmun", "data"])), 0)
+        for codmun, expected in [(230440, data_ce), (350950, data_sp)]:
+            city_data = data_municipios[data_municipios.codmun == codmun]
+            np.testing.assert_array_equal(
+                city_data.casosNovos,
+                np.diff(expected.casosAcumulado, prepend=0))
+            np.testing.assert_array_equal(
+                city_data.diasDeContaminacao_100,
+                get_dia_de_contaminacao_array(expected, 100))
+
+        data_municipios = get_all_municipalities_data(data, estado="SP")
+        self.assertEqual(list(data_municipios.codmun.unique()), [350950])
+        data_municipios = get_all_municipalities_data(data,
+                                                      codRegiaoSaude=[23001])
+        self.assertEqual(list(data_municipios.codmun.unique()), [230440])
+
+    def test_medias_moveis(self):
+        data_ce = pd.read_excel("dados_test_CE.xlsx")
+        data_sp = data_ce.copy()
+        data_sp["estado"] = "SP"
+        data = pd.concat([data_sp, data_ce])
+        data["data"] = pd.to_datetime(data.data).dt.date
+
+        data_estados = get_all_states_data(data, medias_moveis=True)
+        pd.testing.assert_frame_equal(
+            data_estados.drop(columns=[
+                "mediaCasosNovos_7", "mediaCasosNovos_14",
+                "mediaObitosNovos_7", "mediaObitosNovos_14",
+                "casosNovosAjustados", "obitosNovosAjustados"
+            ]), get_all_states_data(data))
+        for estado in ("CE", "SP"):
+            state_data = data_estados[data_estados.estado == estado]
+            for janela in (7, 14):
+                np.testing.assert_allclose(
+                    state_data[f"mediaCasosNovos_{janela}"],
+                    state_data.casosNovos.astype(float).rolling(janela).mean())
+                np.testing.assert_allclose(
+                    state_data[f"mediaObitosNovos_{janela}"],
+                    state_data.obitosNovos.astype(float).rolling(janela).mean())
+
+    def test_medias_moveis_ajuste_semanal(self):
+        # 100 new cases per day, but half of them are only reported on Monday
+        # (after the weekend)
+        datas = pd.date_range("2020-03-02", periods=8 * 7)
+        fatores = np.array([1.5, 1.0, 1.0, 1.0, 1.0, 0.75, 0.75])
+        casos_novos = 100 * fatores[datas.weekday]
+        data = pd.DataFrame({
+            "regiao": "Brasil",
+            "estado": np.nan,
+            "municipio": np.nan,
+            "coduf": 76,
+            "codmun": np.nan,
+            "codRegiaoSaude": np.nan,
+            "nomeRegiaoSaude": np.nan,
+            "data": datas.date,
+            "casosAcumulado": np.cumsum(casos_novos),
+            "obitosAcumulado": np.cumsum(casos_novos) // 10,
+        })
+        data_brasil = get_brazil_data(data, medias_moveis=True)
+        np.testing.assert_allclose(data_brasil.casosNovosAjustados, 100.0)
+        np.testing.assert_allclose(data_brasil.mediaCasosNovos_7[6:], 100.0)
+
+        # The weekday adjustment keeps the values of series without weekly
+        # data
+        data_brasil = get_brazil_data(data.iloc[:5], medias_moveis=True)
+        np.testing.assert_allclose(data_brasil.casosNovosAjustados,
+                                   data_brasil.casosNovos)
+
+    def test_medias_moveis_com_datas_faltantes(self):
+        # 100 new cases per day, with a weekly pattern, but the data of 3 days
+        # is missing. The cases of these days are reported in the next day
+        datas = pd.date_range("2020-03-02", periods=8 * 7)
+        fatores = np.array([1.5, 1.0, 1.0, 1.0, 1.0, 0.75, 0.75])
+        casos_novos = 100 * fatores[datas.weekday]
+        data = pd.DataFrame({
+            "regiao": "Brasil",
+            "estado": np.nan,
+            "municipio": np.nan,
+            "coduf": 76,
+            "codmun": np.nan,
+            "codRegiaoSaude": np.nan,
+            "nomeRegiaoSaude": np.nan,
+            "data": datas.date,
+            "casosAcumulado": np.cumsum(casos_novos),
+            "obitosAcumulado": np.cumsum(casos_novos) // 10,
+        })
+        faltantes = [20, 21, 22]
+        completo = get_brazil_data(data, medias_moveis=True)
+        com_lacuna = get_brazil_data(data.drop(index=faltantes),
+                                     medias_moveis=True)
+        self.assertEqual(com_lacuna.casosNovos[23], casos_novos[20:24].sum())
+
+        # The windows count days, not rows: the averages are the same of the
+        # complete data, except in the windows with only part of the missing
+        # days
+        for janela in (7, 14):
+            coluna = f"mediaCasosNovos_{janela}"
+            parciais = list(range(20 + janela, 23 + janela))
+            pd.testing.assert_series_equal(
+                com_lacuna[coluna].drop(index=parciais),
+                completo[coluna].drop(index=faltantes + parciais))
+            self.assertTrue(com_lacuna[coluna][:janela - 1].isna().all())
+
+        # The weekday factors ignore the windows with missing days
+        np.testing.assert_allclose(
+            com_lacuna.casosNovosAjustados.drop(index=23), 100.0)
+
     # def test_get_state_data(self):
     #     pass
 
@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from covid19.covid import get_all_states_data
+from covid19.dense import DenseStore
+from covid19.schema import apply_schema
+from covid19.scrap import _clean_data
+
+
+def _read_test_data():
+    """Data for two states (Ceará and a copy of it with fewer dates)"""
+    data_ce = pd.read_excel("dados_test_CE.xlsx")
+    data_sp = data_ce.iloc[10:].copy()
+    data_sp["estado"] = "SP"
+    data_sp["casosAcumulado"] *= 2
+    data = pd.concat([data_ce, data_sp], ignore_index=True)
+    return get_all_states_data(apply_schema(_clean_data(data)))
+
+
+class TestDenseStore(unittest.TestCase):
+    def setUp(self):
+        self.data_estados = _read_test_data()
+        self.store = DenseStore.from_frame(self.data_estados, "estado")
+
+    def test_from_frame(self):
+        dates = sorted(self.data_estados.data.unique())
+        self.assertEqual(self.store.regions.tolist(), ["CE", "SP"])
+        self.assertEqual(self.store.arrays["casosNovos"].shape,
+                         (len(dates), 2))
+        self.assertEqual(self.store.dates[0], np.datetime64(dates[0]))
+
+        data_ce = self.data_estados[self.data_estados.estado == "CE"]
+        series = self.store.get_series("casosNovos", "CE")
+        np.testing.assert_array_equal(series.to_numpy(),
+                                      data_ce.casosNovos.to_numpy(dtype=float))
+
+        # SP has no data for the first 10 dates
+        series = self.store.get_series("casosAcumulado", "SP")
+        self.assertTrue(series[:10].isna().all())
+        self.assertFalse(series[10:].isna().any())
+
+    def test_get_date(self):
+        last_date = self.data_estados.data.max()
+        values = self.store.get_date("casosAcumulado", last_date)
+        expected = self.data_estados[self.data_estados.data == last_date]
+        np.testing.assert_array_equal(
+            values.to_numpy(), expected.casosAcumulado.to_numpy(dtype=float))
+        self.assertEqual(
+            self.store.get_date("casosAcumulado", str(last_date)).tolist(),
+            values.tolist())
+        with self.assertRaises(KeyError):
+            self.store.get_date("casosAcumulado", date(2019, 1, 1))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.store.save(tmp_dir)
+            loaded = DenseStore.load(tmp_dir)
+            self.assertIsInstance(loaded.arrays["casosNovos"], np.memmap)
+            self.assertEqual(loaded.metrics, self.store.metrics)
+            self.assertEqual(loaded.regions.tolist(), ["CE", "SP"])
+            np.testing.assert_array_equal(loaded.dates, self.store.dates)
+            for metric in self.store.metrics:
+                np.testing.assert_array_equal(loaded.arrays[metric],
+                                              self.store.arrays[metric])
+            pd.testing.assert_series_equal(
+                loaded.get_series("obitosNovos", "SP"),
+                self.store.get_series("obitosNovos", "SP"))
+            del loaded
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from covid19.download import (download_covid_data, download_covid_data_async,
+                              download_covid_data_in_background)
+
+
+class FakeDownloadSource:
+    """
+    Download source that writes a file in chunks like a browser does.
+
+    The content is first written to a ".part" file in a separate thread. The
+    final (empty) file is created at the beginning, as Firefox does, and the
+    partial file is renamed to it at the end.
+    """
+    def __init__(self, content=b"covid data", delay=0.2, finish=True):
+        self.content = content
+        self.delay = delay
+        self.finish = finish
+        self.closed = False
+        self.download_dir = None
+
+    def _download(self, download_dir):
+        final_file = download_dir / "HIST_PAINEL_COVIDBR.xlsx"
+        partial_file = download_dir / "HIST_PAINEL_COVIDBR.xlsx.part"
+        final_file.touch()
+        with open(partial_file, mode="wb") as f:
+            for byte in self.content:
+                f.write(bytes([byte]))
+                f.flush()
+                time.sleep(self.delay / len(self.content))
+        if self.finish:
+            partial_file.replace(final_file)
+
+    def __call__(self, download_dir):
+        self.download_dir = download_dir
+        threading.Thread(target=self._download, args=(download_dir, )).start()
+        return self.close
+
+    def close(self):
+        self.closed = True
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.destination = Path(self.tmp_dir.name) / "dados.xlsx"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_download_covid_data(self):
+        source = FakeDownloadSource()
+        self.assertEqual(download_covid_data(self.destination, source),
+                         self.destination)
+        self.assertEqual(self.destination.read_bytes(), b"covid data")
+        self.assertTrue(source.closed)
+        # The temporary download folder is removed
+        self.assertFalse(source.download_dir.exists())
+        self.assertEqual(list(Path(self.tmp_dir.name).iterdir()),
+                         [self.destination])
+
+    def test_download_covid_data_timeout(self):
+        self.destination.write_bytes(b"old data")
+        source = FakeDownloadSource(finish=False)
+        with self.assertRaises(TimeoutError):
+            download_covid_data(self.destination, source, timeout=0.5)
+        # The existing file is not changed
+        self.assertEqual(self.destination.read_bytes(), b"old data")
+        self.assertTrue(source.closed)
+
+    def test_download_does_not_block_event_loop(self):
+        async def count_ticks(ticks):
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        async def download():
+            ticks = []
+            ticker = asyncio.ensure_future(count_ticks(ticks))
+            await download_covid_data_async(self.destination,
+                                            FakeDownloadSource(delay=0.3))
+            ticker.cancel()
+            return ticks
+
+        ticks = asyncio.run(download())
+        self.assertGreater(len(ticks), 5)
+        self.assertEqual(self.destination.read_bytes(), b"covid data")
+
+    def test_download_covid_data_in_background(self):
+        self.destination.write_bytes(b"old data")
+        future = download_covid_data_in_background(
+            self.destination, FakeDownloadSource(delay=0.3))
+        # The old file can still be used while downloading
+        self.assertEqual(self.destination.read_bytes(), b"old data")
+        self.assertEqual(future.result(timeout=10), self.destination)
+        self.assertEqual(self.destination.read_bytes(), b"covid data")
+
+
+# xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+if __name__ == '__main__':
+    unittest.main()
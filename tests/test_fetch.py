@@ -0,0 +1,210 @@
+import http.client
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from covid19.fetch import FallbackFetcher, HttpFetcher, _pool
+
+
+class FakeDataServer(ThreadingHTTPServer):
+    """
+    HTTP server with a single data file, supporting the validators and range
+    requests used by `HttpFetcher`.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeDataHandler)
+        self.content = b"covid data " * 1000
+        self.etag = '"v1"'
+        self.last_modified = "Mon, 01 Jun 2020 00:00:00 GMT"
+        self.abort_after = None  # Close the connection after this many bytes
+        self.requests = []
+        self.connections = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/dados.xlsx"
+
+
+class FakeDataHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        server = self.server
+        server.requests.append(dict(self.headers))
+
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/dados.xlsx")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path != "/dados.xlsx":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if (self.headers.get("If-None-Match") == server.etag
+                or self.headers.get("If-Modified-Since")
+                == server.last_modified):
+            self.send_response(304)
+            self.send_header("ETag", server.etag)
+            self.end_headers()
+            return
+
+        offset = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range") == server.etag:
+            offset = int(range_header[len("bytes="):-1])
+            self.send_response(206)
+            self.send_header(
+                "Content-Range",
+                f"bytes {offset}-{len(server.content) - 1}/{len(server.content)}"
+            )
+        else:
+            self.send_response(200)
+        body = server.content[offset:]
+        self.send_header("ETag", server.etag)
+        self.send_header("Last-Modified", server.last_modified)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if server.abort_after is not None:
+            self.wfile.write(body[:server.abort_after])
+            server.abort_after = None
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class TestHttpFetcher(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeDataServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.destination = Path(self.tmp_dir.name) / "dados.xlsx"
+        self.fetcher = HttpFetcher(self.server.url, timeout=5.0, chunk_size=512)
+
+    def tearDown(self):
+        _pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_fetch(self):
+        self.assertTrue(self.fetcher.fetch(self.destination))
+        self.assertEqual(self.destination.read_bytes(), self.server.content)
+        self.assertNotIn("If-None-Match", self.server.requests[0])
+
+    def test_fetch_not_modified(self):
+        self.fetcher.fetch(self.destination)
+        self.assertFalse(self.fetcher.fetch(self.destination))
+        self.assertEqual(self.server.requests[1]["If-None-Match"], '"v1"')
+        self.assertEqual(self.server.requests[1]["If-Modified-Since"],
+                         self.server.last_modified)
+        self.assertEqual(self.destination.read_bytes(), self.server.content)
+
+        # The file changed in the server
+        self.server.content = b"new covid data"
+        self.server.etag = '"v2"'
+        self.server.last_modified = "Tue, 02 Jun 2020 00:00:00 GMT"
+        self.assertTrue(self.fetcher.fetch(self.destination))
+        self.assertEqual(self.destination.read_bytes(), b"new covid data")
+
+    def test_fetch_without_destination_is_not_conditional(self):
+        self.fetcher.fetch(self.destination)
+        self.destination.unlink()
+        self.assertTrue(self.fetcher.fetch(self.destination))
+        self.assertNotIn("If-None-Match", self.server.requests[1])
+        self.assertEqual(self.destination.read_bytes(), self.server.content)
+
+    def test_fetch_resumes_interrupted_download(self):
+        self.server.abort_after = 3000
+        with self.assertRaises(http.client.IncompleteRead):
+            self.fetcher.fetch(self.destination)
+        self.assertFalse(self.destination.exists())
+
+        self.assertTrue(self.fetcher.fetch(self.destination))
+        self.assertEqual(self.server.requests[1]["Range"], "bytes=3000-")
+        self.assertEqual(self.destination.read_bytes(), self.server.content)
+
+    def test_fetch_restarts_if_file_changed_during_download(self):
+        self.server.abort_after = 3000
+        with self.assertRaises(http.client.IncompleteRead):
+            self.fetcher.fetch(self.destination)
+
+        self.server.content = b"new covid data"
+        self.server.etag = '"v2"'
+        self.assertTrue(self.fetcher.fetch(self.destination))
+        self.assertEqual(self.destination.read_bytes(), b"new covid data")
+
+    def test_fetch_reuses_connection(self):
+        for _ in range(3):
+            self.fetcher.fetch(self.destination)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_fetch_follows_redirects(self):
+        fetcher = HttpFetcher(self.server.url.replace("dados.xlsx",
+                                                      "redirect"),
+                              timeout=5.0)
+        self.assertTrue(fetcher.fetch(self.destination))
+        self.assertEqual(self.destination.read_bytes(), self.server.content)
+
+    def test_fetch_error(self):
+        fetcher = HttpFetcher(self.server.url.replace("dados", "missing"),
+                              timeout=5.0)
+        with self.assertRaises(ConnectionError):
+            fetcher.fetch(self.destination)
+        self.assertFalse(self.destination.exists())
+
+
+class FailingFetcher:
+    def __init__(self):
+        self.calls = 0
+
+    def fetch(self, destination):
+        self.calls += 1
+        raise ConnectionError("No connection")
+
+
+class WritingFetcher:
+    def fetch(self, destination):
+        Path(destination).write_bytes(b"covid data")
+        return True
+
+
+class TestFallbackFetcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.destination = Path(self.tmp_dir.name) / "dados.xlsx"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_fetch(self):
+        failing = FailingFetcher()
+        fetcher = FallbackFetcher(failing, WritingFetcher())
+        self.assertTrue(fetcher.fetch(self.destination))
+        self.assertEqual(failing.calls, 1)
+        self.assertEqual(self.destination.read_bytes(), b"covid data")
+
+    def test_fetch_all_fail(self):
+        fetcher = FallbackFetcher(FailingFetcher(), FailingFetcher())
+        with self.assertRaises(TimeoutError):
+            fetcher.fetch(self.destination)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from covid19.covid import get_all_states_data, get_brazil_data
+from covid19.growth import get_growth_rates, get_log_log_slopes
+from covid19.schema import apply_schema
+from covid19.scrap import _clean_data
+
+
+def _read_test_data():
+    """Data for Brazil and two states (Ceará and a copy of it)"""
+    data_brasil = pd.read_excel("dados_test_Brasil.xlsx")
+    data_ce = pd.read_excel("dados_test_CE.xlsx")
+    data_pe = data_ce.copy()
+    data_pe["estado"] = "PE"
+    data_pe["casosAcumulado"] *= 3
+    data = pd.concat([data_brasil, data_pe, data_ce], ignore_index=True)
+    return apply_schema(_clean_data(data))
+
+
+class TestGrowth(unittest.TestCase):
+    def setUp(self):
+        data = _read_test_data()
+        self.data_brasil = get_brazil_data(data)
+        self.data_estados = get_all_states_data(data)
+
+    def test_get_growth_rates(self):
+        rates = get_growth_rates(self.data_brasil, janela=7)
+        self.assertEqual(rates.shape[0], self.data_brasil.shape[0])
+
+        dias = (pd.to_datetime(self.data_brasil.data) -
+                pd.to_datetime(self.data_brasil.data.iloc[0])).dt.days
+        casos = self.data_brasil.casosAcumulado.to_numpy(dtype=float)
+        for i in range(6, casos.shape[0]):
+            janela = slice(i - 6, i + 1)
+            if (casos[janela] > 0).all():
+                b = np.polyfit(dias[janela], np.log(casos[janela]), 1)[0]
+                self.assertAlmostEqual(rates.taxaDeCrescimento[i],
+                                       np.expm1(b))
+                self.assertAlmostEqual(
+                    rates.tempoDeDuplicacao[i],
+                    np.log(2) / b if b > 0 else np.inf)
+            else:
+                self.assertTrue(np.isnan(rates.taxaDeCrescimento[i]))
+        # The first rows do not have a full window
+        self.assertTrue(rates.taxaDeCrescimento[:6].isna().all())
+
+    def test_get_growth_rates_by_state(self):
+        rates = get_growth_rates(self.data_estados, "estado", janela=5)
+        self.assertEqual(rates.estado.unique().tolist(), ["CE", "PE"])
+        rates_ce = rates[rates.estado == "CE"].reset_index(drop=True)
+        rates_pe = rates[rates.estado == "PE"].reset_index(drop=True)
+        # Multiplying the cases by a constant does not change the growth
+        pd.testing.assert_series_equal(rates_ce.taxaDeCrescimento,
+                                       rates_pe.taxaDeCrescimento)
+
+        expected = get_growth_rates(
+            self.data_estados[self.data_estados.estado == "CE"], janela=5)
+        pd.testing.assert_frame_equal(rates_ce.drop(columns="estado"),
+                                      expected)
+
+    def test_get_log_log_slopes(self):
+        slopes = get_log_log_slopes(self.data_estados, "estado")
+        self.assertEqual(slopes.index.tolist(), ["CE", "PE"])
+
+        data_ce = self.data_estados[self.data_estados.estado == "CE"]
+        first_index = np.argmax(data_ce.casosAcumulado.to_numpy() > 100)
+        data_ce = data_ce.iloc[first_index:]
+        data_ce = data_ce[data_ce.casosNovos > 0]
+        b, a = np.polyfit(np.log10(data_ce.casosAcumulado.astype(float)),
+                          np.log10(data_ce.casosNovos.astype(float)), 1)
+        self.assertAlmostEqual(slopes.loc["CE", "inclinacao"], b)
+        self.assertAlmostEqual(slopes.loc["CE", "intercepto"], a)
+        self.assertEqual(slopes.loc["CE", "numPontos"], data_ce.shape[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+_root = Path(__file__).resolve().parent.parent
+
+# Maximum time (in ms) to import covid19.scrap when pandas is already imported
+_import_time_budget = 150
+
+# Modules that must only be imported when they are used
+_lazy_modules = ("selenium", "openpyxl", "xlrd", "matplotlib", "asyncio",
+                 "http.client", "concurrent.futures", "covid19.fetch",
+                 "covid19.download")
+
+
+def _run_python(code, *options):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(_root)] + [p for p in [env.get("PYTHONPATH")] if p])
+    return subprocess.run([sys.executable, *options, "-c", code],
+                          env=env,
+                          capture_output=True,
+                          text=True,
+                          check=True)
+
+
+def _get_package_import_time():
+    """Import time (in ms) of the covid19 modules, excluding pandas and numpy"""
+    result = _run_python("import numpy, pandas; import covid19.scrap", "-X",
+                         "importtime")
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        # Only the modules imported at the top level (not nested)
+        if name.startswith(" covid19"):
+            total += int(cumulative)
+    return total / 1000
+
+
+class TestImport(unittest.TestCase):
+    def test_heavy_modules_are_not_imported(self):
+        result = _run_python(
+            "import sys, covid19.scrap, covid19.covid\n"
+            f"print([m for m in {_lazy_modules!r} if m in sys.modules])")
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_import_time_budget(self):
+        # The best of a few runs, to reduce the noise
+        import_time = min(_get_package_import_time() for _ in range(3))
+        self.assertLess(import_time, _import_time_budget)
+
+
+if __name__ == "__main__":
+    unittest.main()
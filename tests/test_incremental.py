@@ -0,0 +1,134 @@
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from covid19 import scrap
+from covid19.covid import get_all_states_data
+from covid19.incremental import DerivedDataStore
+from covid19.schema import apply_schema
+from covid19.scrap import _clean_data, _clean_levels
+from covid19.synthetic import make_ministry_data
+
+
+def _read_test_data():
+    """Data for Brazil, for Ceará and for one city (a copy of Ceará data)"""
+    data_brasil = pd.read_excel("dados_test_Brasil.xlsx")
+    data_ce = pd.read_excel("dados_test_CE.xlsx")
+    data_fortaleza = data_ce.copy()
+    data_fortaleza["municipio"] = "Fortaleza"
+    data_fortaleza["codmun"] = 230440
+    data_fortaleza["casosAcumulado"] //= 2
+    data = pd.concat([data_brasil, data_ce, data_fortaleza], ignore_index=True)
+    return apply_schema(_clean_data(data))
+
+
+class TestDerivedDataStore(unittest.TestCase):
+    def setUp(self):
+        self.data = _read_test_data()
+        self.dates = sorted(self.data.data.unique())
+
+    def assert_same_frames(self, frames, expected_frames):
+        for level, expected in expected_frames.items():
+            pd.testing.assert_frame_equal(frames[level].reset_index(drop=True),
+                                          expected.reset_index(drop=True))
+
+    def test_incremental_update(self):
+        expected = DerivedDataStore().update(self.data)
+
+        store = DerivedDataStore()
+        # Ceará has 100 cases only after the 10th day
+        store.update(self.data[self.data.data <= self.dates[20]])
+        store.update(self.data[self.data.data <= self.dates[30]])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store.save(tmp_dir)
+            store = DerivedDataStore.load(tmp_dir)
+
+        self.assert_same_frames(store.update(self.data), expected)
+        # Nothing changes if there are no new dates
+        self.assert_same_frames(store.update(self.data), expected)
+
+    def test_only_new_rows_are_derived(self):
+        store = DerivedDataStore(levels=("estados", ))
+        store.update(self.data[self.data.data < self.dates[-1]])
+        with self.assertLogs(level="INFO") as logs:
+            store.update(self.data)
+        self.assertIn("Deriving 1 new rows of estados data",
+                      "\n".join(logs.output))
+
+    def test_restated_history(self):
+        store = DerivedDataStore()
+        store.update(self.data[self.data.data <= self.dates[30]])
+
+        data = self.data.copy()
+        data.loc[data.data == self.dates[30], "casosAcumulado"] += 1
+        with self.assertLogs(level="WARNING"):
+            frames = store.update(data)
+        self.assert_same_frames(frames, DerivedDataStore().update(data))
+
+    def test_restated_earlier_date(self):
+        store = DerivedDataStore()
+        store.update(self.data[self.data.data <= self.dates[30]])
+
+        # Only a date before the last processed one changes
+        data = self.data.copy()
+        data.loc[data.data == self.dates[10], "obitosAcumulado"] += 1
+        with self.assertLogs(level="WARNING") as logs:
+            frames = store.update(data)
+        self.assertIn("up to", "\n".join(logs.output))
+        self.assert_same_frames(frames, DerivedDataStore().update(data))
+
+    def test_restatement_keeping_the_totals(self):
+        store = DerivedDataStore()
+        store.update(self.data[self.data.data <= self.dates[-5]])
+
+        # The sum of the cases and the sum weighted by the date do not change
+        data = self.data.copy()
+        is_city = (data.codmun == 230440).to_numpy(dtype=bool,
+                                                   na_value=False)
+        city_dates = sorted(data.data[is_city].unique())
+        for date, delta in zip(city_dates[10:13], (1, -2, 1)):
+            data.loc[is_city & (data.data == date).to_numpy(),
+                     "casosAcumulado"] += delta
+        with self.assertLogs(level="WARNING") as logs:
+            frames = store.update(data)
+        self.assertIn("municipios data up to", "\n".join(logs.output))
+        self.assert_same_frames(frames, DerivedDataStore().update(data))
+
+
+class TestGetDerivedData(unittest.TestCase):
+    def test_incremental_refresh(self):
+        data = _clean_levels(
+            apply_schema(
+                _clean_data(
+                    make_ministry_data(num_municipalities=30, num_days=40))))
+        last_date = data.data.max()
+        old_data = data[data.data < last_date].copy()
+        old_data.attrs["source"] = ("dados.xlsx", 1, 1)
+        data.attrs["source"] = ("dados.xlsx", 2, 2)
+
+        with mock.patch.object(scrap, "_derived_data_store",
+                               DerivedDataStore()), \
+                mock.patch.object(scrap, "_derived_data_store_sources", {}):
+            with mock.patch.object(scrap, "get_covid_data",
+                                   return_value=old_data):
+                scrap.get_derived_data("estados")
+            with mock.patch.object(scrap, "get_covid_data",
+                                   return_value=data), \
+                    self.assertLogs(level="INFO") as logs:
+                states = scrap.get_derived_data("estados")
+                same_states = scrap.get_derived_data("estados")
+
+        self.assertIn("Deriving 27 new rows of estados data",
+                      "\n".join(logs.output))
+        self.assertNotIn("from scratch", "\n".join(logs.output))
+        pd.testing.assert_frame_equal(same_states, states)
+        pd.testing.assert_frame_equal(
+            states.reset_index(drop=True),
+            get_all_states_data(data).reset_index(drop=True))
+
+
+# xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import threading
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from covid19.covid import get_all_states_data, get_brazil_data
+from covid19.instrument import Instrumentation, instrumentation
+from covid19.scrap import _clean_data, _read_datafile
+from covid19.schema import apply_schema
+from covid19.synthetic import make_ministry_data
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_stage(self):
+        instr = Instrumentation()
+        with instr.stage("outer", rows=10):
+            with instr.stage("inner") as record:
+                record.rows = 5
+
+        inner, outer = instr.records
+        self.assertEqual((inner.name, inner.parent, inner.rows),
+                         ("inner", "outer", 5))
+        self.assertEqual((outer.name, outer.parent, outer.rows),
+                         ("outer", None, 10))
+        self.assertGreaterEqual(outer.wall_time, inner.wall_time)
+        self.assertIsNone(outer.peak_memory)
+
+    def test_stage_with_exception(self):
+        instr = Instrumentation()
+        with self.assertRaises(ValueError):
+            with instr.stage("failing"):
+                raise ValueError
+        self.assertEqual(instr.records[0].name, "failing")
+        self.assertIsNotNone(instr.records[0].wall_time)
+
+    def test_peak_memory(self):
+        instr = Instrumentation(track_memory=True)
+        with instr.stage("outer"):
+            with instr.stage("inner"):
+                array = np.ones(1_000_000)
+                del array
+            with instr.stage("small"):
+                pass
+
+        inner, small, outer = instr.records
+        self.assertGreaterEqual(inner.peak_memory, 8_000_000)
+        self.assertLess(small.peak_memory, 1_000_000)
+        # The peak of the inner stage is also a peak of the outer stage
+        self.assertGreaterEqual(outer.peak_memory, inner.peak_memory)
+
+    def test_peak_memory_with_threads(self):
+        instr = Instrumentation(track_memory=True)
+        allocated = threading.Event()
+        other_finished = threading.Event()
+
+        def other_thread():
+            allocated.wait()
+            # Starting and finishing a stage in another thread must not lose
+            # the peak of the stage that is still running
+            with instr.stage("other"):
+                pass
+            other_finished.set()
+
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        with instr.stage("main"):
+            array = np.ones(1_000_000)
+            del array
+            allocated.set()
+            other_finished.wait()
+            self.assertTrue(tracemalloc.is_tracing())
+        thread.join()
+
+        records = {record.name: record for record in instr.records}
+        self.assertGreaterEqual(records["main"].peak_memory, 8_000_000)
+        self.assertLess(records["other"].peak_memory, 1_000_000)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_hooks_and_report(self):
+        instr = Instrumentation(max_records=2)
+        received = []
+        instr.add_hook(received.append)
+        for name in ("a", "b", "c"):
+            with instr.stage(name):
+                pass
+        instr.remove_hook(received.append)
+        with instr.stage("d"):
+            pass
+
+        self.assertEqual([record.name for record in received], ["a", "b", "c"])
+        report = instr.report()
+        self.assertEqual(report.name.tolist(), ["c", "d"])
+        self.assertEqual(report.columns.tolist(),
+                         ["name", "parent", "rows", "wall_time", "peak_memory"])
+        instr.clear()
+        self.assertEqual(instr.report().shape[0], 0)
+
+    def test_failing_hook(self):
+        def failing_hook(record):
+            raise RuntimeError(record.name)
+
+        instr = Instrumentation()
+        received = []
+        instr.add_hook(failing_hook)
+        instr.add_hook(received.append)
+
+        with self.assertLogs(level="ERROR") as logs:
+            with instr.stage("a") as record:
+                record.rows = 1
+        self.assertIn("failed on the stage a", logs.output[0])
+        self.assertEqual([record.name for record in received], ["a"])
+
+        # The exception of the stage is not replaced by the one of the hook
+        with self.assertLogs(level="ERROR"):
+            with self.assertRaises(ValueError):
+                with instr.stage("b"):
+                    raise ValueError("stage")
+        self.assertEqual([record.name for record in received], ["a", "b"])
+
+
+class TestPipelineStages(unittest.TestCase):
+    def setUp(self):
+        instrumentation.clear()
+
+    def tearDown(self):
+        instrumentation.clear()
+
+    def test_read_datafile(self):
+        _read_datafile("dados_test_CE.xlsx", use_cache=False)
+        report = instrumentation.report().set_index("name")
+        self.assertEqual(
+            report.index.tolist(),
+            ["parse_excel", "convert_dates", "clean_data", "clean_levels"])
+        self.assertEqual(report.at["convert_dates", "parent"], "clean_data")
+        self.assertEqual(report.at["parse_excel", "rows"],
+                         report.at["clean_data", "rows"])
+
+    def test_derivation(self):
+        data = apply_schema(_clean_data(make_ministry_data(num_days=30)))
+        instrumentation.clear()
+        data_brasil = get_brazil_data(data)
+        data_estados = get_all_states_data(data)
+
+        report = instrumentation.report().set_index("name")
+        self.assertEqual(
+            report.index.tolist(),
+            ["dedup_brasil", "derive_brasil", "dedup_estados", "derive_estados"])
+        self.assertEqual(report.at["derive_brasil", "rows"],
+                         data_brasil.shape[0])
+        self.assertEqual(report.at["derive_estados", "rows"],
+                         data_estados.shape[0])
+        self.assertEqual(report.at["dedup_estados", "parent"],
+                         "derive_estados")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+from covid19.memo import FrameCache, frame_cache, get_file_key
+from covid19.scrap import get_derived_data, read_datafile_from_disc
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class TestFrameCache(unittest.TestCase):
+    def setUp(self):
+        self.frame = pd.DataFrame({"a": [1, 2, 3]})
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.frame
+
+    def test_get_or_compute(self):
+        cache = FrameCache()
+        first = cache.get_or_compute("key", self.compute)
+        second = cache.get_or_compute("key", self.compute)
+        self.assertEqual(self.calls, 1)
+        pd.testing.assert_frame_equal(first, self.frame)
+        pd.testing.assert_frame_equal(second, self.frame)
+        self.assertEqual(cache.stats, (1, 1, 0, 1))
+
+    def test_returned_frames_are_views(self):
+        cache = FrameCache()
+        frame = cache.get_or_compute("key", self.compute)
+        self.assertIsNot(frame, self.frame)
+        frame["b"] = 1
+        frame["a"] = 0
+        pd.testing.assert_frame_equal(cache.get_or_compute("key", self.compute),
+                                      pd.DataFrame({"a": [1, 2, 3]}))
+
+    def test_dict_values(self):
+        cache = FrameCache()
+        value = cache.get_or_compute("key", lambda: {"x": self.frame, "y": 1})
+        self.assertIsNot(value["x"], self.frame)
+        self.assertEqual(value["y"], 1)
+
+    def test_lru_eviction(self):
+        cache = FrameCache(maxsize=2)
+        cache.get_or_compute("a", self.compute)
+        cache.get_or_compute("b", self.compute)
+        cache.get_or_compute("a", self.compute)  # "b" is now the oldest
+        cache.get_or_compute("c", self.compute)
+        self.assertEqual(cache.stats.evictions, 1)
+        cache.get_or_compute("a", self.compute)
+        self.assertEqual(self.calls, 3)
+        cache.get_or_compute("b", self.compute)
+        self.assertEqual(self.calls, 4)
+
+    def test_maxbytes_eviction(self):
+        cache = FrameCache(maxsize=None, maxbytes=10)
+        for key in ("a", "b", "c"):
+            cache.get_or_compute(key, lambda: b"1234")
+        # "a" is evicted since the total size would be 12 bytes
+        self.assertEqual(cache.stats.evictions, 1)
+        self.assertEqual((cache.stats.size, cache.nbytes), (2, 8))
+
+        # Values larger than `maxbytes` are not cached
+        self.assertEqual(cache.get_or_compute("d", lambda: b"x" * 11),
+                         b"x" * 11)
+        self.assertEqual((cache.stats.size, cache.nbytes), (2, 8))
+        cache.clear()
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = FrameCache(ttl=10.0, clock=clock)
+        cache.get_or_compute("key", self.compute)
+        clock.time = 9.0
+        cache.get_or_compute("key", self.compute)
+        self.assertEqual(self.calls, 1)
+        clock.time = 11.0
+        cache.get_or_compute("key", self.compute)
+        self.assertEqual(self.calls, 2)
+
+    def test_clear(self):
+        cache = FrameCache()
+        cache.get_or_compute("key", self.compute)
+        cache.clear()
+        self.assertEqual(cache.stats, (0, 0, 0, 0))
+
+
+class TestMemoizedData(unittest.TestCase):
+    def setUp(self):
+        frame_cache.clear()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = Path(self.tmp_dir) / "dados.xlsx"
+        shutil.copy("dados_test_CE.xlsx", self.filename)
+
+    def tearDown(self):
+        frame_cache.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_datafile_from_disc(self):
+        data = read_datafile_from_disc(self.filename)
+        self.assertEqual(data.attrs["source"], get_file_key(self.filename))
+        with mock.patch("covid19.scrap._read_datafile",
+                        side_effect=AssertionError):
+            same_data = read_datafile_from_disc(self.filename)
+        pd.testing.assert_frame_equal(same_data, data)
+        self.assertEqual(frame_cache.stats.hits, 1)
+
+        # A new file is read again
+        pd.read_excel("dados_test_Brasil.xlsx").to_excel(self.filename,
+                                                         index=False)
+        stat = os.stat(self.filename)
+        os.utime(self.filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10))
+        new_data = read_datafile_from_disc(self.filename)
+        self.assertNotEqual(new_data.shape, data.shape)
+        self.assertEqual(frame_cache.stats.misses, 2)
+
+    def test_get_derived_data(self):
+        data = read_datafile_from_disc(self.filename)
+        with mock.patch("covid19.scrap.get_covid_data", return_value=data):
+            states = get_derived_data("estados")
+            with mock.patch.dict("covid19.scrap.DERIVED_DATA_GETTERS",
+                                 {"estados": mock.Mock(
+                                     side_effect=AssertionError)}):
+                same_states = get_derived_data("estados")
+        pd.testing.assert_frame_equal(same_states, states)
+        self.assertEqual(states.estado.unique().tolist(), ["CE"])
+
+
+if __name__ == '__main__':
+    unittest.main()
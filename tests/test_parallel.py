@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from covid19.covid import get_all_municipalities_data, get_all_states_data
+from covid19.parallel import get_level_data_in_parallel, map_regions
+from covid19.schema import apply_schema
+from covid19.scrap import _clean_data
+
+
+def _read_test_data():
+    """Data for Brazil, two states and five cities, with shuffled rows"""
+    data_brasil = pd.read_excel("dados_test_Brasil.xlsx")
+    data_ce = pd.read_excel("dados_test_CE.xlsx")
+    data_pe = data_ce.copy()
+    data_pe["estado"] = "PE"
+    data_pe["casosAcumulado"] //= 3
+    frames = [data_brasil, data_ce, data_pe]
+    for i in range(5):
+        data_city = data_ce.copy()
+        data_city["municipio"] = f"Cidade {i}"
+        data_city["codmun"] = 230000 + i
+        data_city["casosAcumulado"] //= i + 2
+        frames.append(data_city)
+    data = pd.concat(frames, ignore_index=True)
+    data = data.sample(frac=1.0, random_state=0)
+    return apply_schema(_clean_data(data))
+
+
+def _count_regions(partition, key):
+    return partition[key].nunique(), partition.shape[0]
+
+
+class TestParallel(unittest.TestCase):
+    def setUp(self):
+        self.data = _read_test_data()
+
+    def test_map_regions(self):
+        results = map_regions(_count_regions,
+                              self.data,
+                              "codmun",
+                              args=("codmun", ),
+                              max_workers=2,
+                              partitions_per_worker=2)
+        self.assertGreater(len(results), 1)
+        # Each region is in a single partition
+        self.assertEqual(sum(num_regions for num_regions, _ in results), 5)
+        self.assertEqual(sum(num_rows for _, num_rows in results),
+                         self.data.codmun.notna().sum())
+
+    def test_map_regions_with_mask(self):
+        is_state = self.data.codmun.isna().to_numpy() & (
+            self.data.regiao != "Brasil").to_numpy()
+        results = map_regions(_count_regions,
+                              self.data,
+                              "estado",
+                              args=("estado", ),
+                              max_workers=2,
+                              mask=is_state)
+        self.assertEqual(sum(num_regions for num_regions, _ in results), 2)
+        self.assertEqual(sum(num_rows for _, num_rows in results),
+                         is_state.sum())
+
+    def test_get_states_data_in_parallel(self):
+        expected = get_all_states_data(self.data).sort_values(
+            "estado", kind="mergesort")
+        data_estados = get_level_data_in_parallel(self.data,
+                                                  "estados",
+                                                  max_workers=2)
+        pd.testing.assert_frame_equal(data_estados, expected)
+
+    def test_get_municipalities_data_in_parallel(self):
+        expected = get_all_municipalities_data(self.data)
+        data_municipios = get_level_data_in_parallel(self.data,
+                                                     "municipios",
+                                                     max_workers=2)
+        pd.testing.assert_frame_equal(data_municipios, expected)
+        np.testing.assert_array_equal(data_municipios.codmun.unique(),
+                                      230000 + np.arange(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
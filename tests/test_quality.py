@@ -0,0 +1,138 @@
+import datetime
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from covid19.covid import get_all_states_data, get_brazil_data
+from covid19.quality import (LEVELS, LEVELS_ATTR, REPORT_ATTR, QualityReport,
+                             classify_levels, clean_levels, get_levels,
+                             is_cleaned)
+from covid19.schema import apply_schema
+from covid19.scrap import _clean_data, read_datafile_from_disc
+from covid19.synthetic import make_ministry_data
+
+
+class TestQuality(unittest.TestCase):
+    def setUp(self):
+        self.raw = make_ministry_data(num_municipalities=30,
+                                      num_days=20,
+                                      num_duplicates=0)
+        self.data = apply_schema(_clean_data(self.raw.copy()))
+
+    def test_classify_levels(self):
+        levels = classify_levels(self.data)
+        counts = np.bincount(levels, minlength=len(LEVELS))
+        np.testing.assert_array_equal(counts, [20, 27 * 20, 30 * 20])
+
+    def test_clean_data(self):
+        cleaned, report = clean_levels(self.data)
+        self.assertIs(cleaned, self.data)
+        self.assertTrue(report.is_clean)
+        self.assertEqual(report.summary().to_numpy().sum(), 0)
+
+    def test_duplicates(self):
+        # A duplicated date of Brazil, of a state and of a municipality, with
+        # different values (only the first row must be kept)
+        rows = self.data.iloc[[3, 20 + 5, 28 * 20 + 7]].copy()
+        rows["casosAcumulado"] += 1
+        data = pd.concat([self.data, rows])
+        cleaned, report = clean_levels(data)
+
+        pd.testing.assert_frame_equal(cleaned, self.data)
+        self.assertEqual(report.duplicates.level.tolist(), list(LEVELS))
+        self.assertEqual(report.duplicates.region.tolist(),
+                         ["Brasil", rows.estado.iloc[1], rows.codmun.iloc[2]])
+        self.assertEqual(report.duplicates.date.tolist(), rows.data.tolist())
+        self.assertEqual(report.summary().duplicates.tolist(), [1, 1, 1])
+
+    def test_same_as_getters(self):
+        data = apply_schema(_clean_data(make_ministry_data(num_days=30)))
+        cleaned, report = clean_levels(data)
+        self.assertEqual(report.duplicates.shape[0], 10)
+        pd.testing.assert_frame_equal(get_brazil_data(cleaned),
+                                      get_brazil_data(data))
+        pd.testing.assert_frame_equal(get_all_states_data(cleaned),
+                                      get_all_states_data(data))
+
+    def test_negative_deltas_and_gaps(self):
+        data = self.data.copy()
+        state_rows = np.flatnonzero((data.estado == "CE").to_numpy()
+                                    & data.codmun.isna().to_numpy())
+        # Ceará loses 5 cases and 1 death in its 11th day
+        data.loc[data.index[state_rows[10]], "casosAcumulado"] = (
+            data.casosAcumulado.iloc[state_rows[9]] - 5)
+        data.loc[data.index[state_rows[10]], "obitosAcumulado"] = (
+            data.obitosAcumulado.iloc[state_rows[9]] - 1)
+        # Brazil has no data for the 3rd and 4th days
+        data = data.drop(index=data.index[[2, 3]])
+
+        cleaned, report = clean_levels(data)
+        self.assertEqual(cleaned.shape[0], data.shape[0])
+
+        date = self.data.data.iloc[state_rows[10]]
+        self.assertEqual(report.negative_deltas.shape[0], 2)
+        self.assertEqual(report.negative_deltas.iloc[0].tolist(),
+                         ["estados", "CE", date, "casosAcumulado", -5.0])
+        self.assertEqual(report.negative_deltas.iloc[1].tolist(),
+                         ["estados", "CE", date, "obitosAcumulado", -1.0])
+
+        self.assertEqual(report.date_gaps.to_dict("records"), [{
+            "level": "brasil",
+            "region": "Brasil",
+            "date": datetime.date(2020, 2, 29),
+            "missing_days": 2
+        }])
+
+    def test_get_levels(self):
+        rows = self.data.iloc[[3, 20 + 5, 28 * 20 + 7]]
+        cleaned, _ = clean_levels(pd.concat([self.data, rows]))
+        self.assertIn(LEVELS_ATTR, cleaned.attrs)
+        np.testing.assert_array_equal(get_levels(cleaned),
+                                      classify_levels(cleaned))
+        # The stored levels are not used for other rows
+        subset = cleaned.iloc[::2]
+        np.testing.assert_array_equal(get_levels(subset),
+                                      classify_levels(subset))
+
+    def test_is_cleaned(self):
+        data, report = clean_levels(self.data)
+        data.attrs[REPORT_ATTR] = report
+        self.assertTrue(is_cleaned(data))
+        self.assertTrue(is_cleaned(data.copy()))
+        self.assertFalse(is_cleaned(self.raw))
+
+        # The attrs are kept by `pd.concat`, but the duplicated rows are not
+        # taken as cleaned
+        states = data[classify_levels(data) == LEVELS.index("estados")]
+        duplicated = pd.concat([data, states.tail(3)])
+        self.assertIn(REPORT_ATTR, duplicated.attrs)
+        self.assertFalse(is_cleaned(duplicated))
+        pd.testing.assert_frame_equal(get_all_states_data(duplicated),
+                                      get_all_states_data(data))
+
+    def test_report_to_dict(self):
+        data = self.data.copy()
+        rows = data.iloc[[3, 28 * 20 + 7]].copy()
+        data.loc[data.index[30], "casosAcumulado"] = 0
+        data = pd.concat([data.drop(index=data.index[[2]]), rows])
+        _, report = clean_levels(data)
+        self.assertFalse(report.is_clean)
+
+        content = json.loads(json.dumps(report.to_dict()))
+        restored = QualityReport.from_dict(content)
+        for name in ("duplicates", "negative_deltas", "date_gaps"):
+            pd.testing.assert_frame_equal(getattr(restored, name),
+                                          getattr(report, name),
+                                          check_dtype=False)
+
+    def test_read_datafile_from_disc(self):
+        data = read_datafile_from_disc("dados_test_CE.xlsx", use_cache=False)
+        report = data.attrs["quality_report"]
+        self.assertEqual(report.duplicates.shape[0], 0)
+        self.assertEqual(report.summary().index.tolist(), list(LEVELS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import datetime
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from covid19 import scrap
+from covid19.covid import get_all_states_data
+from covid19.rollups import GROUPINGS, PERIODS, RollupStore
+from covid19.schema import apply_schema
+from covid19.scrap import _clean_data, _clean_levels
+from covid19.synthetic import make_ministry_data
+
+
+def _make_test_data():
+    data = make_ministry_data(num_municipalities=60, num_days=70)
+    return _clean_levels(apply_schema(_clean_data(data)))
+
+
+class TestRollupStore(unittest.TestCase):
+    def setUp(self):
+        self.data = _make_test_data()
+        self.dates = sorted(self.data.data.unique())
+        self.store = RollupStore()
+        self.store.update(self.data)
+
+    def test_rollups(self):
+        self.assertEqual(set(self.store.rollups),
+                         {(g, p)
+                          for g in GROUPINGS for p in PERIODS})
+
+        # The weekly data of the states is the same as summing the derived
+        # data of each week
+        data_estados = get_all_states_data(self.data)
+        dates = pd.to_datetime(data_estados.data)
+        week_starts = (dates - pd.to_timedelta(
+            (dates.dt.weekday + 1) % 7, unit="D")).dt.date
+        expected = data_estados.assign(semana=week_starts).groupby(
+            ["estado", "semana"], observed=True).agg(
+                casosNovos=("casosNovos", "sum"),
+                obitosAcumulado=("obitosAcumulado", "last"),
+                numDias=("data", "size")).reset_index()
+        rollup = self.store.rollups["estados", "semana"]
+        self.assertEqual(rollup.data.tolist(), expected.semana.tolist())
+        self.assertTrue(
+            (rollup.data.map(datetime.date.weekday) == 6).all())
+        for column in ("casosNovos", "obitosAcumulado", "numDias"):
+            np.testing.assert_array_equal(rollup[column], expected[column])
+
+    def test_health_regions(self):
+        municipalities = self.data[self.data.codmun.notna()]
+        rollup = self.store.rollups["regioesSaude", "mes"]
+        for region in rollup.codRegiaoSaude.unique()[:3]:
+            rows = municipalities[municipalities.codRegiaoSaude == region]
+            last_date = rows.data.max()
+            region_rollup = rollup[rollup.codRegiaoSaude == region]
+            self.assertEqual(
+                region_rollup.casosAcumulado.iloc[-1],
+                rows[rows.data == last_date].casosAcumulado.sum())
+            # The new cases of all months add up to the cumulative value
+            self.assertEqual(region_rollup.casosNovos.sum(),
+                             region_rollup.casosAcumulado.iloc[-1])
+            self.assertEqual(region_rollup.numDias.sum(),
+                             rows.data.nunique())
+
+    def test_incremental_update(self):
+        store = RollupStore()
+        for position in (20, 21, 40, len(self.dates) - 2):
+            store.update(self.data[self.data.data <= self.dates[position]])
+        with self.assertLogs(level="INFO") as logs:
+            store.update(self.data)
+        self.assertIn("Adding 1 new days to the brasil rollups",
+                      "\n".join(logs.output))
+        self.assertNotIn("from scratch", "\n".join(logs.output))
+
+        for key, rollup in self.store.rollups.items():
+            pd.testing.assert_frame_equal(store.rollups[key], rollup)
+        # Nothing changes if there are no new dates
+        store.update(self.data)
+        for key, rollup in self.store.rollups.items():
+            pd.testing.assert_frame_equal(store.rollups[key], rollup)
+
+    def test_restated_history(self):
+        store = RollupStore(groupings=("brasil", ))
+        store.update(self.data[self.data.data <= self.dates[30]])
+
+        data = self.data.copy()
+        is_restated = (data.regiao == "Brasil") & (data.data == self.dates[30])
+        data.loc[is_restated, "casosAcumulado"] += 1
+        with self.assertLogs(level="WARNING"):
+            store.update(data)
+        expected = RollupStore(groupings=("brasil", ))
+        expected.update(data)
+        for period in PERIODS:
+            pd.testing.assert_frame_equal(store.rollups["brasil", period],
+                                          expected.rollups["brasil", period])
+
+    def test_restated_earlier_date(self):
+        store = RollupStore(groupings=("regioesSaude", ))
+        store.update(self.data[self.data.data <= self.dates[30]])
+
+        # The last date is the same, but a municipality changed 20 days before
+        data = self.data.copy()
+        codmun = data.codmun.dropna().iloc[0]
+        is_restated = (data.codmun == codmun) & (data.data == self.dates[10])
+        data.loc[is_restated, "casosAcumulado"] += 1
+        with self.assertLogs(level="WARNING") as logs:
+            store.update(data)
+        self.assertIn("regioesSaude data up to", "\n".join(logs.output))
+        expected = RollupStore(groupings=("regioesSaude", ))
+        expected.update(data)
+        for period in PERIODS:
+            pd.testing.assert_frame_equal(
+                store.rollups["regioesSaude", period],
+                expected.rollups["regioesSaude", period])
+
+    def test_query(self):
+        result = self.store.query("estados",
+                                  "mes",
+                                  regions=["CE", "SP"],
+                                  start="2020-03-01",
+                                  end=datetime.date(2020, 4, 1))
+        self.assertEqual(result.estado.tolist(), ["CE", "CE", "SP", "SP"])
+        self.assertEqual(result.data.tolist(),
+                         [datetime.date(2020, 3, 1),
+                          datetime.date(2020, 4, 1)] * 2)
+
+        # The same query is cached until the next update
+        self.store.query("estados", "mes", regions=["CE", "SP"],
+                         start="2020-03-01", end="2020-04-01")
+        self.assertEqual(self.store._cache.stats.hits, 1)
+        self.store.update(self.data)
+        self.assertEqual(self.store._cache.stats.size, 0)
+
+        with self.assertRaises(ValueError):
+            self.store.query("brasil", regions="CE")
+        with self.assertRaises(KeyError):
+            RollupStore(periods=("mes", )).query("brasil", "semana")
+
+    def test_without_epidemiological_week(self):
+        data = self.data.drop(columns="semanaEpi")
+        store = RollupStore()
+        store.update(data.iloc[:data.shape[0] // 2])
+        store.update(data)
+        for key, rollup in self.store.rollups.items():
+            pd.testing.assert_frame_equal(
+                store.rollups[key],
+                rollup.drop(columns="semanaEpi", errors="ignore"))
+
+
+class TestGetRollups(unittest.TestCase):
+    def test_get_rollups(self):
+        data = _make_test_data()
+        data.attrs["source"] = ("dados.xlsx", 1, 1)
+        with mock.patch.object(scrap, "get_covid_data", return_value=data), \
+                mock.patch.object(scrap, "_rollup_store", RollupStore()), \
+                mock.patch.object(scrap, "_rollup_store_source", None):
+            first = scrap.get_rollups("brasil", "mes")
+            with mock.patch.object(scrap._rollup_store, "update") as update:
+                second = scrap.get_rollups("brasil", "mes")
+            update.assert_not_called()
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(first.casosNovos.sum(), first.casosAcumulado.iloc[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
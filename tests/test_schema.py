@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from covid19.schema import apply_schema, memory_report
+
+
+class TestSchema(unittest.TestCase):
+    def test_apply_schema(self):
+        data = pd.DataFrame({
+            "regiao": ["Brasil", "Nordeste", "Nordeste"],
+            "estado": [np.nan, "CE", "CE"],
+            "municipio": [np.nan, np.nan, "Fortaleza"],
+            "coduf": [76, 23, 23],
+            "codmun": [np.nan, np.nan, 230440.0],
+            "casosAcumulado": [10.0, 5.0, 3.0],
+            "Recuperadosnovos": [np.nan, 1.5, np.nan],
+            "outraColuna": ["a", "b", "c"],
+        })
+        compact = apply_schema(data)
+
+        self.assertEqual(compact.regiao.dtype, "category")
+        self.assertEqual(list(compact.estado.cat.categories)[:3],
+                         ["AC", "AL", "AM"])
+        self.assertEqual(compact.municipio.dtype, "category")
+        self.assertEqual(compact.coduf.dtype, np.int8)
+        self.assertEqual(compact.codmun.dtype, "Int32")
+        self.assertEqual(compact.casosAcumulado.dtype, np.int32)
+        # Non integer values and columns not in the schema are not changed
+        self.assertEqual(compact.Recuperadosnovos.dtype, np.float64)
+        self.assertEqual(compact.outraColuna.dtype, object)
+
+        self.assertEqual(compact.codmun.iloc[2], 230440)
+        self.assertTrue(pd.isna(compact.codmun.iloc[0]))
+        self.assertEqual(list(compact.estado.astype(object).fillna("")),
+                         ["", "CE", "CE"])
+
+    def test_apply_schema_with_unknown_state(self):
+        data = pd.DataFrame({"estado": ["CE", "XX"]})
+        with self.assertLogs(level="WARNING"):
+            compact = apply_schema(data)
+        self.assertEqual(list(compact.estado), ["CE", "XX"])
+
+    def test_memory_report(self):
+        data = pd.DataFrame({
+            "regiao": ["Nordeste"] * 1000,
+            "casosAcumulado": np.arange(1000)
+        })
+        report = memory_report(data)
+        compact_report = memory_report(apply_schema(data))
+
+        self.assertEqual(list(report.index),
+                         ["Index", "regiao", "casosAcumulado", "Total"])
+        self.assertEqual(report.loc["Total", "bytes"],
+                         data.memory_usage(deep=True).sum())
+        self.assertLess(compact_report.loc["Total", "bytes"] * 3,
+                        report.loc["Total", "bytes"])
+
+
+# xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+if __name__ == '__main__':
+    unittest.main()
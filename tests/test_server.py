@@ -0,0 +1,216 @@
+import asyncio
+import datetime
+import json
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from covid19.covid import get_all_municipalities_data, get_all_states_data
+from covid19.schema import apply_schema
+from covid19.scrap import _clean_data, _clean_levels
+from covid19.server import Dataset, QueryService
+from covid19.synthetic import make_ministry_data
+
+
+def _make_test_data(num_days=40):
+    data = make_ministry_data(num_municipalities=30,
+                              num_days=num_days,
+                              num_duplicates=0)
+    return _clean_levels(apply_schema(_clean_data(data)))
+
+
+async def _get(reader, writer, path, headers=""):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: test\r\n{headers}\r\n".encode())
+    await writer.drain()
+    head = (await reader.readuntil(b"\r\n\r\n")).decode().split("\r\n")
+    headers = dict(line.split(": ", 1) for line in head[1:] if line)
+    body = await reader.readexactly(int(headers["Content-Length"]))
+    return int(head[0].split()[1]), headers, body
+
+
+class TestDataset(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = _make_test_data()
+        cls.dataset = Dataset.from_data(cls.data, medias_moveis=True)
+
+    def test_series(self):
+        data_estados = get_all_states_data(self.data, medias_moveis=True)
+        expected = data_estados[data_estados.estado == "CE"]
+        series = self.dataset.get_series("estados", "CE")
+        self.assertEqual(series.data.tolist(), expected.data.tolist())
+        for column in ("casosNovos", "mediaCasosNovos_7"):
+            np.testing.assert_array_equal(series[column], expected[column])
+
+        data_municipios = get_all_municipalities_data(self.data)
+        codmun = data_municipios.codmun.iloc[-1]
+        series = self.dataset.get_series("municipios",
+                                         str(codmun),
+                                         start=datetime.date(2020, 3, 10),
+                                         end=datetime.date(2020, 3, 20))
+        expected = data_municipios[
+            (data_municipios.codmun == codmun).to_numpy()
+            & (data_municipios.data >= datetime.date(2020, 3, 10)).to_numpy()
+            & (data_municipios.data <= datetime.date(2020, 3, 20)).to_numpy()]
+        self.assertEqual(series.shape[0], 11)
+        np.testing.assert_array_equal(series.casosAcumulado,
+                                      expected.casosAcumulado)
+
+        with self.assertRaises(KeyError):
+            self.dataset.get_series("estados", "XX")
+
+    def test_summary_and_regions(self):
+        last_date = self.data.data.max()
+        self.assertEqual(self.dataset.last_date, last_date)
+        regions = self.dataset.get_regions("estados")
+        self.assertEqual(regions.shape[0], 27)
+        self.assertTrue((regions.data == last_date).all())
+
+        summary = self.dataset.summary
+        brasil = self.dataset.get_series("brasil").iloc[-1]
+        self.assertEqual(summary["brasil"]["casosNovos"], brasil.casosNovos)
+        self.assertEqual(summary["estados"]["casosAcumulado"],
+                         regions.casosAcumulado.sum())
+        self.assertEqual(summary["municipios"]["regions"], 30)
+
+
+class TestQueryService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data = _make_test_data()
+        cls.service = QueryService(Dataset.from_data(cls.data))
+
+    def get_json(self, target):
+        response = self.service.handle_request("GET", target)
+        return response.status, json.loads(response.body)
+
+    def test_series(self):
+        status, body = self.get_json("/estados/CE?start=2020-03-01")
+        self.assertEqual(status, 200)
+        expected = self.service.dataset.get_series(
+            "estados", "CE", start=datetime.date(2020, 3, 1))
+        self.assertEqual(body["region"], "CE")
+        self.assertEqual(body["series"]["data"][0], "2020-03-01")
+        self.assertEqual(body["series"]["casosNovos"],
+                         expected.casosNovos.tolist())
+
+        status, body = self.get_json("/estados")
+        self.assertEqual(len(body["regions"]["estado"]), 27)
+        codmun = self.get_json("/municipios")[1]["regions"]["codmun"][0]
+        status, body = self.get_json(f"/municipios/{codmun}")
+        self.assertEqual((status, body["region"]), (200, str(codmun)))
+
+    def test_errors(self):
+        for target, expected_status in (("/estados/XX", 404),
+                                        ("/brasil/CE", 404),
+                                        ("/unknown", 404),
+                                        ("/brasil?start=today", 400),
+                                        ("/brasil?format=xml", 400),
+                                        ("/summary?format=arrow", 406)):
+            status, body = self.get_json(target)
+            self.assertEqual(status, expected_status, target)
+            self.assertIn("error", body)
+        self.assertEqual(
+            self.service.handle_request("POST", "/brasil").status, 405)
+
+    def test_internal_error(self):
+        with mock.patch.object(Dataset, "get_rows",
+                               side_effect=RuntimeError("boom")), \
+                self.assertLogs(level="ERROR") as logs:
+            status, body = self.get_json("/estados/SP?start=2020-02-01")
+        self.assertEqual(status, 500)
+        self.assertEqual(body, {"error": "Internal server error"})
+        self.assertIn("RuntimeError: boom", "\n".join(logs.output))
+
+    def test_response_cache_is_bounded_by_size(self):
+        dataset = Dataset.from_data(self.data)
+        dataset._responses.maxbytes = 3000
+        service = QueryService(dataset)
+        for region in ("CE", "SP", "RJ", "MG"):
+            response = service.handle_request("GET", f"/estados/{region}")
+            self.assertEqual(response.status, 200)
+            self.assertLessEqual(dataset._responses.nbytes, 3000)
+        self.assertGreater(dataset._responses.stats.evictions, 0)
+
+    def test_arrow(self):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        response = self.service.handle_request(
+            "GET", "/brasil",
+            {"accept": "application/vnd.apache.arrow.stream"})
+        self.assertEqual(response.content_type,
+                         "application/vnd.apache.arrow.stream")
+        table = pa.ipc.open_stream(response.body).read_all()
+        self.assertEqual(table.column("casosAcumulado").to_pylist(),
+                         self.service.dataset.get_series(
+                             "brasil").casosAcumulado.tolist())
+
+    def test_http(self):
+        async def requests():
+            await self.service.start(port=0)
+            try:
+                reader, writer = await asyncio.open_connection(
+                    "127.0.0.1", self.service.port)
+                # Both requests use the same connection
+                first = await _get(reader, writer, "/summary")
+                second = await _get(reader, writer, "/brasil",
+                                    "Connection: close\r\n")
+                closed = await reader.read()
+                writer.close()
+                return first, second, closed
+            finally:
+                await self.service.stop()
+
+        first, second, closed = asyncio.run(requests())
+        self.assertEqual(first[0], 200)
+        self.assertEqual(first[1]["Connection"], "keep-alive")
+        self.assertEqual(
+            json.loads(first[2])["brasil"]["last_date"],
+            self.data.data.max().isoformat())
+        self.assertEqual(second[0], 200)
+        self.assertEqual(second[1]["Connection"], "close")
+        self.assertEqual(closed, b"")
+
+
+class TestRefresh(unittest.TestCase):
+    def test_hot_swap(self):
+        new_data = _make_test_data(num_days=45)
+        new_data.attrs["source"] = ("dados.xlsx", 2, 2)
+        old_data = new_data[new_data.data <= new_data.data.min() +
+                            datetime.timedelta(days=39)].copy()
+        old_data.attrs["source"] = ("dados.xlsx", 1, 1)
+        loaded = [old_data, old_data, new_data]
+        service = QueryService(loader=lambda: loaded.pop(0),
+                               refresh_interval=None)
+
+        async def refresh():
+            await service.start(port=0)
+            try:
+                first = service.handle_request("GET", "/brasil")
+                dataset = service.dataset
+                unchanged = await service.refresh()
+                self.assertIs(service.dataset, dataset)
+                changed = await service.refresh()
+                second = service.handle_request("GET", "/brasil")
+                return first, unchanged, changed, second, dataset
+            finally:
+                await service.stop()
+
+        first, unchanged, changed, second, old_dataset = asyncio.run(refresh())
+        self.assertFalse(unchanged)
+        self.assertTrue(changed)
+        self.assertEqual(len(json.loads(first.body)["series"]["data"]), 40)
+        self.assertEqual(len(json.loads(second.body)["series"]["data"]), 45)
+        # The previous dataset is not modified by the refresh
+        self.assertEqual(old_dataset.get_series("brasil").shape[0], 40)
+
+    def test_requires_data(self):
+        with self.assertRaises(ValueError):
+            QueryService()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from covid19.covid import (get_all_municipalities_data, get_all_states_data,
+                           get_brazil_data)
+from covid19.schema import STATES, apply_schema
+from covid19.scrap import _clean_data, read_csv_datafile
+from covid19.synthetic import make_ministry_data, write_ministry_file
+
+
+class TestSynthetic(unittest.TestCase):
+    def test_make_ministry_data(self):
+        data = make_ministry_data(num_municipalities=40,
+                                  num_days=30,
+                                  num_duplicates=5,
+                                  num_empty_rows=3)
+        self.assertEqual(data.shape[0], (1 + len(STATES) + 40) * 30 + 5 + 3)
+        self.assertEqual(data.data.isna().sum(), 3)
+        self.assertEqual(data.dropna(subset=["data"]).duplicated().sum(), 5)
+        self.assertEqual(data.codmun.nunique(), 40)
+        # 25/02/2020 is in the 9th epidemiological week
+        self.assertEqual(data.semanaEpi[0], 9)
+
+        # The same seed gives the same data
+        pd.testing.assert_frame_equal(
+            data,
+            make_ministry_data(num_municipalities=40,
+                               num_days=30,
+                               num_duplicates=5,
+                               num_empty_rows=3))
+
+    def test_levels_are_consistent(self):
+        data = apply_schema(
+            _clean_data(make_ministry_data(num_municipalities=60,
+                                           num_days=40)))
+        data_brasil = get_brazil_data(data)
+        data_estados = get_all_states_data(data)
+        data_municipios = get_all_municipalities_data(data)
+        self.assertEqual(data_brasil.shape[0], 40)
+        self.assertEqual(data_estados.shape[0], len(STATES) * 40)
+        self.assertEqual(data_municipios.shape[0], 60 * 40)
+
+        last_date = data.data.max()
+        total = data_brasil[data_brasil.data == last_date].casosAcumulado
+        self.assertEqual(
+            total.iloc[0], data_estados[data_estados.data ==
+                                        last_date].casosAcumulado.sum())
+        self.assertEqual(
+            total.iloc[0], data_municipios[data_municipios.data ==
+                                           last_date].casosAcumulado.sum())
+
+    def test_write_ministry_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = Path(tmp_dir) / "dados.csv"
+            data = write_ministry_file(filename,
+                                       num_municipalities=30,
+                                       num_days=20)
+            levels = read_csv_datafile(filename)
+            # The duplicated rows are dropped
+            expected = data.dropna(subset=["data"]).drop_duplicates()
+            self.assertEqual(sum(level.shape[0] for level in levels.values()),
+                             expected.shape[0])
+            self.assertEqual(
+                sum(level.attrs["quality_report"].duplicates.shape[0]
+                    for level in levels.values()), 10)
+            with self.assertRaises(ValueError):
+                write_ministry_file(Path(tmp_dir) / "dados.txt")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import pandas as pd
+
+from covid19.covid import (get_all_states_data, get_brazil_data,
+                           get_date_date_cases_greater_than)
+from covid19.schema import apply_schema
+from covid19.scrap import _clean_data
+from covid19.thresholds import ThresholdIndex
+
+
+def _read_test_data():
+    """Data for Brazil and two states (Ceará and a copy of it)"""
+    data_brasil = pd.read_excel("dados_test_Brasil.xlsx")
+    data_ce = pd.read_excel("dados_test_CE.xlsx")
+    data_sp = data_ce.copy()
+    data_sp["estado"] = "SP"
+    data_sp["casosAcumulado"] *= 20
+    data = pd.concat([data_brasil, data_sp, data_ce], ignore_index=True)
+    return apply_schema(_clean_data(data))
+
+
+class TestThresholdIndex(unittest.TestCase):
+    def setUp(self):
+        data = _read_test_data()
+        self.data_brasil = get_brazil_data(data)
+        self.data_estados = get_all_states_data(data)
+        self.thresholds = [0, 10, 100, 1000, 10000]
+
+    def _expected_date(self, df, threshold):
+        try:
+            return get_date_date_cases_greater_than(df, threshold)
+        except AssertionError:
+            return None
+
+    def test_first_date(self):
+        index = ThresholdIndex(self.data_brasil)
+        for threshold in self.thresholds:
+            self.assertEqual(index.first_date(threshold),
+                             self._expected_date(self.data_brasil, threshold))
+        self.assertIsNone(index.first_date(10**9))
+
+    def test_first_dates(self):
+        index = ThresholdIndex(self.data_estados, "estado")
+        first_dates = index.first_dates(self.thresholds)
+        self.assertEqual(first_dates.index.tolist(), ["CE", "SP"])
+        self.assertEqual(first_dates.columns.tolist(), self.thresholds)
+        for estado in ("CE", "SP"):
+            data_estado = self.data_estados[self.data_estados.estado == estado]
+            for threshold in self.thresholds:
+                self.assertEqual(
+                    first_dates.loc[estado, threshold],
+                    self._expected_date(data_estado, threshold))
+                self.assertEqual(index.first_date(threshold, estado),
+                                 first_dates.loc[estado, threshold])
+
+        first_dates = index.first_dates([100], regions=["SP"])
+        self.assertEqual(first_dates.index.tolist(), ["SP"])
+        with self.assertRaises(KeyError):
+            index.first_dates([100], regions=["RJ"])
+        with self.assertRaises(ValueError):
+            index.first_date(100)
+
+    def test_decreasing_values(self):
+        # A correction in the data decreases the cumulative cases
+        data = pd.DataFrame({
+            "data": pd.date_range("2020-03-01", periods=5).date,
+            "casosAcumulado": [0, 150, 90, 120, 200],
+        })
+        index = ThresholdIndex(data)
+        self.assertEqual(index.first_date(100), data.data[1])
+        self.assertEqual(index.first_date(160), data.data[4])
+
+
+if __name__ == '__main__':
+    unittest.main()